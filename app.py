@@ -7,6 +7,7 @@ import frontend.pages.chat_interface  # pylint: disable=unused-import
 
 # isort: on
 
+import frontend.pages.cache_interface  # pylint: disable=unused-import
 import frontend.pages.conv_interface  # pylint: disable=unused-import
 import frontend.pages.login_interface  # pylint: disable=unused-import
 from frontend.components import local_css
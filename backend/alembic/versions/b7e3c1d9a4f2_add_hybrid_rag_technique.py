@@ -0,0 +1,45 @@
+"""add hybrid rag technique
+
+Revision ID: b7e3c1d9a4f2
+Revises: a59f44cacdb5
+Create Date: 2025-05-12 10:41:27.519304
+
+"""
+# pylint: disable=no-member, invalid-name
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "b7e3c1d9a4f2"
+down_revision: Union[str, None] = "a59f44cacdb5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    Migration to add HYBRID to the rag_technique enum
+    """
+    op.alter_column(
+        "chat",
+        "rag_technique",
+        existing_type=sa.Enum("NONE", "VECTOR", "GRAPH", name="ragtechnique"),
+        type_=sa.Enum("NONE", "VECTOR", "GRAPH", "HYBRID", name="ragtechnique"),
+        existing_nullable=False,
+    )
+
+
+def downgrade() -> None:
+    """
+    Migration to remove HYBRID from the rag_technique enum
+    """
+    op.execute("UPDATE chat SET rag_technique = 'VECTOR' WHERE rag_technique = 'HYBRID'")
+    op.alter_column(
+        "chat",
+        "rag_technique",
+        existing_type=sa.Enum("NONE", "VECTOR", "GRAPH", "HYBRID", name="ragtechnique"),
+        type_=sa.Enum("NONE", "VECTOR", "GRAPH", name="ragtechnique"),
+        existing_nullable=False,
+    )
@@ -0,0 +1,40 @@
+"""add query expansion to chat
+
+Revision ID: c4a8e2f1d6b3
+Revises: b7e3c1d9a4f2
+Create Date: 2025-05-19 14:07:52.180263
+
+"""
+# pylint: disable=no-member, invalid-name
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c4a8e2f1d6b3"
+down_revision: Union[str, None] = "b7e3c1d9a4f2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    Migration to add query expansion to chat
+    """
+    op.add_column(
+        "chat",
+        sa.Column(
+            "query_expansion",
+            sa.Enum("NONE", "MULTI_QUERY", "HYDE", name="queryexpansion"),
+            nullable=False,
+            server_default="NONE",
+        ),
+    )
+
+
+def downgrade() -> None:
+    """
+    Migration to remove query expansion from chat
+    """
+    op.drop_column("chat", "query_expansion")
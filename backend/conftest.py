@@ -0,0 +1,18 @@
+import pytest
+@pytest.fixture(scope="session")
+def database_url():
+    return "sqlite+aiosqlite:///:memory:"
+
+
+@pytest.fixture(autouse=True)
+def shared_caches(tmp_path, monkeypatch):
+    """
+    Keep the caches shared by the process in the temporary directory of each test
+    """
+    from backend.src.llm import embedding_cache
+    from backend.src.services import cache
+
+    monkeypatch.setattr(cache, "CACHE_DIR", str(tmp_path / "caches"))
+    monkeypatch.setattr(cache, "_shared_cache", None)
+    monkeypatch.setattr(embedding_cache, "CACHE_DIR", str(tmp_path / "caches"))
+    monkeypatch.setattr(embedding_cache, "_embedding_cache", None)
@@ -1,3 +1,3 @@
-from .llm import LlmModel
+from .llm import EMBEDDING_PROVIDERS, LLM_CONTEXT_BUDGETS, LLM_PRICING, LlmModel
 from .prompt import Technique
-from .rag import RagTechnique
+from .rag import QueryExpansion, RagTechnique
@@ -24,3 +24,38 @@ class LlmModel(Enum):
     Qwen7B = "qwen2.5:7b"
     # MISTRAL_LOCAL = "mistral"
 
+
+
+# Price in USD per million input and output tokens, models missing are free
+LLM_PRICING = {
+    LlmModel.GPT35: (0.5, 1.5),
+    LlmModel.GPT4: (10.0, 30.0),
+    LlmModel.GPT4O_MINI: (0.15, 0.6),
+    LlmModel.GPT4O: (2.5, 10.0),
+    LlmModel.GEMINI15_PRO: (1.25, 5.0),
+    LlmModel.GEMINI15_FLASH: (0.075, 0.3),
+    LlmModel.GEMINI20_FLASH: (0.1, 0.4),
+    LlmModel.GEMINI23_PRO_EXP: (1.25, 10.0),
+}
+
+
+# Tokens of retrieved contexts sent with every prompt, leaving room in the
+# context window for the chat history, the instructions and the response
+LLM_CONTEXT_BUDGETS = {
+    LlmModel.GPT35: 4000,
+    LlmModel.GPT4: 16000,
+    LlmModel.GPT4O_MINI: 16000,
+    LlmModel.GPT4O: 16000,
+    LlmModel.GEMINI15_PRO: 32000,
+    LlmModel.GEMINI15_FLASH: 32000,
+    LlmModel.GEMINI20_FLASH: 32000,
+    LlmModel.LLAMA2_LOCAL: 2000,
+    LlmModel.Qwen7B: 2000,
+}
+
+
+# Provider computing the embeddings of a model, models missing use OpenAI
+EMBEDDING_PROVIDERS = {
+    LlmModel.LLAMA2_LOCAL: "huggingface",
+    LlmModel.Qwen7B: "huggingface",
+}
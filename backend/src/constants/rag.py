@@ -7,3 +7,12 @@ class RagTechnique(Enum):
     NONE = "none"
     VECTOR = "vector"
     GRAPH = "graph"
+    HYBRID = "hybrid"
+
+
+class QueryExpansion(Enum):
+    """Enum for query expansion techniques"""
+
+    NONE = "none"
+    MULTI_QUERY = "multi_query"
+    HYDE = "hyde"
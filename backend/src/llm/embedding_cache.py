@@ -0,0 +1,136 @@
+# pylint: disable=protected-access
+import hashlib
+import os
+import threading
+from typing import List, Optional
+
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from pydantic import PrivateAttr
+
+from backend.src.services.cache import CACHE_DIR, Cache
+
+EMBEDDING_CACHE_ENABLED = (
+    os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+)
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Embedding model wrapper which stores every embedding in a persistent,
+    content-addressed cache keyed by the embedding model and a hash of the
+    text, so identical chunks and queries are only embedded once.
+    """
+
+    _embedding: BaseEmbedding = PrivateAttr()
+    _cache: Cache = PrivateAttr()
+    _namespace: str = PrivateAttr()
+
+    def __init__(self, embedding: BaseEmbedding, cache: Optional[Cache] = None):
+        """
+        :param embedding: The embedding model computing missing embeddings.
+        :type embedding: BaseEmbedding
+        :param cache: The cache storing embeddings, defaults to the shared one.
+        :type cache: Optional[Cache]
+        """
+        super().__init__(
+            model_name=embedding.model_name,
+            embed_batch_size=embedding.embed_batch_size,
+            callback_manager=embedding.callback_manager,
+        )
+        self._embedding = embedding
+        self._cache = cache if cache is not None else get_embedding_cache()
+        self._namespace = f"{embedding.class_name()}:{embedding.model_name}"
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def embedding(self) -> BaseEmbedding:
+        """
+        The wrapped embedding model.
+        """
+        return self._embedding
+
+    def _key(self, kind: str, text: str) -> str:
+        content = f"{self._namespace}\0{kind}\0{text}"
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        key = self._key("query", query)
+        embedding = self._cache.get(key)
+        if embedding is None:
+            embedding = self._embedding._get_query_embedding(query)
+            self._cache.set(key, embedding)
+        return embedding
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        key = self._key("query", query)
+        embedding = self._cache.get(key)
+        if embedding is None:
+            embedding = await self._embedding._aget_query_embedding(query)
+            self._cache.set(key, embedding)
+        return embedding
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _lookup(self, texts: List[str]) -> tuple[List[Optional[Embedding]], List[int]]:
+        """
+        Get the cached embeddings of the texts and the positions of the misses.
+        """
+        embeddings = [self._cache.get(self._key("text", text)) for text in texts]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        return embeddings, missing
+
+    def _store(
+        self,
+        texts: List[str],
+        embeddings: List[Optional[Embedding]],
+        missing: List[int],
+        computed: List[Embedding],
+    ) -> List[Embedding]:
+        """
+        Cache the computed embeddings and fill them in at the missing positions.
+        """
+        for i, embedding in zip(missing, computed):
+            self._cache.set(self._key("text", texts[i]), embedding)
+            embeddings[i] = embedding
+        return embeddings
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        embeddings, missing = self._lookup(texts)
+        computed = (
+            self._embedding._get_text_embeddings([texts[i] for i in missing])
+            if missing
+            else []
+        )
+        return self._store(texts, embeddings, missing, computed)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        embeddings, missing = self._lookup(texts)
+        computed = (
+            await self._embedding._aget_text_embeddings([texts[i] for i in missing])
+            if missing
+            else []
+        )
+        return self._store(texts, embeddings, missing, computed)
+
+
+_embedding_cache: Optional[Cache] = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Cache:
+    """
+    Get the embedding cache shared by the whole process, creating it on first use.
+    """
+    global _embedding_cache  # pylint: disable=global-statement
+    if _embedding_cache is None:
+        with _embedding_cache_lock:
+            if _embedding_cache is None:
+                _embedding_cache = Cache(os.path.join(CACHE_DIR, "embeddings"))
+    return _embedding_cache
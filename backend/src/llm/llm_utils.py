@@ -1,23 +1,126 @@
 import asyncio
-from typing import List
+import functools
+import math
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
 
-from langchain.schema import BaseMessage
+import tiktoken
+from langchain.schema import BaseMessage, LLMResult
 from langchain_core.language_models import BaseChatModel
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_ollama import ChatOllama
 
+from ..constants import LLM_PRICING, LlmModel
+from .memo import create_query_memo_key, get_query_memo
+
+
+@dataclass
+class TokenUsage:
+    """Tokens used by the LLM queries of a run"""
+
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        """Number of input and output tokens"""
+        return self.input_tokens + self.output_tokens
+
+
+_token_usage: ContextVar[Optional[TokenUsage]] = ContextVar(
+    "token_usage", default=None
+)
+
+
+@contextmanager
+def track_token_usage() -> Iterator[TokenUsage]:
+    """
+    Count the tokens used by every query made within the context,
+    including queries made by tasks started within it.
+    """
+    usage = TokenUsage()
+    token = _token_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _token_usage.reset(token)
+
+
+def _record_token_usage(result: LLMResult):
+    """
+    Add the tokens used by a generation call to the tracked usage.
+    """
+    usage = _token_usage.get()
+    if usage is None or not result.generations or not result.generations[0]:
+        return
+    # every generation of a call carries the usage of the whole call
+    message = getattr(result.generations[0][0], "message", None)
+    metadata = getattr(message, "usage_metadata", None)
+    if metadata:
+        usage.input_tokens += metadata.get("input_tokens", 0)
+        usage.output_tokens += metadata.get("output_tokens", 0)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding(encoding_name: str) -> Optional[tiktoken.Encoding]:
+    try:
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        # the encoding is downloaded on first use, which fails when offline
+        print(f"Failed to load the {encoding_name} encoding, estimating tokens: {e}")
+        return None
+
+
+def count_tokens(text: str, encoding_name: str = "cl100k_base") -> int:
+    """
+    Count the tokens of a text, estimated from its length when the
+    tokenizer is unavailable.
+    """
+    encoding = _get_encoding(encoding_name)
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    """
+    Estimate the cost in USD of the tokens used with a model.
+    """
+    try:
+        input_price, output_price = LLM_PRICING.get(LlmModel(model), (0.0, 0.0))
+    except ValueError:
+        return 0.0
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
 
 async def query(llm: BaseChatModel, messages: List[BaseMessage], n=1) -> List[str]:
     """
-    Generate responses for the query via LLM agent
+    Generate responses for the query via LLM agent.
+    When a query memo is set, identical queries reuse the memoized responses.
     """
+    memo = get_query_memo()
+    if memo is not None:
+        key = create_query_memo_key(llm, messages, n)
+        responses = memo.get(key)
+        if responses is not None and len(responses) == n:
+            return list(responses)
+
     if isinstance(llm, (ChatGoogleGenerativeAI, ChatOllama)):
         # Gemini does not support multiple generations
         # Generate n times instead
         tasks = [llm.agenerate([messages]) for _ in range(n)]
-        responses = await asyncio.gather(*tasks)
-        return [response.generations[0][0].text for response in responses]
+        generations = await asyncio.gather(*tasks)
+        for generation in generations:
+            _record_token_usage(generation)
+        responses = [generation.generations[0][0].text for generation in generations]
+    else:
+        # Use the agenerate method to specify `n`
+        response = await llm.agenerate([messages], n=n)
+        _record_token_usage(response)
+        responses = [generation.text for generation in response.generations[0]]
 
-    # Use the agenerate method to specify `n`
-    response = await llm.agenerate([messages], n=n)
-    return [generation.text for generation in response.generations[0]]
+    if memo is not None:
+        memo.set(key, responses)
+    return responses
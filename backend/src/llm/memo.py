@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Optional
+
+from langchain.schema import BaseMessage
+from langchain_core.language_models import BaseChatModel
+
+from backend.src.services.cache import CACHE_DIR, CACHE_MAX_ENTRIES, Cache
+
+LLM_QUERY_MEMO = os.getenv("LLM_QUERY_MEMO", "").lower()
+LLM_QUERY_MEMO_MAX_ENTRIES = int(
+    os.getenv("LLM_QUERY_MEMO_MAX_ENTRIES", str(CACHE_MAX_ENTRIES))
+)
+
+
+class QueryMemo(ABC):
+    """
+    Storage for memoized LLM responses.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[List[str]]:
+        """Get the responses memoized under the key"""
+
+    @abstractmethod
+    def set(self, key: str, responses: List[str]) -> None:
+        """Memoize the responses under the key"""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Remove every memoized response"""
+
+
+class MemoryQueryMemo(QueryMemo):
+    """
+    Memoize LLM responses in the memory of the process, evicting the least
+    recently used responses beyond `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = LLM_QUERY_MEMO_MAX_ENTRIES):
+        self._responses: OrderedDict[str, List[str]] = OrderedDict()
+        self._max_entries = max_entries
+
+    def get(self, key: str) -> Optional[List[str]]:
+        responses = self._responses.get(key)
+        if responses is not None:
+            self._responses.move_to_end(key)
+        return responses
+
+    def set(self, key: str, responses: List[str]) -> None:
+        self._responses[key] = responses
+        self._responses.move_to_end(key)
+        while len(self._responses) > self._max_entries:
+            self._responses.popitem(last=False)
+
+    def clear(self) -> None:
+        self._responses.clear()
+
+
+class DiskQueryMemo(QueryMemo):
+    """
+    Memoize LLM responses on disk, so that they survive restarts and crashes.
+    """
+
+    def __init__(self, memo_dir: str = os.path.join(CACHE_DIR, "queries")):
+        self._cache = Cache(memo_dir)
+
+    def get(self, key: str) -> Optional[List[str]]:
+        return self._cache.get(key)
+
+    def set(self, key: str, responses: List[str]) -> None:
+        self._cache.set(key, responses)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+def create_query_memo_key(
+    llm: BaseChatModel, messages: List[BaseMessage], n: int
+) -> str:
+    """
+    Create the memo key of a query from the model, its temperature, the
+    number of responses and the composed messages.
+    """
+    key = json.dumps(
+        {
+            "model": getattr(llm, "model", None) or getattr(llm, "model_name", None),
+            "temperature": getattr(llm, "temperature", None),
+            "n": n,
+            "messages": [[message.type, message.content] for message in messages],
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _create_default_query_memo() -> Optional[QueryMemo]:
+    match LLM_QUERY_MEMO:
+        case "memory":
+            return MemoryQueryMemo()
+        case "disk":
+            return DiskQueryMemo()
+        case _:
+            return None
+
+
+_query_memo: Optional[QueryMemo] = _create_default_query_memo()
+
+
+def get_query_memo() -> Optional[QueryMemo]:
+    """
+    Get the memo used by `llm_utils.query`, None when memoization is disabled.
+    """
+    return _query_memo
+
+
+def set_query_memo(memo: Optional[QueryMemo]) -> None:
+    """
+    Set the memo used by `llm_utils.query`, None disables memoization.
+    """
+    global _query_memo  # pylint: disable=global-statement
+    _query_memo = memo
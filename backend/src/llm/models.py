@@ -25,6 +25,8 @@ from llama_index.embeddings.langchain import LangchainEmbedding
 
 from backend.src.constants import LlmModel
 
+from .embedding_cache import EMBEDDING_CACHE_ENABLED, CachedEmbedding
+
 dotenv.load_dotenv()
 
 
@@ -146,7 +148,18 @@ class LlmFactory:
     @staticmethod
     def create_embedding_model(model=LlmModel.GPT4O_MINI) -> BaseEmbedding:
         """
-        Creates an embedding model based on the specified LLM
+        Creates an embedding model based on the specified LLM.
+        Embeddings are cached by content unless EMBEDDING_CACHE_ENABLED is false.
+        """
+        embedding_model = LlmFactory._create_embedding_model(model)
+        if EMBEDDING_CACHE_ENABLED:
+            return CachedEmbedding(embedding_model)
+        return embedding_model
+
+    @staticmethod
+    def _create_embedding_model(model=LlmModel.GPT4O_MINI) -> BaseEmbedding:
+        """
+        Creates the uncached embedding model of the specified LLM
         """
         match model:
             case (
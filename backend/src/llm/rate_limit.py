@@ -0,0 +1,129 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+from backend.src.constants import EMBEDDING_PROVIDERS, LlmModel
+
+# Tokens per minute each embedding provider accepts, providers missing are unlimited
+EMBEDDING_TPM_LIMITS = {
+    "openai": int(os.getenv("OPENAI_EMBEDDING_TPM", "1000000")),
+}
+# First and longest pause of a provider after it answers 429, in seconds
+RATE_LIMIT_BACKOFF = float(os.getenv("RATE_LIMIT_BACKOFF", "1"))
+RATE_LIMIT_MAX_BACKOFF = float(os.getenv("RATE_LIMIT_MAX_BACKOFF", "60"))
+
+WINDOW_SECONDS = 60.0
+
+
+def get_embedding_provider(model: LlmModel) -> str:
+    """
+    Get the provider computing the embeddings of a model
+    """
+    return EMBEDDING_PROVIDERS.get(model, "openai")
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    Check whether a provider rejected a request for exceeding its rate limit
+    """
+    status_code = getattr(error, "status_code", None) or getattr(
+        getattr(error, "response", None), "status_code", None
+    )
+    return status_code == 429 or "rate limit" in str(error).lower()
+
+
+class TokenRateLimiter:
+    """
+    Tokens per minute budget of a provider, shared by every thread and event
+    loop sending it requests. After a 429 response, every request to the
+    provider pauses for a backoff which doubles until a request succeeds.
+    """
+
+    def __init__(self, tokens_per_minute: int = 0):
+        """
+        :param tokens_per_minute: The tokens accepted per minute, 0 for no limit.
+        :type tokens_per_minute: int
+        """
+        self.tokens_per_minute = tokens_per_minute
+        self._usage: deque[tuple[float, int]] = deque()
+        self._backoff = 0.0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        while self._usage and self._usage[0][0] <= now - WINDOW_SECONDS:
+            self._usage.popleft()
+
+    @property
+    def tokens_last_minute(self) -> int:
+        """
+        The tokens sent to the provider within the last minute.
+        """
+        with self._lock:
+            self._expire(time.monotonic())
+            return sum(tokens for _, tokens in self._usage)
+
+    def _reserve(self, tokens: int) -> float:
+        """
+        Record the tokens of a request about to be sent, or get how long
+        to wait before trying again.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._expire(now)
+            used = sum(used_tokens for _, used_tokens in self._usage)
+            # a request larger than the whole budget is sent alone
+            if self.tokens_per_minute and self._usage:
+                if used + tokens > self.tokens_per_minute:
+                    return self._usage[0][0] + WINDOW_SECONDS - now
+            self._usage.append((now, tokens))
+            return 0.0
+
+    async def acquire(self, tokens: int):
+        """
+        Wait until a request of the given tokens fits the budget.
+        """
+        while (wait := self._reserve(tokens)) > 0:
+            await asyncio.sleep(wait)
+
+    def throttle(self) -> float:
+        """
+        Pause every request after a 429 response, doubling the backoff.
+        """
+        with self._lock:
+            self._backoff = min(
+                max(self._backoff * 2, RATE_LIMIT_BACKOFF), RATE_LIMIT_MAX_BACKOFF
+            )
+            self._paused_until = max(
+                self._paused_until, time.monotonic() + self._backoff
+            )
+            return self._backoff
+
+    def recover(self):
+        """
+        Shorten the backoff after a request succeeds.
+        """
+        with self._lock:
+            self._backoff /= 2
+
+
+_rate_limiters: Dict[str, TokenRateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_embedding_rate_limiter(model: LlmModel) -> TokenRateLimiter:
+    """
+    Get the rate limiter shared by the models embedding with the same provider
+    """
+    provider = get_embedding_provider(model)
+    with _rate_limiters_lock:
+        if provider not in _rate_limiters:
+            _rate_limiters[provider] = TokenRateLimiter(
+                EMBEDDING_TPM_LIMITS.get(provider, 0)
+            )
+        return _rate_limiters[provider]
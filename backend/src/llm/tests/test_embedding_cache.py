@@ -0,0 +1,89 @@
+# pylint: disable=redefined-outer-name
+from typing import List
+
+import pytest
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+from backend.src.llm.embedding_cache import CachedEmbedding
+from backend.src.services.cache import Cache
+
+
+class CountingEmbedding(BaseEmbedding):
+    """Embedding model recording the texts it embeds"""
+
+    calls: List[str] = []
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        self.calls.append(query)
+        return [float(len(query)), 1.0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        self.calls.append(text)
+        return [float(len(text)), 0.0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return [self._get_text_embedding(text) for text in texts]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    """
+    Embedding cache stored in a temporary directory
+    """
+    cache = Cache(str(tmp_path))
+    yield cache
+    cache.close()
+
+
+def test_text_embeddings_are_cached(cache):
+    """Test identical chunks are only embedded once"""
+    inner = CountingEmbedding(model_name="counting", calls=[])
+    embedding = CachedEmbedding(inner, cache)
+
+    first = embedding.get_text_embedding_batch(["a", "bb", "a"])
+    assert first == [[1.0, 0.0], [2.0, 0.0], [1.0, 0.0]]
+    assert inner.calls == ["a", "bb", "a"]
+
+    second = embedding.get_text_embedding_batch(["bb", "ccc", "a"])
+    assert second == [[2.0, 0.0], [3.0, 0.0], [1.0, 0.0]]
+    assert inner.calls == ["a", "bb", "a", "ccc"]
+
+    # another wrapper of the same model shares the cache
+    other = CachedEmbedding(CountingEmbedding(model_name="counting", calls=[]), cache)
+    assert other.get_text_embedding("ccc") == [3.0, 0.0]
+    assert other.embedding.calls == []
+
+
+@pytest.mark.asyncio
+async def test_query_embeddings_are_cached(cache):
+    """Test identical queries are only embedded once"""
+    inner = CountingEmbedding(model_name="counting", calls=[])
+    embedding = CachedEmbedding(inner, cache)
+
+    assert await embedding.aget_query_embedding("what") == [4.0, 1.0]
+    assert await embedding.aget_query_embedding("what") == [4.0, 1.0]
+    assert embedding.get_query_embedding("what") == [4.0, 1.0]
+    assert inner.calls == ["what"]
+
+    # texts and queries are cached separately
+    assert await embedding.aget_text_embedding("what") == [4.0, 0.0]
+
+
+def test_models_do_not_share_embeddings(cache):
+    """Test embeddings of different models are cached separately"""
+    CachedEmbedding(CountingEmbedding(model_name="a", calls=[]), cache).get_text_embedding(
+        "text"
+    )
+    inner = CountingEmbedding(model_name="b", calls=[])
+    CachedEmbedding(inner, cache).get_text_embedding("text")
+    assert inner.calls == ["text"]
+
+
+def test_empty_cache_is_used(cache):
+    """Test an injected cache is used even while it is empty"""
+    embedding = CachedEmbedding(CountingEmbedding(model_name="a", calls=[]), cache)
+    embedding.get_text_embedding("text")
+    assert len(cache) == 1
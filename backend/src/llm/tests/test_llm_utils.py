@@ -1,10 +1,17 @@
-from unittest.mock import AsyncMock
+from unittest.mock import AsyncMock, patch
 
 import pytest
-from langchain.schema import Generation, HumanMessage, LLMResult
+from langchain.schema import AIMessage, Generation, HumanMessage, LLMResult
+from langchain_core.outputs import ChatGeneration
 from langchain_google_genai import ChatGoogleGenerativeAI
 
-from backend.src.llm.llm_utils import query
+from backend.src.llm.llm_utils import (
+    count_tokens,
+    estimate_cost,
+    query,
+    track_token_usage,
+)
+from backend.src.llm.memo import DiskQueryMemo, MemoryQueryMemo, set_query_memo
 
 
 @pytest.mark.asyncio
@@ -36,3 +43,84 @@ async def test_query_with_google_genai():
     result = await query(mock_llm, messages, 2)
 
     assert result == ["Response 1", "Response 2"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "memo_factory", [lambda _: MemoryQueryMemo(), DiskQueryMemo], ids=["memory", "disk"]
+)
+async def test_query_with_memo(memo_factory, tmp_path):
+    """Test identical queries reuse the memoized responses"""
+    set_query_memo(memo_factory(str(tmp_path)))
+    try:
+        mock_llm = AsyncMock()
+        mock_llm.model_name = "gpt-4o-mini"
+        mock_llm.temperature = 0.6
+        mock_llm.agenerate.return_value = LLMResult(
+            generations=[[Generation(text="Response 1"), Generation(text="Response 2")]]
+        )
+
+        messages = [HumanMessage(content="Input")]
+        assert await query(mock_llm, messages, 2) == ["Response 1", "Response 2"]
+        assert await query(mock_llm, messages, 2) == ["Response 1", "Response 2"]
+        mock_llm.agenerate.assert_awaited_once()
+
+        # a different message, n or temperature is a different query
+        await query(mock_llm, [HumanMessage(content="Other input")], 2)
+        await query(mock_llm, messages, 1)
+        mock_llm.temperature = 0.0
+        await query(mock_llm, messages, 2)
+        assert mock_llm.agenerate.await_count == 4
+    finally:
+        set_query_memo(None)
+
+
+def test_memory_query_memo_bounded():
+    """Test the memory memo evicts the least recently used responses"""
+    memo = MemoryQueryMemo(max_entries=2)
+    memo.set("a", ["A"])
+    memo.set("b", ["B"])
+    assert memo.get("a") == ["A"]
+    memo.set("c", ["C"])
+
+    assert memo.get("b") is None
+    assert memo.get("a") == ["A"]
+    assert memo.get("c") == ["C"]
+
+
+@pytest.mark.asyncio
+async def test_track_token_usage():
+    """Test tokens used by queries are counted within the context"""
+    mock_llm = AsyncMock()
+    message = AIMessage(
+        content="Response",
+        usage_metadata={"input_tokens": 10, "output_tokens": 5, "total_tokens": 15},
+    )
+    mock_llm.agenerate.return_value = LLMResult(
+        generations=[[ChatGeneration(message=message)] * 2]
+    )
+    messages = [HumanMessage(content="Input")]
+
+    with track_token_usage() as usage:
+        await query(mock_llm, messages, 2)
+        await query(mock_llm, messages)
+    await query(mock_llm, messages)
+
+    assert usage.input_tokens == 20
+    assert usage.output_tokens == 10
+    assert usage.total_tokens == 30
+
+
+def test_estimate_cost():
+    """Test the cost of tokens is estimated from the pricing table"""
+    assert estimate_cost("gpt-4o", 1_000_000, 1_000_000) == 12.5
+    assert estimate_cost("llama3.2:latest", 1000, 1000) == 0.0
+    assert estimate_cost("unknown", 1000, 1000) == 0.0
+
+
+def test_count_tokens():
+    """Test tokens are counted, or estimated without the tokenizer"""
+    assert count_tokens("") == 0
+    assert 0 < count_tokens("hello world, this is a test") < 10
+    with patch("backend.src.llm.llm_utils._get_encoding", return_value=None):
+        assert count_tokens("12345678") == 2
@@ -6,6 +6,7 @@ from llama_index.embeddings.openai import OpenAIEmbedding
 
 from backend.src.constants import LlmModel
 from backend.src.llm import LlmFactory
+from backend.src.llm.embedding_cache import CachedEmbedding
 
 
 def test_create_llm():
@@ -21,7 +22,8 @@ def test_create_llm():
 def test_create_embedding_model():
     """Test create embedding model"""
     embedding = LlmFactory.create_embedding_model(LlmModel.GPT35)
-    assert isinstance(embedding, OpenAIEmbedding)
+    assert isinstance(embedding, CachedEmbedding)
+    assert isinstance(embedding.embedding, OpenAIEmbedding)
     embedding = LlmFactory.create_embedding_model(LlmModel.GEMINI15_FLASH)
     assert isinstance(embedding, GeminiEmbedding)
     with pytest.raises(ValueError, match="Invalid model"):
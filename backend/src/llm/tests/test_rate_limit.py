@@ -0,0 +1,66 @@
+# pylint: disable=protected-access
+from unittest.mock import patch
+
+from backend.src.constants import LlmModel
+from backend.src.llm.rate_limit import (
+    TokenRateLimiter,
+    get_embedding_rate_limiter,
+    is_rate_limit_error,
+)
+
+
+@patch("backend.src.llm.rate_limit.time.monotonic")
+def test_token_rate_limiter_budget(mock_monotonic):
+    """Test requests wait for the tokens of the last minute to fit the budget"""
+    mock_monotonic.return_value = 100.0
+    rate_limiter = TokenRateLimiter(tokens_per_minute=100)
+
+    # a request larger than the budget is still sent alone
+    assert rate_limiter._reserve(150) == 0.0
+    assert rate_limiter._reserve(10) == 60.0
+
+    mock_monotonic.return_value = 130.0
+    assert rate_limiter._reserve(10) == 30.0
+    assert rate_limiter.tokens_last_minute == 150
+
+    mock_monotonic.return_value = 160.0
+    assert rate_limiter._reserve(60) == 0.0
+    assert rate_limiter._reserve(40) == 0.0
+    assert rate_limiter._reserve(1) > 0
+    assert rate_limiter.tokens_last_minute == 100
+
+
+@patch("backend.src.llm.rate_limit.RATE_LIMIT_MAX_BACKOFF", 4.0)
+@patch("backend.src.llm.rate_limit.RATE_LIMIT_BACKOFF", 1.0)
+@patch("backend.src.llm.rate_limit.time.monotonic")
+def test_token_rate_limiter_throttle(mock_monotonic):
+    """Test every request pauses after a 429, for a backoff adapting to the responses"""
+    mock_monotonic.return_value = 100.0
+    rate_limiter = TokenRateLimiter()
+
+    assert [rate_limiter.throttle() for _ in range(4)] == [1.0, 2.0, 4.0, 4.0]
+    assert rate_limiter._reserve(1) == 4.0
+
+    rate_limiter.recover()
+    mock_monotonic.return_value = 105.0
+    assert rate_limiter._reserve(1) == 0.0
+    assert rate_limiter.throttle() == 4.0
+
+
+def test_is_rate_limit_error():
+    """Test rate limit errors are told apart from other errors"""
+    error = Exception("Too many requests")
+    error.status_code = 429
+    assert is_rate_limit_error(error)
+    assert is_rate_limit_error(Exception("Rate limit reached for requests"))
+    assert not is_rate_limit_error(ValueError("invalid input"))
+
+
+def test_get_embedding_rate_limiter():
+    """Test models embedding with the same provider share a rate limiter"""
+    assert get_embedding_rate_limiter(LlmModel.GPT4O) is get_embedding_rate_limiter(
+        LlmModel.GEMINI15_PRO
+    )
+    assert get_embedding_rate_limiter(
+        LlmModel.LLAMA2_LOCAL
+    ) is not get_embedding_rate_limiter(LlmModel.GPT4O)
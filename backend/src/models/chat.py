@@ -4,7 +4,7 @@ from typing import TYPE_CHECKING, List
 from sqlalchemy import Enum, ForeignKey, ForeignKeyConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from backend.src.constants import RagTechnique
+from backend.src.constants import QueryExpansion, RagTechnique
 from common import File
 
 from .base import Base
@@ -32,6 +32,9 @@ class Chat(Base):
         Enum(RagTechnique), default=RagTechnique.VECTOR
     )
     vector_top_k: Mapped[int] = mapped_column(default=3)
+    query_expansion: Mapped[str] = mapped_column(
+        Enum(QueryExpansion), default=QueryExpansion.NONE
+    )
     messages: Mapped[List["Message"]] = relationship(
         cascade="all, delete-orphan",
         back_populates="chat",
@@ -4,18 +4,32 @@
 # pylint: disable=too-many-locals
 
 import os
+import time
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Optional, Tuple
 
 from langchain_core.language_models import BaseChatModel
 
-from backend.src.constants import LlmModel, RagTechnique
+from backend.src.constants import LlmModel, QueryExpansion, RagTechnique
 from backend.src.models import Message, MessageRole
 from backend.src.services.chat import add_message_to_chat
-from backend.src.services.rag import query_knowledge
-from backend.src.services.cache import Cache
+from backend.src.services.etl import get_vector_collection_name
+from backend.src.services.rag import get_embedding_model, query_knowledge
+from backend.src.services.cache import get_cache
+from backend.src.services.context_packing import (
+    get_context_token_budget,
+    pack_contexts,
+)
+from backend.src.services.retrieval_cache import retrieval_cache
+from backend.src.services.singleflight import SingleFlight
+from backend.src.services.semantic_cache import (
+    SEMANTIC_CACHE_ENABLED,
+    create_semantic_scope,
+    semantic_cache,
+)
 
 from ...llm import LlmFactory
+from ...llm.llm_utils import count_tokens, estimate_cost, track_token_usage
 from ..controller import Controller
 from ..operations import GraphOfOperations
 from ..parser import MedicalParser
@@ -23,6 +37,9 @@ from ..prompter import MedicalPrompter
 
 EVAL_MODE = os.getenv("APP_ENV") == "evaluation"
 
+# Identical questions asked concurrently share a single run of the graph
+_run_flights = SingleFlight()
+
 
 class BaseTechnique(ABC):
     """
@@ -39,11 +56,15 @@ class BaseTechnique(ABC):
         chat_id: int,
         vector_top_k: int = 3,
         documents: List[str] = None,
+        store_response: bool = True,
+        query_expansion: QueryExpansion = QueryExpansion.NONE,
     ) -> Message:
         """Apply prompting technique & RAG to generate a response based on
-        user's input and the specified model."""
-        llm = LlmFactory.create_llm(model)
-
+        user's input and the specified model. Without `store_response` the
+        response is only cached and returned, not added to the chat.
+        With `query_expansion` the retrieval query is expanded with the chat
+        histories. Questions without any relevant context are answered
+        without running the LLM."""
         contexts = documents or []
         if len(contexts) == 0:
             contexts = await query_knowledge(
@@ -52,14 +73,51 @@ class BaseTechnique(ABC):
                 rag_technique,
                 model,
                 vector_top_k=vector_top_k,
+                query_expansion=query_expansion,
+                chat_histories=chat_histories,
             )
         if len(contexts) == 0 and not EVAL_MODE:
+            if not store_response:
+                return None
             return await add_message_to_chat(
                 chat_id=chat_id,
                 content="Sorry I don't know.",
                 role=MessageRole.ASSISTANT,
             )
-        return await self.run(user_input, chat_histories, llm, contexts, chat_id)
+
+        llm = LlmFactory.create_llm(model)
+        if not SEMANTIC_CACHE_ENABLED:
+            return await self.run(
+                user_input,
+                chat_histories,
+                llm,
+                contexts,
+                chat_id,
+                store_response=store_response,
+            )
+
+        embedding_model = get_embedding_model(model)
+        return await self.run(
+            user_input,
+            chat_histories,
+            llm,
+            contexts,
+            chat_id,
+            query_embedding=await embedding_model.aget_query_embedding(user_input),
+            semantic_scope=create_semantic_scope(
+                chat_id,
+                model.value,
+                self.method_name,
+                contexts,
+                retrieval_cache.version(get_vector_collection_name(chat_id)),
+                history=[
+                    f"{message.role.name}:{message.content}"
+                    for message in chat_histories
+                    if message.role != MessageRole.SYSTEM
+                ],
+            ),
+            store_response=store_response,
+        )
 
     @property
     @abstractmethod
@@ -79,6 +137,9 @@ class BaseTechnique(ABC):
         llm: BaseChatModel,
         contexts: List[str],
         chat_id: int,
+        query_embedding: Optional[List[float]] = None,
+        semantic_scope: Optional[str] = None,
+        store_response: bool = True,
     ) -> Message:
         """
         Controller function that executes the GoO.
@@ -93,10 +154,20 @@ class BaseTechnique(ABC):
         :type contexts: List[str]
         :param chat_id: Chat ID
         :type chat_id: str
+        :param query_embedding: Embedding of the user input for the semantic cache
+        :type query_embedding: Optional[List[float]]
+        :param semantic_scope: Scope of the user input in the semantic cache
+        :type semantic_scope: Optional[str]
+        :param store_response: Whether to add the response to the chat
+        :type store_response: bool
         :return: Final output after the execution of GoO.
         :rtype: Message
         """        
 
+        model_name = llm.model if hasattr(llm, 'model') else llm.model_name
+        # every operation sends the contexts, so pack them into the model's budget
+        contexts = pack_contexts(contexts, get_context_token_budget(model_name))
+
         operations_graph = self.create_operation_graph()
         executor = Controller(
             llm,
@@ -112,22 +183,61 @@ class BaseTechnique(ABC):
             },
         )
 
-        cache = Cache("caches")
-        # cache_key = cache.create_cache_key(
-        #     model=llm.model_name,
-        #     prompt=user_input)
-        
+        cache = get_cache()
         cache_key = cache.create_cache_key(
-            model=llm.model if hasattr(llm, 'model') else llm.model_name,
-            prompt=user_input)
-        
-        if cache.get(cache_key):
-            result = cache.get(cache_key)
-        else:
-            result = await executor.run(chat_histories)
-            cache.set(cache_key, result)
+            model=model_name,
+            prompt=user_input,
+            technique=self.method_name,
+            contexts=contexts,
+            system_prompt="\n".join(
+                message.content
+                for message in chat_histories
+                if message.role == MessageRole.SYSTEM
+            ),
+            history=[
+                f"{message.role.name}:{message.content}"
+                for message in chat_histories
+                if message.role != MessageRole.SYSTEM
+            ],
+            temperature=getattr(llm, "temperature", None),
+        )
+
+        use_semantic_cache = query_embedding is not None and semantic_scope is not None
+        result = cache.get(cache_key)
+        if not result and use_semantic_cache:
+            result = semantic_cache.get(semantic_scope, query_embedding)
+        if not result:
+
+            async def execute() -> Tuple[str, Controller]:
+                started = time.perf_counter()
+                with track_token_usage() as usage:
+                    answer = await executor.run(chat_histories)
+                cache.set(
+                    cache_key,
+                    answer,
+                    metadata={
+                        "model": model_name,
+                        "technique": self.method_name,
+                        "chat_id": chat_id,
+                        "latency": time.perf_counter() - started,
+                        "tokens": usage.total_tokens,
+                        "cost": estimate_cost(
+                            model_name, usage.input_tokens, usage.output_tokens
+                        ),
+                        "context_tokens": sum(
+                            count_tokens(context) for context in contexts
+                        ),
+                    },
+                )
+                if use_semantic_cache:
+                    semantic_cache.set(semantic_scope, query_embedding, answer)
+                return answer, executor
+
+            # concurrent identical questions share the answer and the
+            # reasonings of the controller that ran
+            result, executor = await _run_flights.do(cache_key, execute)
             
-        if not EVAL_MODE:
+        if not EVAL_MODE and store_response:
             message = await add_message_to_chat(
                 chat_id=chat_id, content=result, role=MessageRole.ASSISTANT
             )
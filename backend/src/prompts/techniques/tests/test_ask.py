@@ -1,3 +1,4 @@
+import asyncio
 from unittest.mock import AsyncMock, patch
 
 import pytest
@@ -8,12 +9,16 @@ from backend.src.prompts.techniques.base_technique import (
     LlmModel,
     Message,
     MessageRole,
+    QueryExpansion,
     RagTechnique,
 )
 from backend.src.prompts.techniques.technique import (
     Technique,
     TechniqueFactory,
 )
+from backend.src.services.cache import Cache
+from backend.src.services.retrieval_cache import retrieval_cache
+from backend.src.services.semantic_cache import create_semantic_scope, semantic_cache
 
 
 @pytest.mark.asyncio
@@ -48,11 +53,106 @@ async def test_ask_with_contexts(mock_run, mock_query_knowledge):
     )
 
     mock_query_knowledge.assert_awaited_with(
-        chat_id, user_input, rag_technique, model, vector_top_k=vector_top_k
+        chat_id,
+        user_input,
+        rag_technique,
+        model,
+        vector_top_k=vector_top_k,
+        query_expansion=QueryExpansion.NONE,
+        chat_histories=chat_histories,
     )
     assert result.content == "Glaucoma is an eye disease."
 
 
+@pytest.mark.asyncio
+@patch("backend.src.prompts.techniques.base_technique.SEMANTIC_CACHE_ENABLED", True)
+@patch("backend.src.prompts.techniques.base_technique.get_embedding_model")
+@patch(
+    "backend.src.prompts.techniques.base_technique.query_knowledge",
+    new_callable=AsyncMock,
+)
+@patch.object(BaseTechnique, "run", new_callable=AsyncMock)
+async def test_ask_semantic_scope(
+    mock_run, mock_query_knowledge, mock_get_embedding_model
+):
+    """Test the semantic scope depends on the contexts and the knowledge version"""
+    mock_query_knowledge.return_value = ["Here is the known context."]
+    mock_get_embedding_model.return_value.aget_query_embedding = AsyncMock(
+        return_value=[0.6, 0.8]
+    )
+    technique = TechniqueFactory.create_technique(Technique.COT)
+
+    async def ask():
+        await technique.ask(
+            user_input="What is glaucoma?",
+            chat_histories=[],
+            model=LlmModel.GPT4O_MINI,
+            rag_technique=RagTechnique.VECTOR,
+            chat_id=123,
+        )
+        return mock_run.call_args.kwargs["semantic_scope"]
+
+    version = retrieval_cache.version("chat-123")
+    assert await ask() == create_semantic_scope(
+        123,
+        LlmModel.GPT4O_MINI.value,
+        technique.method_name,
+        ["Here is the known context."],
+        version,
+    )
+
+    retrieval_cache.invalidate("chat-123")
+    assert await ask() != create_semantic_scope(
+        123,
+        LlmModel.GPT4O_MINI.value,
+        technique.method_name,
+        ["Here is the known context."],
+        version,
+    )
+
+
+@pytest.mark.asyncio
+@patch("backend.src.prompts.techniques.base_technique.SEMANTIC_CACHE_ENABLED", True)
+@patch("backend.src.prompts.techniques.base_technique.get_embedding_model")
+@patch(
+    "backend.src.prompts.techniques.base_technique.query_knowledge",
+    new_callable=AsyncMock,
+)
+@patch(
+    "backend.src.prompts.techniques.base_technique.Controller.run",
+    new_callable=AsyncMock,
+)
+async def test_ask_semantic_cache_history(
+    mock_controller_run, mock_query_knowledge, mock_get_embedding_model
+):
+    """Test a follow-up question is not answered from another conversation"""
+    mock_query_knowledge.return_value = ["Manual of the plant."]
+    mock_get_embedding_model.return_value.aget_query_embedding = AsyncMock(
+        return_value=[0.6, 0.8]
+    )
+    mock_controller_run.side_effect = ["About pump X.", "About valve Y."]
+    technique = TechniqueFactory.create_technique(Technique.COT)
+
+    async def ask(topic: str):
+        return await technique.ask(
+            user_input="What about the second step?",
+            chat_histories=[
+                Message(content=f"How do I service {topic}?", role=MessageRole.USER)
+            ],
+            model=LlmModel.GPT4O_MINI,
+            rag_technique=RagTechnique.VECTOR,
+            chat_id=124,
+            store_response=False,
+        )
+
+    try:
+        assert await ask("pump X") == "About pump X."
+        assert await ask("valve Y") == "About valve Y."
+        assert mock_controller_run.await_count == 2
+    finally:
+        semantic_cache.clear_chats([124])
+
+
 @pytest.mark.asyncio
 @patch(
     "backend.src.prompts.techniques.base_technique.add_message_to_chat",
@@ -76,17 +176,20 @@ async def test_ask_without_contexts(mock_query_knowledge, mock_add_message):
     )
     technique = TechniqueFactory.create_technique(Technique.GOT)
 
-    result = await technique.ask(
-        user_input=user_input,
-        chat_histories=chat_histories,
-        model=model,
-        rag_technique=rag_technique,
-        chat_id=chat_id,
-    )
+    with patch.object(LlmFactory, "create_llm") as mock_create_llm:
+        result = await technique.ask(
+            user_input=user_input,
+            chat_histories=chat_histories,
+            model=model,
+            rag_technique=rag_technique,
+            chat_id=chat_id,
+        )
     mock_add_message.assert_awaited_once_with(
         chat_id=chat_id, content="Sorry I don't know.", role=MessageRole.ASSISTANT
     )
     assert result.content == "Sorry I don't know"
+    # the LLM is not needed without contexts
+    mock_create_llm.assert_not_called()
 
 
 @pytest.mark.asyncio
@@ -144,3 +247,110 @@ async def test_run(
     assert result.content == "Glaucoma is an eye disease."
     assert result.role == MessageRole.ASSISTANT
     assert result.id == 1234
+
+
+@pytest.mark.asyncio
+@patch(
+    "backend.src.prompts.techniques.base_technique.add_message_to_chat",
+    new_callable=AsyncMock,
+)
+@patch(
+    "backend.src.prompts.techniques.base_technique.Controller.run",
+    new_callable=AsyncMock,
+)
+@patch(
+    "backend.src.prompts.techniques.base_technique.Controller.store_reasonings",
+    new_callable=AsyncMock,
+)
+async def test_run_semantic_cache_hit(
+    mock_store_reasonings, mock_controller_run, mock_add_message_to_chat, tmp_path
+):
+    """Test run reuses the answer of a similar question without running the graph"""
+    llm = LlmFactory.create_llm()
+    technique = TechniqueFactory.create_technique(Technique.COT)
+    scope = create_semantic_scope(321, "gpt-4o-mini", technique.method_name)
+    semantic_cache.set(scope, [0.6, 0.8], "Undock the AIV from the Robot menu.")
+
+    mock_add_message_to_chat.return_value = Message(
+        content="Undock the AIV from the Robot menu.",
+        role=MessageRole.ASSISTANT,
+        id=4321,
+    )
+
+    with patch(
+        "backend.src.prompts.techniques.base_technique.get_cache",
+        return_value=Cache(str(tmp_path)),
+    ):
+        result = await technique.run(
+            user_input="Undocking steps for AIV",
+            chat_histories=[],
+            llm=llm,
+            contexts=["Context for AIV"],
+            chat_id=321,
+            query_embedding=[0.61, 0.79],
+            semantic_scope=scope,
+        )
+
+    mock_controller_run.assert_not_awaited()
+    mock_store_reasonings.assert_awaited()
+    mock_add_message_to_chat.assert_awaited_once_with(
+        chat_id=321,
+        content="Undock the AIV from the Robot menu.",
+        role=MessageRole.ASSISTANT,
+    )
+    assert result.id == 4321
+    semantic_cache.clear(scope)
+
+
+@pytest.mark.asyncio
+@patch(
+    "backend.src.prompts.techniques.base_technique.add_message_to_chat",
+    new_callable=AsyncMock,
+)
+@patch(
+    "backend.src.prompts.techniques.base_technique.Controller.run",
+    new_callable=AsyncMock,
+)
+@patch(
+    "backend.src.prompts.techniques.base_technique.Controller.store_reasonings",
+    autospec=True,
+)
+async def test_run_coalesces_identical_questions(
+    mock_store_reasonings, mock_controller_run, mock_add_message_to_chat, tmp_path
+):
+    """Test identical questions asked concurrently share one run of the graph"""
+    llm = LlmFactory.create_llm()
+    technique = TechniqueFactory.create_technique(Technique.NONE)
+
+    async def slow_run(_):
+        await asyncio.sleep(0.01)
+        return "Glaucoma is an eye disease."
+
+    mock_controller_run.side_effect = slow_run
+    mock_add_message_to_chat.return_value = Message(
+        content="Glaucoma is an eye disease.", role=MessageRole.ASSISTANT, id=1
+    )
+
+    with patch(
+        "backend.src.prompts.techniques.base_technique.get_cache",
+        return_value=Cache(str(tmp_path)),
+    ):
+        await asyncio.gather(
+            *[
+                technique.run(
+                    user_input="What is glaucoma?",
+                    chat_histories=[],
+                    llm=llm,
+                    contexts=["Context for glaucoma"],
+                    chat_id=chat_id,
+                )
+                for chat_id in (1, 2, 3)
+            ]
+        )
+
+    mock_controller_run.assert_awaited_once()
+    assert mock_add_message_to_chat.await_count == 3
+    assert mock_store_reasonings.await_count == 3
+    # every message stores the reasonings of the controller that ran
+    controllers = {call.args[0] for call in mock_store_reasonings.await_args_list}
+    assert len(controllers) == 1
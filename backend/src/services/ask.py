@@ -1,7 +1,7 @@
 from typing import List
 
 from backend.src.constants import LlmModel, Technique
-from backend.src.services.rag import RagTechnique
+from backend.src.services.rag import QueryExpansion, RagTechnique
 
 from ..models import Message
 from ..prompts.techniques import TechniqueFactory
@@ -20,10 +20,17 @@ class ChatService:
         model: LlmModel = LlmModel.GPT4O_MINI,
         rag_technique: RagTechnique = RagTechnique.VECTOR,
         vector_top_k: int = 3,
+        query_expansion: QueryExpansion = QueryExpansion.NONE,
     ) -> Message:
         """Get a response based on the user's input, technique, and model."""
         prompt_technique = TechniqueFactory.create_technique(technique)
 
         return await prompt_technique.ask(
-            user_input, chat_histories, model, rag_technique, chat_id, vector_top_k
+            user_input,
+            chat_histories,
+            model,
+            rag_technique,
+            chat_id,
+            vector_top_k,
+            query_expansion=query_expansion,
         )
@@ -1,56 +1,198 @@
-import os
-import json
 import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional
 
-# Cache With Json File System
+CACHE_DIR = os.getenv("CACHE_DIR", "caches")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_TTL = float(os.getenv("CACHE_TTL")) if os.getenv("CACHE_TTL") else None
+
+
+# Cache With SQLite (WAL) File System
 class Cache:
     """
     Cache class to manage the cache for the application.
+
+    Entries are stored one row per key in a SQLite database running in WAL mode,
+    so writing an entry only touches that entry instead of rewriting the whole
+    cache, and opening the cache does not read any values. Recently used
+    entries are kept in a bounded in-memory LRU in front of the database.
+
+    Entries can carry metadata describing what producing them cost (model,
+    technique, chat, latency, tokens and cost), which is used to account
+    the latency, tokens and cost saved by every hit.
     """
 
-    def __init__(self, cache_dir: str):
+    db_file_name = "cache.sqlite3"
+    legacy_file_name = "cache.json"
+    metadata_columns = {
+        "model": "TEXT",
+        "technique": "TEXT",
+        "chat_id": "INTEGER",
+        "latency": "REAL",
+        "tokens": "INTEGER",
+        "cost": "REAL",
+        "context_tokens": "INTEGER",
+    }
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_entries: Optional[int] = CACHE_MAX_ENTRIES,
+        max_bytes: Optional[int] = CACHE_MAX_BYTES,
+        default_ttl: Optional[float] = CACHE_TTL,
+    ):
         """
         Initialize the Cache class.
 
         Args:
             cache_dir (str): Directory where the cache will be stored.
+            max_entries (int, optional): Maximum number of entries kept in memory.
+            max_bytes (int, optional): Maximum size of the entries kept in memory.
+            default_ttl (float, optional): Default time to live of an entry in seconds.
         """
         self.cache_dir = cache_dir
-        self.cache = {}
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+
+        self._lock = threading.RLock()
+        self._connection: sqlite3.Connection = None
+        # key -> (value, expires_at, size, metadata), ordered from least to most
+        # recently used
+        self._memory: OrderedDict = OrderedDict()
+        self._memory_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # model -> hits, latency, tokens and cost saved by hits of its entries
+        self.savings: Dict[str, Dict[str, float]] = {}
+        self.key_hits: Counter = Counter()
 
-        # Load existing cache from JSON file if it exists
+        # Open the database, importing the legacy JSON cache on first use
         self.load_cache()
 
     def load_cache(self):
         """
-        Load the cache from a JSON file.
+        Open the SQLite cache database, creating it if it does not exist yet.
+        """
+        # Ensure the cache directory exists
+        os.makedirs(self.cache_dir, exist_ok=True)
+        db_path = os.path.join(self.cache_dir, self.db_file_name)
+        is_new = not os.path.exists(db_path)
+
+        self._connection = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, "
+            "expires_at REAL)"
+        )
+        columns = [
+            row[1] for row in self._connection.execute("PRAGMA table_info(entries)")
+        ]
+        if "expires_at" not in columns:
+            self._connection.execute("ALTER TABLE entries ADD COLUMN expires_at REAL")
+        for column, column_type in self.metadata_columns.items():
+            if column not in columns:
+                self._connection.execute(
+                    f"ALTER TABLE entries ADD COLUMN {column} {column_type}"
+                )
+
+        if is_new:
+            self._import_legacy_cache()
+
+    def _import_legacy_cache(self):
+        """
+        Import the entries of a previous `cache.json` file into the database.
         """
+        legacy_path = os.path.join(self.cache_dir, self.legacy_file_name)
         try:
-            with open(os.path.join(self.cache_dir, "cache.json"), "r") as f:
-                self.cache = json.load(f)
+            with open(legacy_path, "r") as f:
+                legacy_cache = json.load(f)
         except FileNotFoundError:
-            self.cache = {}
+            return
         except json.JSONDecodeError:
-            print("Cache file is corrupted. Starting with an empty cache.")
-            self.cache = {}
+            print("Legacy cache file is corrupted. Starting with an empty cache.")
+            return
         except Exception as e:
-            print(f"An error occurred while loading the cache: {e}")
-            self.cache = {}
-        finally:
-            # Ensure the cache directory exists
-            os.makedirs(self.cache_dir, exist_ok=True)
-            # Save the cache to a JSON file
-            self.save_cache()     
+            print(f"An error occurred while loading the legacy cache: {e}")
+            return
 
-    def save_cache(self):   
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, created_at) VALUES (?, ?, ?)",
+                [(key, json.dumps(value), now) for key, value in legacy_cache.items()],
+            )
+
+    def close(self):
         """
-        Save the cache to a JSON file.
+        Close the underlying database connection.
         """
-        try:
-            with open(os.path.join(self.cache_dir, "cache.json"), "w") as f:
-                json.dump(self.cache, f)
-        except Exception as e:
-            print(f"An error occurred while saving the cache: {e}")
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _remember(
+        self,
+        key: str,
+        value,
+        expires_at: Optional[float],
+        size: int,
+        metadata: Optional[dict] = None,
+    ):
+        """
+        Put an entry in the in-memory LRU, evicting the least recently used
+        entries when the entry or byte limits are exceeded.
+        """
+        self._forget(key)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        self._memory[key] = (value, expires_at, size, metadata)
+        self._memory_bytes += size
+        while self._memory and (
+            (self.max_entries is not None and len(self._memory) > self.max_entries)
+            or (self.max_bytes is not None and self._memory_bytes > self.max_bytes)
+        ):
+            _, (_, _, evicted_size, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+            self.evictions += 1
+
+    def _forget(self, key: str):
+        """
+        Remove an entry from the in-memory LRU.
+        """
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry[2]
+
+    def _record_hit(self, key: str, metadata: Optional[dict]):
+        """
+        Count a hit of an entry and what it saved.
+        """
+        self.hits += 1
+        self.key_hits[key] += 1
+        if not metadata or not metadata.get("model"):
+            return
+        savings = self.savings.setdefault(
+            metadata["model"], {"hits": 0, "latency": 0.0, "tokens": 0, "cost": 0.0}
+        )
+        savings["hits"] += 1
+        savings["latency"] += metadata.get("latency") or 0.0
+        savings["tokens"] += metadata.get("tokens") or 0
+        savings["cost"] += metadata.get("cost") or 0.0
 
     def get(self, key: str):
         """
@@ -60,51 +202,500 @@ class Cache:
             key (str): The key to retrieve from the cache.
 
         Returns:
-            The value associated with the key, or None if the key does not exist.
+            The value associated with the key, or None if the key does not exist
+            or has expired.
         """
-        return self.cache.get(key)
-    
-        # Return None if the key does not exist
-    def set(self, key: str, value):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at, _, metadata = entry
+                if expires_at is None or expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._record_hit(key, metadata)
+                    return value
+                self._forget(key)
+
+            row = self._connection.execute(
+                f"SELECT value, expires_at, {', '.join(self.metadata_columns)} "
+                "FROM entries WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            serialized, expires_at, *metadata = row
+            if expires_at is not None and expires_at <= now:
+                self._connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+
+            value = json.loads(serialized)
+            metadata = dict(zip(self.metadata_columns, metadata))
+            self._remember(key, value, expires_at, len(serialized), metadata)
+            self._record_hit(key, metadata)
+            return value
+
+    def set(
+        self,
+        key: str,
+        value,
+        ttl: Optional[float] = None,
+        metadata: Optional[dict] = None,
+    ):
         """
         Set a value in the cache.
         Args:
             key (str): The key to set in the cache.
             value: The value to associate with the key.
+            ttl (float, optional): Time to live in seconds, defaults to `default_ttl`.
+            metadata (dict, optional): What producing the value cost, with any of
+                the keys in `metadata_columns`.
         """
-        self.cache[key] = value
-        # Save the cache to a JSON file
-        self.save_cache()
+        now = time.time()
+        ttl = ttl if ttl is not None else self.default_ttl
+        expires_at = now + ttl if ttl is not None else None
+        serialized = json.dumps(value)
+        metadata = {
+            column: (metadata or {}).get(column) for column in self.metadata_columns
+        }
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries "
+                f"(key, value, created_at, expires_at, {', '.join(metadata)}) "
+                f"VALUES (?, ?, ?, ?{', ?' * len(metadata)})",
+                (key, serialized, now, expires_at, *metadata.values()),
+            )
+            self._remember(key, value, expires_at, len(serialized), metadata)
 
     def clear(self):
         """
         Clear the cache.
         """
-        self.cache = {}
-        # Save the cache to a JSON file
-        self.save_cache()
+        with self._lock:
+            self._connection.execute("DELETE FROM entries")
+            self._memory.clear()
+            self._memory_bytes = 0
 
     def delete(self, key: str):
         """
         Delete a key from the cache.
         Args:
             key (str): The key to delete from the cache.
-        """ 
-        if key in self.cache:
-            del self.cache[key]
-            # Save the cache to a JSON file
-            self.save_cache()
-        else:
-            print(f"Key '{key}' not found in cache.")     
+        """
+        with self._lock:
+            self._forget(key)
+            deleted = self._connection.execute(
+                "DELETE FROM entries WHERE key = ?", (key,)
+            ).rowcount
+        if not deleted:
+            print(f"Key '{key}' not found in cache.")
+
+    def purge_expired(self) -> int:
+        """
+        Remove every expired entry from the cache.
+
+        Returns:
+            int: The number of entries removed from the database.
+        """
+        now = time.time()
+        with self._lock:
+            for key in [
+                key
+                for key, (_, expires_at, _, _) in self._memory.items()
+                if expires_at is not None and expires_at <= now
+            ]:
+                self._forget(key)
+            return self._connection.execute(
+                "DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (now,),
+            ).rowcount
+
+    def delete_where(
+        self,
+        model: Optional[str] = None,
+        technique: Optional[str] = None,
+        chat_ids: Optional[List[int]] = None,
+    ) -> int:
+        """
+        Delete every entry matching all of the given metadata filters.
+
+        Args:
+            model (str, optional): Only delete entries produced by this model.
+            technique (str, optional): Only delete entries of this technique.
+            chat_ids (List[int], optional): Only delete entries of these chats.
+
+        Returns:
+            int: The number of entries deleted.
+        """
+        if chat_ids is not None and not chat_ids:
+            return 0
+        where, parameters = self._filter(
+            model=model, technique=technique, chat_ids=chat_ids
+        )
+        if not where:
+            raise ValueError("At least one filter is required, use clear() instead.")
+
+        condition = " AND ".join(where)
+        with self._lock:
+            for (key,) in self._connection.execute(
+                f"SELECT key FROM entries WHERE {condition}", parameters
+            ).fetchall():
+                self._forget(key)
+            return self._connection.execute(
+                f"DELETE FROM entries WHERE {condition}", parameters
+            ).rowcount
+
+    @staticmethod
+    def _filter(
+        search: Optional[str] = None,
+        model: Optional[str] = None,
+        technique: Optional[str] = None,
+        chat_ids: Optional[List[int]] = None,
+    ) -> tuple[List[str], list]:
+        """
+        Build the SQL conditions selecting entries by content and metadata.
+        """
+        where, parameters = [], []
+        if search:
+            where.append("(key LIKE ? OR value LIKE ?)")
+            parameters.extend([f"%{search}%", f"%{search}%"])
+        if model is not None:
+            where.append("model = ?")
+            parameters.append(model)
+        if technique is not None:
+            where.append("technique = ?")
+            parameters.append(technique)
+        if chat_ids is not None:
+            where.append(f"chat_id IN ({', '.join('?' * len(chat_ids))})")
+            parameters.extend(chat_ids)
+        return where, parameters
 
-    def create_cache_key(self,model:str,prompt:str):
+    def entries(
+        self,
+        search: Optional[str] = None,
+        model: Optional[str] = None,
+        technique: Optional[str] = None,
+        limit: int = 50,
+        offset: int = 0,
+        chat_ids: Optional[List[int]] = None,
+    ) -> List[dict]:
         """
-        Create a cache key based on model and prompt.
+        List the entries stored in the cache, most recent first.
+
+        Args:
+            search (str, optional): Only list entries whose key or value contains it.
+            model (str, optional): Only list entries produced by this model.
+            technique (str, optional): Only list entries of this technique.
+            limit (int): Maximum number of entries to list.
+            offset (int): Number of entries to skip.
+            chat_ids (List[int], optional): Only list entries of these chats.
+
+        Returns:
+            List[dict]: The key, value, size, timestamps and metadata of the entries.
+        """
+        if chat_ids is not None and not chat_ids:
+            return []
+        where, parameters = self._filter(search, model, technique, chat_ids)
+        condition = f"WHERE {' AND '.join(where)}" if where else ""
+        columns = ["key", "value", "created_at", "expires_at", *self.metadata_columns]
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT {', '.join(columns)} FROM entries {condition} "
+                "ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                [*parameters, limit, offset],
+            ).fetchall()
+            entries = []
+            for row in rows:
+                entry = dict(zip(columns, row))
+                entry["size"] = len(entry["value"])
+                entry["value"] = json.loads(entry["value"])
+                entry["hits"] = self.key_hits.get(entry["key"], 0)
+                entries.append(entry)
+            return entries
+
+    def token_usage(self, chat_ids: Optional[List[int]] = None) -> List[dict]:
+        """
+        Get the average tokens used per answer and per context of each chat,
+        e.g. to compare the tokens retrieval modes cost per answer.
+
+        Args:
+            chat_ids (List[int], optional): Only report these chats.
+
+        Returns:
+            List[dict]: The chat, its number of answers and their average
+            tokens and context tokens.
+        """
+        where = ["chat_id IS NOT NULL"]
+        parameters: list = []
+        if chat_ids is not None:
+            if not chat_ids:
+                return []
+            where.append(f"chat_id IN ({', '.join('?' * len(chat_ids))})")
+            parameters.extend(chat_ids)
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT chat_id, COUNT(*), AVG(tokens), AVG(context_tokens) "
+                f"FROM entries WHERE {' AND '.join(where)} "
+                "GROUP BY chat_id ORDER BY chat_id",
+                parameters,
+            ).fetchall()
+        return [
+            {
+                "chat_id": chat_id,
+                "answers": answers,
+                "tokens": tokens or 0.0,
+                "context_tokens": context_tokens or 0.0,
+            }
+            for chat_id, answers, tokens, context_tokens in rows
+        ]
+
+    def size_bytes(self) -> int:
+        """
+        Return the size of the values stored in the cache.
+        """
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COALESCE(SUM(LENGTH(value)), 0) FROM entries"
+            ).fetchone()[0]
+
+    def top_keys(self, n: int = 10) -> List[tuple[str, int]]:
+        """
+        Return the n keys with the most hits and their number of hits.
+        """
+        with self._lock:
+            return self.key_hits.most_common(n)
+
+    def chat_stats(self, chat_ids: List[int], n: int = 10) -> dict:
+        """
+        Get the counters of the entries of some chats.
+
+        Args:
+            chat_ids (List[int]): The chats whose entries are counted.
+            n (int): Number of keys with the most hits to return.
+
+        Returns:
+            dict: The number and size of the entries, their hits, the latency,
+            tokens and cost they saved per model and the n most hit keys.
+        """
+        rows = []
+        with self._lock:
+            if chat_ids:
+                rows = self._connection.execute(
+                    "SELECT key, LENGTH(value), model, latency, tokens, cost "
+                    f"FROM entries WHERE chat_id IN ({', '.join('?' * len(chat_ids))})",
+                    list(chat_ids),
+                ).fetchall()
+            key_hits = Counter(
+                {key: self.key_hits[key] for key, *_ in rows if self.key_hits[key]}
+            )
+
+        savings: Dict[str, Dict[str, float]] = {}
+        for key, _, model, latency, tokens, cost in rows:
+            hits = key_hits.get(key, 0)
+            if not hits or not model:
+                continue
+            model_savings = savings.setdefault(
+                model, {"hits": 0, "latency": 0.0, "tokens": 0, "cost": 0.0}
+            )
+            model_savings["hits"] += hits
+            model_savings["latency"] += hits * (latency or 0.0)
+            model_savings["tokens"] += hits * (tokens or 0)
+            model_savings["cost"] += hits * (cost or 0.0)
+        return {
+            "entries": len(rows),
+            "bytes": sum(size for _, size, *_ in rows),
+            "hits": sum(key_hits.values()),
+            "savings": savings,
+            "top_keys": key_hits.most_common(n),
+        }
+
+    def stats(self) -> dict:
+        """
+        Get the cache counters.
+
+        Returns:
+            dict: Hits, misses, hit ratio, evictions, the size of the in-memory
+            LRU and the latency, tokens and cost saved per model.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "savings": {
+                    model: dict(savings) for model, savings in self.savings.items()
+                },
+            }
+
+    def items(self, batch_size: int = 500) -> Iterator[dict]:
+        """
+        Iterate over every entry that has not expired, in batches so that the
+        whole cache is never loaded into memory.
+
+        Args:
+            batch_size (int): Number of entries read from the database at once.
+
+        Yields:
+            dict: The key, value, timestamps and metadata of an entry.
+        """
+        columns = ["key", "value", "created_at", "expires_at", *self.metadata_columns]
+        last_key = ""
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                    f"SELECT {', '.join(columns)} FROM entries "
+                    "WHERE key > ? AND (expires_at IS NULL OR expires_at > ?) "
+                    "ORDER BY key LIMIT ?",
+                    (last_key, time.time(), batch_size),
+                ).fetchall()
+            for row in rows:
+                entry = dict(zip(columns, row))
+                entry["value"] = json.loads(entry["value"])
+                yield entry
+            if len(rows) < batch_size:
+                return
+            last_key = rows[-1][0]
+
+    def put_entries(self, entries: Iterable[dict], batch_size: int = 500) -> int:
+        """
+        Store entries produced by `items`, keeping the newest entry of a key
+        when it is already in the cache. Expired entries are skipped.
+
+        Args:
+            entries (Iterable[dict]): Entries with at least a key, a value and
+                their creation time.
+            batch_size (int): Number of entries written in one transaction.
+
+        Returns:
+            int: The number of entries written.
+        """
+        columns = ["key", "value", "created_at", "expires_at", *self.metadata_columns]
+        statement = (
+            f"INSERT INTO entries ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT(key) DO UPDATE SET "
+            f"{', '.join(f'{column} = excluded.{column}' for column in columns[1:])} "
+            "WHERE excluded.created_at > entries.created_at"
+        )
+
+        def write(batch: List[tuple]) -> int:
+            with self._lock:
+                self._connection.execute("BEGIN")
+                try:
+                    written = 0
+                    for row in batch:
+                        written += self._connection.execute(statement, row).rowcount
+                        self._forget(row[0])
+                    self._connection.execute("COMMIT")
+                except BaseException:
+                    self._connection.execute("ROLLBACK")
+                    raise
+                return written
+
+        now = time.time()
+        written, batch = 0, []
+        for entry in entries:
+            if entry.get("expires_at") is not None and entry["expires_at"] <= now:
+                continue
+            batch.append(
+                (
+                    entry["key"],
+                    json.dumps(entry["value"]),
+                    entry.get("created_at") or now,
+                    *(entry.get(column) for column in columns[3:]),
+                )
+            )
+            if len(batch) >= batch_size:
+                written += write(batch)
+                batch = []
+        if batch:
+            written += write(batch)
+        return written
+
+    def __len__(self) -> int:
+        """
+        Return the number of entries stored in the cache.
+        """
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def create_cache_key(
+        self,
+        model: str,
+        prompt: str,
+        technique: Optional[str] = None,
+        contexts: Optional[List[str]] = None,
+        system_prompt: Optional[str] = None,
+        history: Optional[List[str]] = None,
+        temperature: Optional[float] = None,
+    ):
+        """
+        Create a cache key based on model and prompt, and on everything else
+        that changes the answer to the prompt.
         Args:
             model (str): The model name.
             prompt (str): The prompt text.
+            technique (str, optional): The prompting technique's name.
+            contexts (List[str], optional): The retrieved contexts.
+            system_prompt (str, optional): The system prompt of the task.
+            history (List[str], optional): The previous messages of the chat.
+            temperature (float, optional): The sampling temperature.
         Returns:
             str: The generated cache key.
         """
-        key = f"{model.strip().lower()}_{prompt.strip().lower()}"
-        return hashlib.sha256(key.encode('utf-8')).hexdigest()
\ No newline at end of file
+        if all(
+            part is None
+            for part in (technique, contexts, system_prompt, history, temperature)
+        ):
+            key = f"{model.strip().lower()}_{prompt.strip().lower()}"
+            return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+        key = json.dumps(
+            {
+                "model": model.strip().lower(),
+                "prompt": prompt.strip().lower(),
+                "technique": technique,
+                "contexts": create_digest(contexts),
+                "system_prompt": create_digest([system_prompt]) if system_prompt else None,
+                "history": create_digest(history),
+                "temperature": temperature,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def create_digest(values: Optional[List[str]]) -> Optional[str]:
+    """
+    Hash an ordered list of strings into a short digest.
+    """
+    if values is None:
+        return None
+    digest = hashlib.sha256()
+    for value in values:
+        encoded = value.encode("utf-8")
+        # prefix each value with its length so that boundaries are unambiguous
+        digest.update(len(encoded).to_bytes(8, "big"))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+_shared_cache: Optional[Cache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_cache() -> Cache:
+    """
+    Get the cache shared by the whole process, creating it on first use.
+    """
+    global _shared_cache  # pylint: disable=global-statement
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = Cache(CACHE_DIR)
+    return _shared_cache
@@ -0,0 +1,149 @@
+import json
+from typing import Iterable, List, Optional
+
+from backend.src.constants import QueryExpansion
+from backend.src.models import MessageRole
+
+from ..prompts.techniques import TechniqueFactory
+from .cache import get_cache
+from .chat import get_chat_by_id, get_chat_ids_by_task, get_chat_ids_by_user
+from .rag import query_knowledge_batch
+from .semantic_cache import semantic_cache
+from .task import get_task_by_id
+
+
+async def get_cache_report(top_n: int = 10, user_id: Optional[int] = None) -> dict:
+    """
+    Get the counters, size, savings per model and most hit keys of the cache,
+    only of the entries of the user's chats if given
+    """
+    cache = get_cache()
+    if user_id is not None:
+        return cache.chat_stats(await get_chat_ids_by_user(user_id), top_n)
+    return {
+        **cache.stats(),
+        "entries": len(cache),
+        "bytes": cache.size_bytes(),
+        "top_keys": cache.top_keys(top_n),
+    }
+
+
+async def get_token_usage(task_id: Optional[int] = None) -> List[dict]:
+    """
+    Get the average tokens and context tokens per answer of each chat,
+    optionally of the chats of a task
+    """
+    chat_ids = await get_chat_ids_by_task(task_id) if task_id is not None else None
+    return get_cache().token_usage(chat_ids)
+
+
+async def search_cache(
+    search: Optional[str] = None,
+    model: Optional[str] = None,
+    technique: Optional[str] = None,
+    page=0,
+    limit=20,
+    user_id: Optional[int] = None,
+) -> List[dict]:
+    """
+    Search the cached responses by content, model and technique, only among
+    the chats of the user if given
+    """
+    chat_ids = await get_chat_ids_by_user(user_id) if user_id is not None else None
+    return get_cache().entries(search, model, technique, limit, page * limit, chat_ids)
+
+
+async def invalidate_cache(
+    model: Optional[str] = None,
+    technique: Optional[str] = None,
+    task_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+) -> int:
+    """
+    Remove the cached responses of a model, technique and/or task, only among
+    the chats of the user if given
+    """
+    chat_ids = await get_chat_ids_by_user(user_id) if user_id is not None else None
+    if task_id is not None:
+        task_chat_ids = await get_chat_ids_by_task(task_id)
+        if chat_ids is not None:
+            task_chat_ids = [chat_id for chat_id in task_chat_ids if chat_id in chat_ids]
+        chat_ids = task_chat_ids
+    deleted = get_cache().delete_where(model, technique, chat_ids)
+    # the semantic cache is not indexed by model, rebuild the scopes of the chats
+    if chat_ids is None:
+        semantic_cache.clear()
+    else:
+        semantic_cache.clear_chats(chat_ids)
+    return deleted
+
+
+def parse_warm_questions(lines: Iterable[str]) -> List[str]:
+    """
+    Get the questions of a JSONL file, one JSON object per line with either a
+    `question`, a `prompt` or a `title` and `body`
+    """
+    questions = []
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            print(f"Skipping invalid JSON on line {number}.")
+            continue
+
+        question = record.get("question") or record.get("prompt")
+        if not question:
+            question = "\n".join(
+                record[field] for field in ("title", "body") if record.get(field)
+            )
+        if question:
+            questions.append(question)
+        else:
+            print(f"Skipping line {number} without a question.")
+    return questions
+
+
+async def warm_cache(
+    chat_id: int, questions: List[str], user_id: Optional[int] = None
+) -> int:
+    """
+    Answer the questions in a chat without adding them to it, so that the
+    answers are cached for when they are asked. The chat must belong to the
+    user if given
+    """
+    chat = await get_chat_by_id(chat_id)
+    if not chat or (user_id is not None and chat.user_id != user_id):
+        raise ValueError(f"Chat {chat_id} not found.")
+    task = await get_task_by_id(chat.task_id)
+    technique = TechniqueFactory.create_technique(task.prompting_technique)
+    # warmed answers are the ones of questions asked at the start of the chat
+    chat_histories = [
+        message for message in chat.messages if message.role == MessageRole.SYSTEM
+    ]
+    if chat.query_expansion == QueryExpansion.NONE:
+        # retrieve the contexts of every question at once into the retrieval cache
+        await query_knowledge_batch(
+            chat_id,
+            questions,
+            chat.rag_technique,
+            task.llm_model,
+            chat.vector_top_k,
+        )
+
+    warmed = 0
+    for question in questions:
+        response = await technique.ask(
+            question,
+            chat_histories,
+            task.llm_model,
+            chat.rag_technique,
+            chat_id,
+            chat.vector_top_k,
+            store_response=False,
+            query_expansion=chat.query_expansion,
+        )
+        if response is not None:
+            warmed += 1
+    return warmed
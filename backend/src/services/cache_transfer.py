@@ -0,0 +1,58 @@
+import gzip
+import json
+import tempfile
+from typing import Iterator, List
+
+from .cache import Cache
+
+
+def export_cache(cache: Cache, path: str) -> int:
+    """
+    Stream the entries of a cache to a gzip compressed JSON lines file
+    """
+    exported = 0
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for entry in cache.items():
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            exported += 1
+    return exported
+
+
+def read_entries(path: str) -> Iterator[dict]:
+    """
+    Stream the entries of a file written by `export_cache`
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Skipping invalid entry on line {number} of {path}.")
+                continue
+            if "key" not in entry or "value" not in entry:
+                print(f"Skipping entry without key or value on line {number} of {path}.")
+                continue
+            yield entry
+
+
+def import_cache(cache: Cache, paths: List[str]) -> int:
+    """
+    Import exported entries into a cache, keeping the newest entry of each key
+    """
+    return sum(cache.put_entries(read_entries(path)) for path in paths)
+
+
+def merge_exports(paths: List[str], output: str) -> int:
+    """
+    Merge the exports of several caches into a single export without
+    duplicated keys, keeping the newest entry of each key
+    """
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = Cache(cache_dir, max_entries=0)
+        try:
+            import_cache(cache, paths)
+            return export_cache(cache, output)
+        finally:
+            cache.close()
@@ -5,7 +5,7 @@ from sqlalchemy import delete, func
 from sqlalchemy.future import select
 from sqlalchemy.orm import joinedload
 
-from backend.src.constants import RagTechnique
+from backend.src.constants import QueryExpansion, RagTechnique
 
 from ..models import Chat, Message, MessageRole, ReasoningStep, Session
 
@@ -15,6 +15,7 @@ async def create_chat(
     task_id: int,
     rag_technique: RagTechnique = RagTechnique.VECTOR,
     vector_top_k: int = 3,
+    query_expansion: QueryExpansion = QueryExpansion.NONE,
 ) -> Chat:
     """
     Create a new chat with the given name
@@ -25,6 +26,7 @@ async def create_chat(
             task_id=task_id,
             rag_technique=rag_technique,
             vector_top_k=vector_top_k,
+            query_expansion=query_expansion,
         )
         session.add(chat)
         await session.commit()
@@ -145,3 +147,21 @@ async def delete_chats_by_task_id(task_id: int):
         stmt = delete(Chat).where(Chat.task_id == task_id)
         await session.execute(stmt)
         await session.commit()
+
+
+async def get_chat_ids_by_user(user_id: int) -> List[int]:
+    """
+    Get the ids of all chats of a user
+    """
+    async with Session() as session:
+        stmt = select(Chat.id).where(Chat.user_id == user_id)
+        return list((await session.scalars(stmt)).all())
+
+
+async def get_chat_ids_by_task(task_id: int) -> List[int]:
+    """
+    Get the ids of all chats associated with task id
+    """
+    async with Session() as session:
+        stmt = select(Chat.id).where(Chat.task_id == task_id)
+        return list((await session.scalars(stmt)).all())
@@ -0,0 +1,98 @@
+import os
+from typing import List, Optional, Tuple
+
+from backend.src.constants import LLM_CONTEXT_BUDGETS, LlmModel
+
+from .rerank import IMAGES_PATTERN, fit_token_budget
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000"))
+# Shortest shared text considered an overlap between adjacent chunks
+MIN_CHUNK_OVERLAP = int(os.getenv("MIN_CHUNK_OVERLAP", "20"))
+
+
+def get_context_token_budget(model: str) -> int:
+    """
+    Get the number of context tokens sent with every prompt to a model
+    """
+    try:
+        return LLM_CONTEXT_BUDGETS.get(LlmModel(model), CONTEXT_TOKEN_BUDGET)
+    except ValueError:
+        return CONTEXT_TOKEN_BUDGET
+
+
+def _split_images(context: str) -> Tuple[str, List[str]]:
+    """
+    Split a context into its text and its image markers
+    """
+    return IMAGES_PATTERN.sub("", context), IMAGES_PATTERN.findall(context)
+
+
+def _find_overlap(first: str, second: str) -> int:
+    """
+    Get the length of the longest end of the first text which starts the
+    second text, 0 when it is shorter than MIN_CHUNK_OVERLAP
+    """
+    if len(first) < MIN_CHUNK_OVERLAP or len(second) < MIN_CHUNK_OVERLAP:
+        return 0
+    head = second[:MIN_CHUNK_OVERLAP]
+    start = first.find(head)
+    while start != -1:
+        overlap = len(first) - start
+        if second.startswith(first[start:]):
+            return overlap
+        start = first.find(head, start + 1)
+    return 0
+
+
+def _merge(
+    chunks: List[Tuple[str, List[str]]], text: str, images: List[str]
+) -> Optional[int]:
+    """
+    Merge a chunk into the first packed chunk it overlaps or contains,
+    returning the position of that chunk or None
+    """
+    for position, (packed_text, packed_images) in enumerate(chunks):
+        merged = None
+        if text in packed_text:
+            merged = packed_text
+        elif packed_text in text:
+            merged = text
+        elif overlap := _find_overlap(packed_text, text):
+            merged = packed_text + text[overlap:]
+        elif overlap := _find_overlap(text, packed_text):
+            merged = text + packed_text[overlap:]
+        if merged is not None:
+            chunks[position] = (
+                merged,
+                packed_images + [image for image in images if image not in packed_images],
+            )
+            return position
+    return None
+
+
+def pack_contexts(contexts: List[str], token_budget: int) -> List[str]:
+    """
+    Pack retrieved contexts into as few tokens as possible: duplicated and
+    contained chunks are dropped, adjacent chunks sharing their overlapping
+    text are merged, and the most relevant contexts fitting in the token
+    budget are kept. Image markers are kept with the text they belong to.
+
+    :param contexts: Retrieved contexts, from most to least relevant.
+    :type contexts: List[str]
+    :param token_budget: Maximum number of tokens of the packed contexts.
+    :type token_budget: int
+    :return: The packed contexts.
+    :rtype: List[str]
+    """
+    chunks: List[Tuple[str, List[str]]] = []
+    for context in contexts:
+        text, images = _split_images(context)
+        text = text.strip()
+        if not text and not images:
+            continue
+        if text and _merge(chunks, text, images) is not None:
+            continue
+        chunks.append((text, images))
+
+    packed = [text + "".join(images) for text, images in chunks]
+    return fit_token_budget(packed, token_budget)
@@ -0,0 +1,95 @@
+import asyncio
+import os
+from typing import List
+
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.schema import BaseNode, MetadataMode
+
+from backend.src.constants import LlmModel
+from backend.src.llm.llm_utils import count_tokens
+from backend.src.llm.rate_limit import (
+    TokenRateLimiter,
+    get_embedding_rate_limiter,
+    is_rate_limit_error,
+)
+
+# Chunks embedded by a single request to the provider
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+# Requests to the provider in flight at once while inserting a chat's data
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "8"))
+# Retries of a batch rejected by the provider's rate limit
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+# Retries of the provider's client itself while ingesting, kept low so that
+# rate limit errors reach the shared rate limiter instead of being retried blindly
+EMBEDDING_CLIENT_MAX_RETRIES = int(os.getenv("EMBEDDING_CLIENT_MAX_RETRIES", "1"))
+
+
+def limit_client_retries(
+    embedding_model: BaseEmbedding, max_retries: int = EMBEDDING_CLIENT_MAX_RETRIES
+):
+    """
+    Lower the retries of the provider's client behind an embedding model,
+    whether it is wrapped by the embedding cache or not
+    """
+    client_model = getattr(embedding_model, "embedding", embedding_model)
+    if hasattr(client_model, "max_retries"):
+        client_model.max_retries = max_retries
+
+
+async def embed_batch(
+    texts: List[str], embedding_model: BaseEmbedding, rate_limiter: TokenRateLimiter
+) -> List[Embedding]:
+    """
+    Embed a batch of texts within the provider's rate limit, retrying
+    while the provider answers 429
+    """
+    tokens = sum(count_tokens(text) for text in texts)
+    retries = 0
+    while True:
+        await rate_limiter.acquire(tokens)
+        try:
+            embeddings = await embedding_model.aget_text_embedding_batch(texts)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            if retries >= EMBEDDING_MAX_RETRIES or not is_rate_limit_error(e):
+                raise
+            retries += 1
+            backoff = rate_limiter.throttle()
+            print(f"Embedding rate limited, pausing for {backoff:.1f}s: {e}")
+            continue
+        rate_limiter.recover()
+        return embeddings
+
+
+async def embed_nodes(
+    nodes: List[BaseNode],
+    model: LlmModel,
+    embedding_model: BaseEmbedding,
+):
+    """
+    Embed the chunks which have no embedding yet, in concurrent batches.
+
+    :param nodes: The chunks, which get their embedding set.
+    :type nodes: List[BaseNode]
+    :param model: The model of the chat, whose embedding provider's
+        rate limit is shared by every ingestion.
+    :type model: LlmModel
+    :param embedding_model: The embedding model of the chat.
+    :type embedding_model: BaseEmbedding
+    """
+    rate_limiter = get_embedding_rate_limiter(model)
+    semaphore = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+    pending = [node for node in nodes if node.embedding is None]
+
+    async def embed(batch: List[BaseNode]):
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in batch]
+        async with semaphore:
+            embeddings = await embed_batch(texts, embedding_model, rate_limiter)
+        for node, embedding in zip(batch, embeddings):
+            node.embedding = embedding
+
+    await asyncio.gather(
+        *(
+            embed(pending[start : start + EMBEDDING_BATCH_SIZE])
+            for start in range(0, len(pending), EMBEDDING_BATCH_SIZE)
+        )
+    )
@@ -1,10 +1,27 @@
+import asyncio
+import hashlib
+import io
+import json
+import mimetypes
+import mmap
+import multiprocessing
 import os
 import tempfile
+import threading
 import time
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
 from pathlib import Path
+from tempfile import SpooledTemporaryFile
+from typing import Iterator, Optional
 
 import chromadb
 from chromadb.config import Settings as ChromaSettings
+from chromadb.errors import NotFoundError
 from dotenv import load_dotenv
 from llama_index.core import Document, KnowledgeGraphIndex
 from llama_index.core import Settings as LlamaIndexSettings
@@ -14,6 +31,8 @@ from llama_index.core import (
     VectorStoreIndex,
 )
 from llama_index.core.indices.base import BaseIndex
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import BaseNode, MetadataMode
 from llama_index.graph_stores.nebula import NebulaGraphStore
 from llama_index.vector_stores.chroma import ChromaVectorStore
 from nebula3.common.ttypes import ErrorCode
@@ -23,7 +42,20 @@ from nicegui import run
 from backend.src.constants import LlmModel, RagTechnique
 from backend.src.llamaindex_extensions.pdftextimagereader import PDFTextImageReader
 from backend.src.llm.models import LlmFactory
-from backend.src.services.file import create_files
+from backend.src.llm.rate_limit import get_embedding_provider
+from backend.src.services.embedding import embed_nodes, limit_client_retries
+from backend.src.services.file import (
+    create_files,
+    delete_files_by_names,
+    get_file_names_by_chat,
+)
+from backend.src.services.lexical import BM25Index, build_lexical_index, lexical_indexes
+from backend.src.services.pdf_parsing import (
+    count_pdf_pages,
+    read_pdf_pages,
+    read_shared_pdf_pages,
+)
+from backend.src.services.retrieval_cache import retrieval_cache
 from common import File
 
 load_dotenv()
@@ -36,93 +68,786 @@ NEBULA_ADDRESS, NEBULA_PORT = (
     if isinstance(NEBULA_ADDRESS, str) and ":" in NEBULA_ADDRESS
     else (NEBULA_ADDRESS, "9669")
 )
+CHROMA_COLLECTION_CACHE_SIZE = int(os.getenv("CHROMA_COLLECTION_CACHE_SIZE", "128"))
+# Metadata key of the parent section of a chunk
+PARENT_ID_KEY = "parent_id"
+# Metadata keys of the uploaded file a chunk comes from and of its content hash
+FILE_NAME_KEY = "file_name"
+DOC_HASH_KEY = "doc_hash"
+# Metadata key of a collection holding its manifest: the content hash and the
+# chunk ids of every stored file, by file name
+MANIFEST_KEY = "manifest"
+# Metadata key of a chat's collection naming the task collection it stands for
+BASE_COLLECTION_KEY = "base_collection"
+# Whether new chats share the documents ingested once for their task by default
+SHARE_TASK_KNOWLEDGE = os.getenv("SHARE_TASK_KNOWLEDGE", "false").lower() == "true"
+# File metadata kept out of the embedded and prompted text, as SimpleDirectoryReader does
+FILE_METADATA_EXCLUDED_KEYS = [FILE_NAME_KEY, "file_type", "file_size"]
+# Number of processes parsing uploaded PDF files, 0 parses every file in a thread
+# one by one. Each process holds its own PyMuPDF, so few are started by default
+PARSING_WORKERS = int(os.getenv("PARSING_WORKERS", str(min(2, os.cpu_count() or 1))))
+# Number of pages of a PDF file parsed by a single process
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "32"))
 
+# The ChromaDB client and collection handles are shared by the whole process,
+# so that connections are kept alive instead of set up for every request
+_chroma_client: Optional[chromadb.ClientAPI] = None
+_chroma_collections: OrderedDict = OrderedDict()
+_chroma_lock = threading.Lock()
+# Ingestions into the same collection run one after the other
+_ingestion_locks: defaultdict = defaultdict(asyncio.Lock)
+# Names of the chat collections standing for each shared task collection,
+# of the chats whose results may be cached by this process
+_linked_collections: defaultdict = defaultdict(set)
+# The process pool parsing uploaded files is started on first use
+_parsing_pool: Optional[ProcessPoolExecutor] = None
+_parsing_lock = threading.Lock()
 
-def get_chroma_client():
+
+def get_vector_collection_name(chat_id: int) -> str:
+    """
+    Get the name of the ChromaDB collection of a chat
+    """
+    return "chat-" + str(chat_id)
+
+
+def get_parent_collection_name(chat_id: int) -> str:
+    """
+    Get the name of the ChromaDB collection of a chat's parent sections
+    """
+    return get_vector_collection_name(chat_id) + "-parents"
+
+
+def get_task_collection_name(
+    task_id: int,
+    model=LlmModel.GPT4O_MINI,
+    chunk_size=1024,
+    chunk_overlap=20,
+    parent_chunk_size: Optional[int] = None,
+) -> str:
     """
-    Get a ChromaDB client
+    Get the name of the ChromaDB collection shared by the chats of a task,
+    versioned by the way its documents are split and embedded
     """
-    return chromadb.HttpClient(
-        host=os.getenv("CHROMA_HOST"),
-        port=os.getenv("CHROMA_PORT"),
-        settings=ChromaSettings(
-            chroma_client_auth_provider="chromadb.auth.token_authn.TokenAuthClientProvider",
-            chroma_client_auth_credentials=os.getenv("CHROMA_TOKEN"),
-        ),
+    settings = ":".join(
+        str(setting)
+        for setting in (
+            get_embedding_provider(model),
+            chunk_size,
+            chunk_overlap,
+            parent_chunk_size or 0,
+        )
     )
+    version = hashlib.sha256(settings.encode("utf-8")).hexdigest()[:12]
+    return f"task-{task_id}-{version}"
+
+
+def get_graph_space_name(chat_id: int) -> str:
+    """
+    Get the name of the NebulaDB space of a chat
+    """
+    return "chat_" + str(chat_id)
+
+
+def get_chroma_client():
+    """
+    Get the ChromaDB client shared by the whole process, creating it on first use
+    """
+    global _chroma_client  # pylint: disable=global-statement
+    with _chroma_lock:
+        if _chroma_client is None:
+            _chroma_client = chromadb.HttpClient(
+                host=os.getenv("CHROMA_HOST"),
+                port=os.getenv("CHROMA_PORT"),
+                settings=ChromaSettings(
+                    chroma_client_auth_provider="chromadb.auth.token_authn.TokenAuthClientProvider",
+                    chroma_client_auth_credentials=os.getenv("CHROMA_TOKEN"),
+                ),
+            )
+        return _chroma_client
 
 
 def get_chroma_collection(chat_id: str) -> chromadb.Collection:
     """
-    Get or create a collection for a given chat_id
+    Get or create a collection for a given chat_id.
+    The collection of a chat sharing its task's documents resolves to the
+    task collection. Handles of recently used collections are reused.
+    """
+    with _chroma_lock:
+        collection = _chroma_collections.get(chat_id)
+        if collection is not None:
+            _chroma_collections.move_to_end(chat_id)
+            return collection
+
+    collection = get_chroma_client().get_or_create_collection(chat_id)
+    if isinstance(collection.metadata, dict) and collection.metadata.get(
+        BASE_COLLECTION_KEY
+    ):
+        collection = get_chroma_client().get_or_create_collection(
+            collection.metadata[BASE_COLLECTION_KEY]
+        )
+    with _chroma_lock:
+        if collection.name != chat_id:
+            _linked_collections[collection.name].add(chat_id)
+        _chroma_collections[chat_id] = collection
+        _chroma_collections.move_to_end(chat_id)
+        while len(_chroma_collections) > CHROMA_COLLECTION_CACHE_SIZE:
+            _chroma_collections.popitem(last=False)
+    return collection
+
+
+def evict_chroma_collection(chat_id: str):
+    """
+    Forget the handle of a collection, e.g. after it has been deleted
+    """
+    with _chroma_lock:
+        _chroma_collections.pop(chat_id, None)
+
+
+def link_chat_collections(chat_id: int, base_collection_name: str):
+    """
+    Make the collections of a chat stand for the shared collections of its task
     """
     chroma_client = get_chroma_client()
-    return chroma_client.get_or_create_collection(chat_id)
+    for collection_name, base_name in (
+        (get_vector_collection_name(chat_id), base_collection_name),
+        (get_parent_collection_name(chat_id), base_collection_name + "-parents"),
+    ):
+        chroma_client.get_or_create_collection(
+            collection_name, metadata={BASE_COLLECTION_KEY: base_name}
+        )
+        evict_chroma_collection(collection_name)
+        with _chroma_lock:
+            _linked_collections[base_name].add(collection_name)
+
+
+def invalidate_collection(collection_name: str, base_name: str):
+    """
+    Drop the results cached for a chat's collection after its data has changed,
+    and for every chat sharing the same task collection. The chats sharing it
+    are those this process linked or resolved, the only ones it cached
+    results for.
+    """
+    with _chroma_lock:
+        linked = _linked_collections.get(base_name, set())
+        collection_names = {collection_name} | linked
+    for name in sorted(collection_names):
+        retrieval_cache.invalidate(name)
+
+
+def reset_chroma_client():
+    """
+    Forget the shared ChromaDB client and every collection handle
+    """
+    global _chroma_client  # pylint: disable=global-statement
+    with _chroma_lock:
+        _chroma_client = None
+        _chroma_collections.clear()
+
+
+def get_lexical_index(chat_id: int) -> BM25Index:
+    """
+    Get the BM25 index of a chat's vector collection, built from the
+    collection's chunks and rebuilt whenever the collection changes
+    """
+    collection_name = get_vector_collection_name(chat_id)
+    return lexical_indexes.get(
+        collection_name,
+        lambda: build_lexical_index(get_chroma_collection(collection_name)),
+        collection_name,
+    )
+
+
+@contextmanager
+def open_buffer(content: SpooledTemporaryFile) -> Iterator[memoryview]:
+    """
+    Open a read-only view of an uploaded file without copying it,
+    whether it is still in memory or already spooled to disk
+    """
+    in_memory = getattr(content, "_file", None)
+    if isinstance(in_memory, io.BytesIO):
+        buffer = in_memory.getbuffer()
+        try:
+            yield buffer
+        finally:
+            buffer.release()
+        return
+
+    content.flush()
+    if os.fstat(content.fileno()).st_size == 0:
+        yield memoryview(b"")
+        return
+    with mmap.mmap(content.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        buffer = memoryview(mapped)
+        try:
+            yield buffer
+        finally:
+            buffer.release()
+
+
+def get_file_metadata(name: str, buffer: memoryview) -> dict:
+    """
+    Get the metadata SimpleDirectoryReader gives the documents of a file
+    """
+    metadata = {
+        "file_path": name,
+        FILE_NAME_KEY: name,
+        "file_type": mimetypes.guess_type(name)[0],
+        "file_size": buffer.nbytes,
+    }
+    return {key: value for key, value in metadata.items() if value is not None}
+
+
+def create_page_documents(
+    metadata: dict, pages: list[tuple[str, str]]
+) -> list[Document]:
+    """
+    Create a document per page of a PDF file from the label and text of its pages
+    """
+    return [
+        Document(
+            text=text,
+            metadata={"page_label": label, **metadata},
+            excluded_embed_metadata_keys=list(FILE_METADATA_EXCLUDED_KEYS),
+            excluded_llm_metadata_keys=list(FILE_METADATA_EXCLUDED_KEYS),
+        )
+        for label, text in pages
+    ]
+
+
+def load_pdf_buffer(name: str, buffer: memoryview) -> list[Document]:
+    """
+    Load a document per page of a PDF file
+    """
+    return create_page_documents(
+        get_file_metadata(name, buffer), read_pdf_pages(buffer)
+    )
+
+
+def load_text_buffer(name: str, buffer: memoryview) -> list[Document]:
+    """
+    Load a document from a plain text file
+    """
+    return [
+        Document(
+            text=str(buffer, encoding="utf-8", errors="ignore"),
+            metadata=get_file_metadata(name, buffer),
+            excluded_embed_metadata_keys=list(FILE_METADATA_EXCLUDED_KEYS),
+            excluded_llm_metadata_keys=list(FILE_METADATA_EXCLUDED_KEYS),
+        )
+    ]
+
+
+def load_temporary_file(name: str, buffer: memoryview) -> list[Document]:
+    """
+    Load documents from a file SimpleDirectoryReader can only read from disk
+    """
+    file_suffix = ".bin." + name
+    temp_filename = None  # Initialize temp_filename
+    try:
+        # save a tempfile
+        with tempfile.NamedTemporaryFile(suffix=file_suffix, delete=False) as temp_file:
+            temp_file.write(buffer)
+            temp_file.flush()
+            temp_filename = temp_file.name  # Capture the temporary filename
+
+        reader = SimpleDirectoryReader(input_files=[Path(temp_filename)])
+        # reader = PDFTextImageReader(
+        #     input_files=[Path(temp_filename)],
+        #     image_output_dir="./extracted_images",
+        #     recursive=True
+        # )
+        return reader.load_data()
+    finally:
+        # Ensure the temporary file is deleted
+        if temp_filename and os.path.exists(temp_filename):
+            os.remove(temp_filename)
+
+
+# Readers parsing an uploaded file straight from its buffer, by extension
+BUFFER_READERS = {
+    ".pdf": load_pdf_buffer,
+    ".txt": load_text_buffer,
+}
+
+
+def load_buffer(name: str, buffer: memoryview) -> list[Document]:
+    """
+    Load the documents of an uploaded file
+    """
+    extension = os.path.splitext(name)[1].lower()
+    documents = BUFFER_READERS.get(extension, load_temporary_file)(name, buffer)
+    # documents read from a temporary file point to the upload instead
+    for document in documents:
+        document.metadata["file_path"] = name
+        document.metadata[FILE_NAME_KEY] = name
+    return documents
+
+
+def get_page_ranges(page_count: int) -> list[range]:
+    """
+    Split the pages of a PDF file into the ranges parsed by separate processes
+    """
+    return [
+        range(start, min(start + PDF_PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, PDF_PAGES_PER_TASK)
+    ]
+
+
+def get_parsing_pool() -> ProcessPoolExecutor:
+    """
+    Get the process pool parsing uploaded files, starting it on first use
+    """
+    global _parsing_pool  # pylint: disable=global-statement
+    with _parsing_lock:
+        if _parsing_pool is None:
+            # forked workers would inherit the locks and threads of the app,
+            # spawned ones only import the PDF parsing module they run
+            _parsing_pool = ProcessPoolExecutor(
+                max_workers=PARSING_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _parsing_pool
+
+
+def shutdown_parsing_pool():
+    """
+    Stop the processes parsing uploaded files
+    """
+    global _parsing_pool  # pylint: disable=global-statement
+    with _parsing_lock:
+        pool, _parsing_pool = _parsing_pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
 
 
 def get_documents_from_binaries(files: list[File]) -> list[Document]:
     """
-    Load documents from binary files
+    Load documents from binary files, one after the other.
+    PDF and text files are parsed from the uploaded buffer, other files
+    go through a temporary file.
     """
     documents = []
     for file in files:
-        file_suffix = ".bin." + file.name
-        temp_filename = None  # Initialize temp_filename
         try:
-            # save a tempfile
-            with tempfile.NamedTemporaryFile(
-                suffix=file_suffix, delete=False
-            ) as temp_file:
-                temp_file.write(file.content.read())
-                temp_file.flush()
-                temp_filename = temp_file.name  # Capture the temporary filename
-
-            reader = SimpleDirectoryReader(
-                    input_files=[Path(temp_filename)]
-                ) 
-            # reader = PDFTextImageReader(
-            #     input_files=[Path(temp_filename)],
-            #     image_output_dir="./extracted_images",
-            #     recursive=True
-            # )           
-            documents.extend(                
-                reader.load_data(num_workers=4)
-            )
+            with open_buffer(file.content) as buffer:
+                documents.extend(load_buffer(file.name, buffer))
         except Exception as e:
             # Log the exception properly
             print(f"Failed to load file {file.name}: {e}")
-        finally:
-            # Ensure the temporary file is deleted
-            if temp_filename and os.path.exists(temp_filename):
-                os.remove(temp_filename)
 
     return documents
 
 
-def insert_vector_data(
+@dataclass
+class ParsingTask:
+    """An uploaded file being parsed"""
+
+    name: str
+    # documents of a file parsed while the task is prepared
+    documents: Optional[list[Document]] = None
+    # PDF file shared in memory with the parsing processes, its size,
+    # metadata and the page ranges parsed by each process
+    memory: Optional[shared_memory.SharedMemory] = None
+    size: int = 0
+    metadata: Optional[dict] = None
+    page_ranges: list[range] = field(default_factory=list)
+
+    def close(self):
+        """Release the memory shared with the parsing processes"""
+        if self.memory is not None:
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+
+def get_parsing_tasks(files: list[File]) -> list[ParsingTask]:
+    """
+    Prepare the parsing of uploaded files. A PDF file is copied once into
+    memory shared with the parsing processes, which parse its page ranges
+    from there. Other files are parsed right away.
+    """
+    tasks = []
+    for file in files:
+        task = ParsingTask(file.name)
+        try:
+            with open_buffer(file.content) as buffer:
+                if os.path.splitext(file.name)[1].lower() != ".pdf":
+                    task.documents = load_buffer(file.name, buffer)
+                else:
+                    task.metadata = get_file_metadata(file.name, buffer)
+                    task.page_ranges = get_page_ranges(count_pdf_pages(buffer))
+                    task.size = buffer.nbytes
+                    task.memory = shared_memory.SharedMemory(
+                        create=True, size=buffer.nbytes
+                    )
+                    task.memory.buf[: buffer.nbytes] = buffer
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            print(f"Failed to load file {file.name}: {e}")
+            task.close()
+            continue
+        tasks.append(task)
+    return tasks
+
+
+async def parse_task(
+    task: ParsingTask, pool: ProcessPoolExecutor
+) -> list[Document]:
+    """
+    Parse the page ranges of a PDF file in parallel in the parsing pool
+    """
+    if task.documents is not None:
+        return task.documents
+    loop = asyncio.get_running_loop()
+    pages = await asyncio.gather(
+        *(
+            loop.run_in_executor(
+                pool, read_shared_pdf_pages, task.memory.name, task.size, page_range
+            )
+            for page_range in task.page_ranges
+        )
+    )
+    return create_page_documents(
+        task.metadata, [page for range_pages in pages for page in range_pages]
+    )
+
+
+async def load_documents(files: list[File]) -> list[Document]:
+    """
+    Load documents from binary files, PDF files in the parsing process pool.
+
+    Files, and page ranges of large PDF files, are parsed in parallel.
+    The documents keep the order of the files and of their pages, and
+    a file failing to parse is reported and skipped.
+    """
+    if PARSING_WORKERS <= 0:
+        return await run.io_bound(get_documents_from_binaries, files)
+
+    tasks = await run.io_bound(get_parsing_tasks, files)
+    try:
+        pool = get_parsing_pool()
+        results = await asyncio.gather(
+            *(parse_task(task, pool) for task in tasks), return_exceptions=True
+        )
+    finally:
+        for task in tasks:
+            task.close()
+
+    documents = []
+    for task, result in zip(tasks, results):
+        if isinstance(result, BaseException):
+            print(f"Failed to load file {task.name}: {result}")
+            if isinstance(result, BrokenProcessPool):
+                # a crashed worker breaks the pool, the next upload starts a new one
+                shutdown_parsing_pool()
+            continue
+        documents.extend(result)
+    return documents
+
+
+def get_file_hashes(files: list[File]) -> dict[str, str]:
+    """
+    Get the hash of the content of every uploaded file, by file name
+    """
+    hashes = {}
+    for file in files:
+        with open_buffer(file.content) as buffer:
+            hashes[file.name] = hashlib.sha256(buffer).hexdigest()
+    return hashes
+
+
+def set_document_hashes(documents: list[Document], hashes: dict[str, str]):
+    """
+    Record the hash of their file in the documents, kept out of the
+    embedded and prompted text
+    """
+    for document in documents:
+        document.metadata[DOC_HASH_KEY] = hashes[document.metadata[FILE_NAME_KEY]]
+        document.excluded_embed_metadata_keys.append(DOC_HASH_KEY)
+        document.excluded_llm_metadata_keys.append(DOC_HASH_KEY)
+
+
+def set_chunk_ids(nodes: list[BaseNode]):
+    """
+    Derive the ids of chunks from the name of their file and the hash of their
+    text, so that a file ingested again after an edit finds its unchanged chunks.
+    Chunks repeating a text of their file are numbered, and chunks of a
+    section also depend on the section they point to.
+    """
+    occurrences = Counter()
+    for node in nodes:
+        file_name = node.metadata.get(FILE_NAME_KEY)
+        if file_name is None:
+            continue
+        text = node.get_content(MetadataMode.NONE)
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        key = (file_name, node.metadata.get(PARENT_ID_KEY, ""), text_hash)
+        content = "\0".join([*key, str(occurrences[key])])
+        node.id_ = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        occurrences[key] += 1
+
+
+def get_collection_manifest(collection: chromadb.Collection) -> dict[str, dict]:
+    """
+    Get the manifest of a collection: the content hash and the chunk ids of
+    every stored file, by file name. The manifest of a collection stored
+    before manifests existed is built once from its chunks.
+    """
+    metadata = collection.metadata if isinstance(collection.metadata, dict) else {}
+    if MANIFEST_KEY in metadata:
+        return json.loads(metadata[MANIFEST_KEY])
+
+    manifest = {}
+    if collection.count():
+        stored = collection.get(include=["metadatas"])
+        for chunk_id, chunk_metadata in zip(stored["ids"], stored["metadatas"] or []):
+            if not chunk_metadata or FILE_NAME_KEY not in chunk_metadata:
+                continue
+            entry = manifest.setdefault(
+                chunk_metadata[FILE_NAME_KEY],
+                {"hash": chunk_metadata.get(DOC_HASH_KEY), "chunks": []},
+            )
+            entry["chunks"].append(chunk_id)
+        set_collection_manifest(collection, manifest)
+    return manifest
+
+
+def set_collection_manifest(collection: chromadb.Collection, manifest: dict[str, dict]):
+    """
+    Store the manifest of a collection in its metadata
+    """
+    metadata = collection.metadata if isinstance(collection.metadata, dict) else {}
+    collection.modify(metadata={**metadata, MANIFEST_KEY: json.dumps(manifest)})
+
+
+def get_vector_manifest(chat_id: int) -> dict[str, str]:
+    """
+    Get the content hash of every file stored in a chat's collection, by file name
+    """
+    collection = get_chroma_collection(get_vector_collection_name(chat_id))
+    return {
+        name: entry["hash"]
+        for name, entry in get_collection_manifest(collection).items()
+        if entry["hash"]
+    }
+
+
+def sync_file_chunks(
+    collection: chromadb.Collection, nodes: list[BaseNode], manifest: dict[str, dict]
+) -> list[BaseNode]:
+    """
+    Delete the stored chunks of the nodes' files which are not among the
+    nodes any more, and get the nodes which are not stored yet.
+    The manifest lists the nodes' files with their new chunks.
+    """
+    files = defaultdict(list)
+    for node in nodes:
+        if FILE_NAME_KEY in node.metadata:
+            files[node.metadata[FILE_NAME_KEY]].append(node)
+    if not files:
+        return nodes
+
+    stored, stale = set(), []
+    for name, file_nodes in files.items():
+        node_ids = {node.node_id for node in file_nodes}
+        for chunk_id in manifest.get(name, {}).get("chunks", []):
+            if chunk_id in node_ids:
+                stored.add(chunk_id)
+            else:
+                stale.append(chunk_id)
+        manifest[name] = {
+            "hash": file_nodes[0].metadata.get(DOC_HASH_KEY),
+            "chunks": [node.node_id for node in file_nodes],
+        }
+    if stale:
+        collection.delete(ids=stale)
+    return [node for node in nodes if node.node_id not in stored]
+
+
+def delete_file_chunks(
+    collection: chromadb.Collection, names: list[str], manifest: dict[str, dict]
+):
+    """
+    Delete the stored chunks of files removed from a chat, and remove them
+    from the manifest
+    """
+    if names:
+        collection.delete(where={FILE_NAME_KEY: {"$in": names}})
+        for name in names:
+            manifest.pop(name, None)
+
+
+def create_parent_child_nodes(
+    documents: list[Document],
+    chunk_size=256,
+    chunk_overlap=20,
+    parent_chunk_size=1024,
+) -> tuple[list[BaseNode], list[BaseNode]]:
+    """
+    Split documents into parent sections and the small chunks of each
+    section, every chunk pointing to its section
+    """
+    parents = SentenceSplitter(
+        chunk_size=parent_chunk_size, chunk_overlap=chunk_overlap
+    ).get_nodes_from_documents(documents)
+    set_chunk_ids(parents)
+    splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    children = []
+    for parent in parents:
+        # chunks keep the document as their source, and point to their section
+        for child in splitter.get_nodes_from_documents([parent]):
+            child.metadata[PARENT_ID_KEY] = parent.node_id
+            child.excluded_embed_metadata_keys.append(PARENT_ID_KEY)
+            child.excluded_llm_metadata_keys.append(PARENT_ID_KEY)
+            children.append(child)
+    return parents, children
+
+
+def insert_parent_nodes(
+    chat_id: int, parents: list[BaseNode], removed_files: Optional[list[str]] = None
+):
+    """
+    Store the parent sections of a chat's chunks in their own collection.
+    Sections are fetched by id and never searched, so they are not embedded.
+    """
+    if not parents and not removed_files:
+        return
+    collection = get_chroma_collection(get_parent_collection_name(chat_id))
+    manifest = get_collection_manifest(collection)
+    delete_file_chunks(collection, removed_files or [], manifest)
+    pending = sync_file_chunks(collection, parents, manifest)
+    if pending:
+        collection.upsert(
+            ids=[parent.node_id for parent in pending],
+            documents=[parent.text for parent in pending],
+            metadatas=[
+                {
+                    key: value
+                    for key, value in parent.metadata.items()
+                    if isinstance(value, (str, int, float, bool))
+                }
+                or None
+                for parent in pending
+            ],
+            embeddings=[[0.0] for _ in pending],
+        )
+    set_collection_manifest(collection, manifest)
+
+
+async def ainsert_vector_data(
     chat_id: int,
     documents: list[Document],
     model=LlmModel.GPT4O_MINI,
     chunk_size=1024,
     chunk_overlap=20,
+    parent_chunk_size: Optional[int] = None,
+    removed_files: Optional[list[str]] = None,
 ) -> VectorStoreIndex:
     """
-    Insert data into ChromaDB and create a VectorStoreIndex
+    Insert data into ChromaDB and create a VectorStoreIndex.
+    With a parent chunk size, small chunks are embedded for precise matching
+    and retrieved as the larger parent sections they belong to.
+    Chunks already stored are kept, the chunks of the documents' files which
+    changed and of the removed files are deleted.
+    Chunks are embedded in concurrent batches on the running event loop,
+    the blocking splitting and storage run in threads.
     """
-    chroma_collection = get_chroma_collection("chat-" + str(chat_id))
+    collection_name = get_vector_collection_name(chat_id)
+    chroma_collection = await run.io_bound(get_chroma_collection, collection_name)
 
     print(chroma_collection)
 
     embedding_model = LlmFactory.create_embedding_model(model)
+    limit_client_retries(embedding_model)
 
     vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
     storage_context = StorageContext.from_defaults(vector_store=vector_store)
+    if not documents and not removed_files:
+        return VectorStoreIndex.from_vector_store(
+            vector_store, embed_model=embedding_model
+        )
 
-    # by default, the LlamaIndex applys transformation to the documents including splitting
-    LlamaIndexSettings.chunk_size = chunk_size
-    LlamaIndexSettings.chunk_overlap = chunk_overlap
-    return VectorStoreIndex.from_documents(
-        documents, storage_context=storage_context, embed_model=embedding_model
+    try:
+        nodes, manifest = await run.io_bound(
+            split_vector_nodes,
+            chat_id,
+            chroma_collection,
+            documents,
+            chunk_size,
+            chunk_overlap,
+            parent_chunk_size,
+            removed_files,
+        )
+        await embed_nodes(nodes, model, embedding_model)
+        # the chunks are embedded, the index only stores them
+        index = await run.io_bound(
+            VectorStoreIndex,
+            nodes,
+            storage_context=storage_context,
+            embed_model=embedding_model,
+        )
+        # the manifest only lists the new chunks once they are all stored
+        await run.io_bound(set_collection_manifest, chroma_collection, manifest)
+        return index
+    finally:
+        await run.io_bound(
+            invalidate_collection, collection_name, chroma_collection.name
+        )
+
+
+def split_vector_nodes(
+    chat_id: int,
+    chroma_collection: chromadb.Collection,
+    documents: list[Document],
+    chunk_size: int,
+    chunk_overlap: int,
+    parent_chunk_size: Optional[int] = None,
+    removed_files: Optional[list[str]] = None,
+) -> tuple[list[BaseNode], dict[str, dict]]:
+    """
+    Split documents into the chunks to embed, dropping the stored chunks of
+    the changed and removed files and keeping the chunks already stored.
+    The manifest of the collection is returned with the chunks of the
+    documents' files.
+    """
+    if parent_chunk_size:
+        parents, nodes = create_parent_child_nodes(
+            documents, chunk_size, chunk_overlap, parent_chunk_size
+        )
+        insert_parent_nodes(chat_id, parents, removed_files)
+    else:
+        nodes = SentenceSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap
+        ).get_nodes_from_documents(documents)
+    set_chunk_ids(nodes)
+    manifest = get_collection_manifest(chroma_collection)
+    delete_file_chunks(chroma_collection, removed_files or [], manifest)
+    return sync_file_chunks(chroma_collection, nodes, manifest), manifest
+
+
+def insert_vector_data(
+    chat_id: int,
+    documents: list[Document],
+    model=LlmModel.GPT4O_MINI,
+    chunk_size=1024,
+    chunk_overlap=20,
+    parent_chunk_size: Optional[int] = None,
+    removed_files: Optional[list[str]] = None,
+) -> VectorStoreIndex:
+    """
+    Insert data into ChromaDB and create a VectorStoreIndex, from code
+    without a running event loop. Async code awaits ainsert_vector_data.
+    """
+    return asyncio.run(
+        ainsert_vector_data(
+            chat_id,
+            documents,
+            model,
+            chunk_size,
+            chunk_overlap,
+            parent_chunk_size,
+            removed_files,
+        )
     )
 
 
@@ -130,8 +855,20 @@ def delete_vector_data(chat_id: int):
     """
     Delete data from ChromaDB
     """
+    collection_name = get_vector_collection_name(chat_id)
+    parent_collection_name = get_parent_collection_name(chat_id)
     chroma_client = get_chroma_client()
-    chroma_client.delete_collection("chat-" + str(chat_id))
+    try:
+        chroma_client.delete_collection(collection_name)
+        try:
+            chroma_client.delete_collection(parent_collection_name)
+        except NotFoundError:
+            # only chats inserted with parent sections have them
+            pass
+    finally:
+        evict_chroma_collection(collection_name)
+        evict_chroma_collection(parent_collection_name)
+        retrieval_cache.invalidate(collection_name)
 
 
 def get_exponetial_backoff(retry_times: int, base_sleep_time: int):
@@ -242,23 +979,27 @@ def insert_graph_data(
     LlamaIndexSettings.chunk_overlap = chunk_overlap
     LlamaIndexSettings.embed_model = LlmFactory.create_embedding_model(model)
 
-    space_name = "chat_" + str(chat_id)
+    space_name = get_graph_space_name(chat_id)
 
     create_nebula_space(space_name)
     storage_context = get_nebula_storage_context(space_name)
 
-    return KnowledgeGraphIndex.from_documents(
-        documents,
-        storage_context=storage_context,
-        max_triplets_per_chunk=10,
-    )
+    try:
+        return KnowledgeGraphIndex.from_documents(
+            documents,
+            storage_context=storage_context,
+            max_triplets_per_chunk=10,
+        )
+    finally:
+        retrieval_cache.invalidate(space_name)
 
 
 def delete_graph_data(chat_id: int):
     """
     Delete data from NebulaDB
     """
-    space_name = "chat_" + str(chat_id)
+    space_name = get_graph_space_name(chat_id)
+    retrieval_cache.invalidate(space_name)
     conn = Connection()
     conn.open(NEBULA_ADDRESS, NEBULA_PORT, 1000)
     auth_result = conn.authenticate(NEBULA_USER, NEBULA_PASSWORD)
@@ -269,6 +1010,63 @@ def delete_graph_data(chat_id: int):
     conn.close()
 
 
+async def insert_vector_files(
+    chat_id: int,
+    files: list[File],
+    model=LlmModel.GPT4O_MINI,
+    chunk_size=1024,
+    chunk_overlap=20,
+    parent_chunk_size: Optional[int] = None,
+    replace=False,
+    task_id: Optional[int] = None,
+) -> VectorStoreIndex:
+    """
+    Insert the files whose content is not stored yet into a chat's collection.
+    With replace, the files are the chat's whole corpus and the chunks of
+    the other files are deleted. With a task, the chat shares the collection
+    of the task, so that documents are only ingested once for all its chats;
+    its files cannot be replaced then, since they are the other chats' too.
+    """
+    if replace and task_id is not None:
+        raise ValueError("Files of a collection shared by a task cannot be replaced")
+
+    collection_name = get_vector_collection_name(chat_id)
+    if task_id is not None:
+        collection_name = get_task_collection_name(
+            task_id, model, chunk_size, chunk_overlap, parent_chunk_size
+        )
+        await run.io_bound(link_chat_collections, chat_id, collection_name)
+
+    async with _ingestion_locks[collection_name]:
+        hashes = await run.io_bound(get_file_hashes, files)
+        manifest = await run.io_bound(get_vector_manifest, chat_id)
+        if not hashes and not manifest:
+            raise ValueError("No documents to insert")
+        changed = [
+            file for file in files if manifest.get(file.name) != hashes[file.name]
+        ]
+        removed = sorted(set(manifest) - set(hashes)) if replace else []
+
+        documents = await load_documents(changed)
+        set_document_hashes(documents, hashes)
+        index = await ainsert_vector_data(
+            chat_id,
+            documents,
+            model,
+            chunk_size,
+            chunk_overlap,
+            parent_chunk_size,
+            removed,
+        )
+
+    stored = (set(manifest) | set(hashes)) - set(removed)
+    recorded = set(await get_file_names_by_chat(chat_id))
+    await create_files(chat_id, sorted(stored - recorded))
+    if removed:
+        await delete_files_by_names(chat_id, removed)
+    return index
+
+
 async def insert_data(
     chat_id: int,
     files: list[File],
@@ -276,25 +1074,49 @@ async def insert_data(
     model=LlmModel.GPT4O_MINI,
     chunk_size=1024,
     chunk_overlap=20,
+    parent_chunk_size: Optional[int] = None,
+    replace=False,
+    task_id: Optional[int] = None,
 ) -> BaseIndex:
     """
-    Insert data into knowledge database based on the specified technique
+    Insert data into knowledge database based on the specified technique.
+    With a parent chunk size, vector chunks are retrieved as their parent
+    sections. Vector data is inserted incrementally: unchanged files are
+    skipped and, with replace, the files missing from files are deleted.
+    With a task, vector data is shared by the chats of the task and cannot
+    be replaced.
     """
-    documents = get_documents_from_binaries(files)
-    document_names = [file.name for file in files]
-
     match technique:
         case RagTechnique.VECTOR:
-            index = await run.io_bound(
-                insert_vector_data, chat_id, documents, model, chunk_size, chunk_overlap
+            index = await insert_vector_files(
+                chat_id,
+                files,
+                model,
+                chunk_size,
+                chunk_overlap,
+                parent_chunk_size,
+                replace,
+                task_id,
+            )
+        case RagTechnique.HYBRID:
+            index = await insert_vector_files(
+                chat_id,
+                files,
+                model,
+                chunk_size,
+                chunk_overlap,
+                parent_chunk_size,
+                replace,
+                task_id,
             )
+            await run.io_bound(get_lexical_index, chat_id)
         case RagTechnique.GRAPH:
+            documents = await load_documents(files)
             index = await run.io_bound(
                 insert_graph_data, chat_id, documents, model, chunk_size, chunk_overlap
             )
+            await create_files(chat_id, [file.name for file in files])
         case _:
             raise ValueError("Invalid technique")
 
-    await create_files(chat_id, document_names)
-
     return index
@@ -57,6 +57,24 @@ async def get_files_by_chat(chat_id: int, page=0, limit=10) -> List[File]:
         return (await session.scalars(stmt)).all()
 
 
+async def get_file_names_by_chat(chat_id: int) -> List[str]:
+    """
+    Get the names of every file within a chat
+    """
+    async with Session() as session:
+        stmt = select(File.name).where(File.chat_id == chat_id)
+        return (await session.scalars(stmt)).all()
+
+
+async def delete_files_by_names(chat_id: int, names: List[str]):
+    """
+    Delete the files of a chat with the given names
+    """
+    async with Session.begin() as session:
+        stmt = delete(File).where(File.chat_id == chat_id, File.name.in_(names))
+        await session.execute(stmt)
+
+
 async def delete_file_by_id(file_id: int):
     """
     Delete a file by id
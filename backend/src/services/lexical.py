@@ -0,0 +1,110 @@
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import chromadb
+
+from .registry import Registry
+
+# Words, numbers and identifiers such as part numbers ("ab-12.5") or drug names
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split a text into lowercase terms, keeping identifiers in one piece
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    In-memory inverted index scoring chunks with Okapi BM25, so that exact
+    terms which embeddings tend to miss can be retrieved.
+    """
+
+    def __init__(
+        self,
+        texts: List[str],
+        metadatas: Optional[List[Optional[dict]]] = None,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        """
+        :param texts: The texts of the chunks.
+        :type texts: List[str]
+        :param metadatas: The metadata of the chunks.
+        :type metadatas: Optional[List[Optional[dict]]]
+        :param k1: Term frequency saturation.
+        :type k1: float
+        :param b: Document length normalisation.
+        :type b: float
+        """
+        self.texts = texts
+        self.metadatas = metadatas or [None] * len(texts)
+        self.k1 = k1
+        self.b = b
+
+        # term -> [(chunk position, term frequency)]
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.lengths: List[int] = []
+        for position, text in enumerate(texts):
+            terms = tokenize(text)
+            self.lengths.append(len(terms))
+            for term, frequency in Counter(terms).items():
+                self.postings[term].append((position, frequency))
+        self.average_length = sum(self.lengths) / len(self.lengths) if texts else 0.0
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def idf(self, term: str) -> float:
+        """
+        Inverse document frequency of a term
+        """
+        frequency = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.texts) - frequency + 0.5) / (frequency + 0.5))
+
+    def search(self, query: str, top_k: int = 3) -> List[Tuple[int, float]]:
+        """
+        Get the positions and scores of the chunks best matching the query
+        """
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for position, frequency in postings:
+                normalisation = self.k1 * (
+                    1 - self.b + self.b * self.lengths[position] / self.average_length
+                )
+                scores[position] += (
+                    idf * frequency * (self.k1 + 1) / (frequency + normalisation)
+                )
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+
+def build_lexical_index(collection: chromadb.Collection) -> BM25Index:
+    """
+    Build the BM25 index of the chunks stored in a ChromaDB collection
+    """
+    result = collection.get(include=["documents", "metadatas"])
+    return BM25Index(result["documents"] or [], result["metadatas"])
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """
+    Fuse rankings of the same items, each item scoring 1 / (k + rank)
+    in every ranking it appears in
+    """
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] += 1 / (k + rank)
+    return sorted(scores, key=lambda item: scores[item], reverse=True)
+
+
+# BM25 indexes of the chats' vector collections
+lexical_indexes = Registry()
@@ -0,0 +1,49 @@
+"""
+Parsing of PDF pages, apart from the ETL service so that the processes of
+the parsing pool only import PyMuPDF.
+"""
+
+from multiprocessing import shared_memory
+from typing import Optional
+
+import fitz  # PyMuPDF
+
+
+def count_pdf_pages(buffer: memoryview) -> int:
+    """
+    Count the pages of a PDF file
+    """
+    with fitz.open(stream=buffer, filetype="pdf") as pdf:
+        return len(pdf)
+
+
+def read_pdf_pages(
+    buffer: memoryview, pages: Optional[range] = None
+) -> list[tuple[str, str]]:
+    """
+    Read the label and the text of every page of a PDF file, or of the given
+    pages only
+    """
+    with fitz.open(stream=buffer, filetype="pdf") as pdf:
+        return [
+            (page.get_label() or str(page.number + 1), page.get_text())
+            for page in (pdf if pages is None else (pdf[number] for number in pages))
+        ]
+
+
+def read_shared_pdf_pages(
+    memory_name: str, size: int, pages: Optional[range] = None
+) -> list[tuple[str, str]]:
+    """
+    Read pages of a PDF file the parent process shares in memory, in a
+    process of the parsing pool
+    """
+    memory = shared_memory.SharedMemory(name=memory_name)
+    try:
+        buffer = memory.buf[:size]
+        try:
+            return read_pdf_pages(buffer, pages)
+        finally:
+            buffer.release()
+    finally:
+        memory.close()
@@ -0,0 +1,134 @@
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Tuple
+
+from langchain.schema import HumanMessage
+
+from backend.src.constants import LlmModel, QueryExpansion
+from backend.src.llm.llm_utils import query as query_llm
+from backend.src.llm.models import LlmFactory
+from backend.src.models import Message, MessageRole
+
+# Cheap model writing the reformulations and hypothetical answers
+QUERY_EXPANSION_MODEL = os.getenv("QUERY_EXPANSION_MODEL", LlmModel.GPT4O_MINI.value)
+# Number of reformulations of a multi-query expansion
+QUERY_EXPANSION_COUNT = int(os.getenv("QUERY_EXPANSION_COUNT", "3"))
+# Number of the latest messages given to the rewriting model
+QUERY_EXPANSION_HISTORY = int(os.getenv("QUERY_EXPANSION_HISTORY", "4"))
+
+# Numbering and bullets the model may write before each reformulation
+LIST_MARKER_PATTERN = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+logger = logging.getLogger(__name__)
+# pylint: disable=line-too-long
+
+
+@contextmanager
+def log_latency(stage: str, chat_id: int) -> Iterator[None]:
+    """
+    Log the time taken by a stage of the retrieval of a chat
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        logger.info(
+            "Chat %s: %s took %.3fs", chat_id, stage, time.perf_counter() - started
+        )
+
+
+def get_expansion_history(chat_histories: List[Message]) -> Tuple[str, ...]:
+    """
+    Get the latest messages of the conversation given to the rewriting model
+    """
+    messages = [
+        f"{message.role.name}:{message.content}"
+        for message in chat_histories
+        if message.role != MessageRole.SYSTEM
+    ]
+    return tuple(messages[-QUERY_EXPANSION_HISTORY:]) if QUERY_EXPANSION_HISTORY else ()
+
+
+def get_multi_query_prompt(query: str, history: Tuple[str, ...]) -> List[HumanMessage]:
+    """
+    Create a prompt rewriting a question into several search queries
+    """
+    conversation = "\n".join(history)
+    return [
+        HumanMessage(
+            content=f"""<Instruction> Rewrite the question below into {QUERY_EXPANSION_COUNT} different search queries which retrieve the documents needed to answer it. Each query must be understandable without the conversation. Write one query per line, without numbering or any other text. </Instruction>
+Conversation:
+{conversation}
+Question: {query}"""
+        )
+    ]
+
+
+def get_hyde_prompt(query: str, history: Tuple[str, ...]) -> List[HumanMessage]:
+    """
+    Create a prompt writing a hypothetical document answering a question
+    """
+    conversation = "\n".join(history)
+    return [
+        HumanMessage(
+            content=f"""<Instruction> Write a short passage of a reference document which answers the question below. Only write the passage. </Instruction>
+Conversation:
+{conversation}
+Question: {query}"""
+        )
+    ]
+
+
+def parse_queries(query: str, response: str) -> List[str]:
+    """
+    Parse the reformulations written one per line, without duplicates
+    """
+    queries = [query]
+    for line in response.splitlines():
+        reformulation = LIST_MARKER_PATTERN.sub("", line).strip()
+        if reformulation and reformulation.lower() not in (q.lower() for q in queries):
+            queries.append(reformulation)
+    return queries[: QUERY_EXPANSION_COUNT + 1]
+
+
+async def expand_query(
+    query: str,
+    chat_histories: List[Message],
+    expansion: QueryExpansion,
+) -> List[str]:
+    """
+    Expand a query into the queries to search the knowledge base with.
+
+    :param query: The user's query.
+    :type query: str
+    :param chat_histories: The messages of the chat before the query.
+    :type chat_histories: List[Message]
+    :param expansion: The query expansion technique.
+    :type expansion: QueryExpansion
+    :return: The query followed by its reformulations with MULTI_QUERY,
+        or by a hypothetical answer with HYDE.
+    :rtype: List[str]
+    """
+    history = get_expansion_history(chat_histories)
+    match expansion:
+        case QueryExpansion.MULTI_QUERY:
+            prompt = get_multi_query_prompt(query, history)
+        case QueryExpansion.HYDE:
+            prompt = get_hyde_prompt(query, history)
+        case _:
+            return [query]
+
+    llm = LlmFactory.create_llm(LlmModel(QUERY_EXPANSION_MODEL), temperature=0)
+    try:
+        [response] = await query_llm(llm, prompt)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        # retrieval goes on with the query alone
+        print(f"Failed to expand the query: {e}")
+        return [query]
+
+    if expansion == QueryExpansion.HYDE:
+        return [query, response.strip()] if response.strip() else [query]
+    return parse_queries(query, response)
@@ -1,7 +1,16 @@
-from typing import List, Optional
+import asyncio
+import functools
+import json
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
 
+from llama_index.core import QueryBundle
 from llama_index.core import Settings as LlamaIndexSettings
 from llama_index.core import VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding
 from llama_index.core.indices.base import BaseIndex
 from llama_index.core.retrievers import (
     KnowledgeGraphRAGRetriever,
@@ -9,84 +18,379 @@ from llama_index.core.retrievers import (
 )
 from llama_index.vector_stores.chroma import ChromaVectorStore
 
-from backend.src.constants import LlmModel, RagTechnique
+from backend.src.constants import LlmModel, QueryExpansion, RagTechnique
 from backend.src.llm.models import LlmFactory
+from backend.src.models import Message
 from backend.src.services.etl import (
+    PARENT_ID_KEY,
     get_chroma_collection,
+    get_graph_space_name,
+    get_lexical_index,
     get_nebula_storage_context,
+    get_parent_collection_name,
+    get_vector_collection_name,
 )
+from backend.src.services.lexical import reciprocal_rank_fusion
+from backend.src.services.query_expansion import (
+    expand_query,
+    get_expansion_history,
+    log_latency,
+)
+from backend.src.services.registry import embedding_models, vector_indexes
+from backend.src.services.rerank import (
+    RERANK_CANDIDATES,
+    fit_token_budget,
+    get_reranker,
+    rerank,
+)
+from backend.src.services.retrieval_cache import normalise_query, retrieval_cache
+from backend.src.services.singleflight import SingleFlight
 
+VECTOR_IO_WORKERS = int(os.getenv("VECTOR_IO_WORKERS", "8"))
+# Number of candidates per top k retrieved by each search of the hybrid retrieval
+HYBRID_CANDIDATE_FACTOR = int(os.getenv("HYBRID_CANDIDATE_FACTOR", "2"))
+# Minimum similarity of retrieved chunks, questions without any chunk clearing
+# it are answered without the LLM. 0 keeps every chunk.
+MIN_RETRIEVAL_SCORE = float(os.getenv("MIN_RETRIEVAL_SCORE", "0"))
+# Maximum number of tokens of the parent sections chunks are expanded to
+PARENT_TOKEN_BUDGET = int(os.getenv("PARENT_TOKEN_BUDGET", "3000"))
 
-async def query_vector(
+# Identical retrievals issued concurrently share a single query
+_retrieval_flights = SingleFlight()
+# The vector store client is synchronous, its calls run in a bounded pool
+# so that they never block the event loop serving the UI
+_vector_io_pool = ThreadPoolExecutor(
+    max_workers=VECTOR_IO_WORKERS, thread_name_prefix="vector-io"
+)
+
+
+async def run_vector_io(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking vector store call in the vector I/O pool
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        _vector_io_pool, functools.partial(func, *args, **kwargs)
+    )
+
+
+def get_embedding_model(model=LlmModel.GPT4O_MINI) -> BaseEmbedding:
+    """
+    Get the embedding model of the LLM, shared by every chat
+    """
+    return embedding_models.get(
+        model, lambda: LlmFactory.create_embedding_model(model)
+    )
+
+
+def get_vector_index(chat_id: int, model=LlmModel.GPT4O_MINI) -> VectorStoreIndex:
+    """
+    Get the ready to query index of a chat's vector collection, which is
+    reused by every query until the collection changes or it is idle
+    """
+    collection_name = get_vector_collection_name(chat_id)
+
+    def create_index() -> VectorStoreIndex:
+        collection = get_chroma_collection(collection_name)
+        vector_store = ChromaVectorStore(chroma_collection=collection)
+        return VectorStoreIndex.from_vector_store(
+            vector_store=vector_store, embed_model=get_embedding_model(model)
+        )
+
+    return vector_indexes.get((chat_id, model), create_index, collection_name)
+
+
+def format_context(text: str, metadata: Optional[dict]) -> str:
+    """
+    Format a retrieved chunk as a context, followed by its images if any
+    """
+    text_context = f"""{text}"""
+    if metadata and "image_paths" in metadata:
+        text_context += f"""###IMAGES_START###{metadata["image_paths"]}###IMAGES_END###"""
+    return text_context
+
+
+@dataclass
+class RetrievedChunk:
+    """A chunk retrieved from the vector database"""
+
+    text: str
+    score: Optional[float] = None
+    document_id: Optional[str] = None
+    # position of the chunk's first character in its document
+    position: Optional[int] = None
+    image_paths: Optional[str] = None
+    # parent section of the chunk, when inserted with parent sections
+    parent_id: Optional[str] = None
+
+    @property
+    def context(self) -> str:
+        """The chunk formatted as a context"""
+        return format_context(
+            self.text, {"image_paths": self.image_paths} if self.image_paths else None
+        )
+
+
+def to_chunk(text: str, metadata: Optional[dict], **kwargs) -> RetrievedChunk:
+    """
+    Create a retrieved chunk from its text and metadata
+    """
+    metadata = metadata if isinstance(metadata, dict) else {}
+    return RetrievedChunk(
+        text=text,
+        image_paths=metadata.get("image_paths"),
+        parent_id=metadata.get(PARENT_ID_KEY),
+        **kwargs,
+    )
+
+
+def get_parent_sections(chat_id: int, parent_ids: List[str]) -> Dict[str, str]:
+    """
+    Get the formatted parent sections of a chat by id, in one lookup
+    """
+    if not parent_ids:
+        return {}
+    result = get_chroma_collection(get_parent_collection_name(chat_id)).get(
+        ids=parent_ids, include=["documents", "metadatas"]
+    )
+    return {
+        parent_id: format_context(text, metadata)
+        for parent_id, text, metadata in zip(
+            result["ids"], result["documents"], result["metadatas"]
+        )
+    }
+
+
+def expand_to_parents(
+    chunks: List[RetrievedChunk], parents: Dict[str, str], token_budget: int
+) -> List[str]:
+    """
+    Replace chunks with their parent sections, each section kept once at the
+    rank of its first chunk, within the token budget
+    """
+    contexts = list(
+        dict.fromkeys(parents.get(chunk.parent_id, chunk.context) for chunk in chunks)
+    )
+    return fit_token_budget(contexts, token_budget)
+
+
+def get_parent_contexts(
+    chat_id: int, chunks: List[RetrievedChunk], token_budget=PARENT_TOKEN_BUDGET
+) -> List[str]:
+    """
+    Expand chunks to the parent sections they belong to, each section kept
+    once at the rank of its first chunk, within the token budget. Chunks
+    without a parent section are kept as they are.
+    """
+    parent_ids = list(dict.fromkeys(chunk.parent_id for chunk in chunks))
+    parent_ids = [parent_id for parent_id in parent_ids if parent_id]
+    if not parent_ids:
+        return [chunk.context for chunk in chunks]
+    return expand_to_parents(
+        chunks, get_parent_sections(chat_id, parent_ids), token_budget
+    )
+
+
+def get_parent_contexts_batch(
+    chat_id: int,
+    chunk_rankings: List[List[RetrievedChunk]],
+    token_budget=PARENT_TOKEN_BUDGET,
+) -> List[List[str]]:
+    """
+    Expand the chunks of many queries to their parent sections as
+    get_parent_contexts does, fetching the sections of all queries at once
+    """
+    parent_ids = list(
+        dict.fromkeys(
+            chunk.parent_id
+            for chunks in chunk_rankings
+            for chunk in chunks
+            if chunk.parent_id
+        )
+    )
+    parents = get_parent_sections(chat_id, parent_ids)
+    return [
+        expand_to_parents(chunks, parents, token_budget)
+        if any(chunk.parent_id for chunk in chunks)
+        else [chunk.context for chunk in chunks]
+        for chunks in chunk_rankings
+    ]
+
+
+def clears_min_score(score: Optional[float], min_score: Optional[float]) -> bool:
+    """
+    Check whether a similarity score clears the minimum score, if any
+    """
+    return min_score is None or (score is not None and score >= min_score)
+
+
+async def query_vector_with_score(
     chat_id: int,
     query: str,
     model=LlmModel.GPT4O_MINI,
     index: Optional[VectorStoreIndex] = None,
     top_k=3,
-) -> List[str]:
-    """
-    Query the vector database
+    query_embedding: Optional[List[float]] = None,
+    min_score: Optional[float] = None,
+) -> List[RetrievedChunk]:
     """
-    collection = get_chroma_collection(f"chat-{chat_id}")
-    vector_store = ChromaVectorStore(chroma_collection=collection)
-    embedding_model = LlmFactory.create_embedding_model(model)
+    Query the vector database for the chunks most similar to the query.
 
+    :param chat_id: Chat whose vector database is queried.
+    :type chat_id: int
+    :param query: The query.
+    :type query: str
+    :param model: The LLM whose embedding model embeds the query.
+    :type model: LlmModel
+    :param index: Index to query instead of the chat's index.
+    :type index: Optional[VectorStoreIndex]
+    :param top_k: Maximum number of chunks retrieved.
+    :type top_k: int
+    :param query_embedding: Embedding of the query when already known.
+    :type query_embedding: Optional[List[float]]
+    :param min_score: Minimum similarity score of the retrieved chunks.
+    :type min_score: Optional[float]
+    :return: The retrieved chunks, from most to least similar.
+    :rtype: List[RetrievedChunk]
+    """
     if index is None:
-        index = VectorStoreIndex.from_vector_store(
-            vector_store=vector_store, embed_model=embedding_model
-        )
+        index = await run_vector_io(get_vector_index, chat_id, model)
 
     retriever = VectorIndexRetriever(
         index=index,
         similarity_top_k=top_k,
     )
-    retrieved_documents = await retriever.aretrieve(query)
-
-    text_contexts: List[str] = []
-    for doc in retrieved_documents:
-        text_context = f"""{doc.text}"""
-        if "image_paths" in doc.metadata:
-            text_context += f"""###IMAGES_START###{doc.metadata["image_paths"]}###IMAGES_END###"""
-        text_contexts.append(text_context)
+    retrieved_documents = await run_vector_io(
+        retriever.retrieve,
+        QueryBundle(query, embedding=query_embedding) if query_embedding else query,
+    )
 
+    return [
+        to_chunk(
+            doc.text,
+            doc.metadata,
+            score=doc.score,
+            document_id=doc.node.ref_doc_id,
+            position=doc.node.start_char_idx,
+        )
+        for doc in retrieved_documents
+        if clears_min_score(doc.score, min_score)
+    ]
 
-    return text_contexts
 
-async def query_vector_with_score(
+async def query_vector(
     chat_id: int,
     query: str,
     model=LlmModel.GPT4O_MINI,
     index: Optional[VectorStoreIndex] = None,
     top_k=3,
-) -> List:
+    query_embedding: Optional[List[float]] = None,
+    min_score: Optional[float] = None,
+    parent_token_budget=PARENT_TOKEN_BUDGET,
+) -> List[str]:
     """
-    Query the vector database
+    Query the vector database, with the query's embedding when already known.
+    Chunks are expanded to their parent sections, if any.
     """
-    collection = get_chroma_collection(f"chat-{chat_id}")
-    vector_store = ChromaVectorStore(chroma_collection=collection)
-    embedding_model = LlmFactory.create_embedding_model(model)
+    chunks = await query_vector_with_score(
+        chat_id, query, model, index, top_k, query_embedding, min_score
+    )
+    if not any(chunk.parent_id for chunk in chunks):
+        return [chunk.context for chunk in chunks]
+    return await run_vector_io(get_parent_contexts, chat_id, chunks, parent_token_budget)
 
-    if index is None:
-        index = VectorStoreIndex.from_vector_store(
-            vector_store=vector_store, embed_model=embedding_model
-        )
 
-    retriever = VectorIndexRetriever(
-        index=index,
-        similarity_top_k=top_k,
+async def query_lexical(
+    chat_id: int, query: str, top_k=3, parent_token_budget=PARENT_TOKEN_BUDGET
+) -> List[str]:
+    """
+    Query the BM25 index of the vector database's chunks.
+    Chunks are expanded to their parent sections, if any.
+    """
+
+    def search() -> List[str]:
+        index = get_lexical_index(chat_id)
+        chunks = [
+            to_chunk(index.texts[position], index.metadatas[position], score=score)
+            for position, score in index.search(query, top_k)
+        ]
+        return get_parent_contexts(chat_id, chunks, parent_token_budget)
+
+    return await run_vector_io(search)
+
+
+async def query_hybrid(
+    chat_id: int,
+    query: str,
+    model=LlmModel.GPT4O_MINI,
+    index: Optional[VectorStoreIndex] = None,
+    top_k=3,
+    min_score: Optional[float] = None,
+    parent_token_budget=PARENT_TOKEN_BUDGET,
+) -> List[str]:
+    """
+    Query the vector database and its BM25 index concurrently and fuse the
+    results with reciprocal rank fusion, the minimum score applying to the
+    vector results
+    """
+    candidates = top_k * HYBRID_CANDIDATE_FACTOR
+    rankings = await asyncio.gather(
+        query_vector(
+            chat_id,
+            query,
+            model,
+            index,
+            candidates,
+            min_score=min_score,
+            parent_token_budget=parent_token_budget,
+        ),
+        query_lexical(chat_id, query, candidates, parent_token_budget),
     )
-    retrieved_documents = await retriever.aretrieve(query)
+    return reciprocal_rank_fusion(list(rankings))[:top_k]
 
-    text_contexts: List = {}
-    for doc in retrieved_documents:
-        text_context = f"""{doc.text}"""
-        text_contexts.append({
-            "text": text_context,
-            "score": doc.score,
-        })
 
+async def query_expanded(
+    chat_id: int,
+    queries: List[str],
+    technique=RagTechnique.VECTOR,
+    model=LlmModel.GPT4O_MINI,
+    index: Optional[VectorStoreIndex] = None,
+    top_k=3,
+    min_score: Optional[float] = None,
+    parent_token_budget=PARENT_TOKEN_BUDGET,
+) -> List[str]:
+    """
+    Query the knowledge base with every expansion of a query: the queries are
+    embedded in one batch, searched concurrently and the results are fused
+    with reciprocal rank fusion
+    """
+    if index is None:
+        index = await run_vector_io(get_vector_index, chat_id, model)
+    with log_latency(f"embedding {len(queries)} queries", chat_id):
+        embeddings = await get_embedding_model(model).aget_text_embedding_batch(
+            queries
+        )
 
-    return text_contexts
+    searches = [
+        query_vector(
+            chat_id,
+            query,
+            model,
+            index,
+            top_k,
+            embedding,
+            min_score,
+            parent_token_budget,
+        )
+        for query, embedding in zip(queries, embeddings)
+    ]
+    if technique == RagTechnique.HYBRID:
+        searches += [
+            query_lexical(chat_id, query, top_k, parent_token_budget)
+            for query in queries
+        ]
+    with log_latency(f"{len(searches)} searches", chat_id):
+        rankings = await asyncio.gather(*searches)
+    return reciprocal_rank_fusion(list(rankings))[:top_k]
 
 
 async def query_graph(
@@ -101,7 +405,7 @@ async def query_graph(
     LlamaIndexSettings.chunk_size = 512
     LlamaIndexSettings.embed_model = LlmFactory.create_embedding_model(model)
 
-    storage_context = get_nebula_storage_context("chat_" + str(chat_id))
+    storage_context = get_nebula_storage_context(get_graph_space_name(chat_id))
 
     retriever = KnowledgeGraphRAGRetriever(
         storage_context=storage_context,
@@ -119,14 +423,262 @@ async def query_knowledge(
     model=LlmModel.GPT4O_MINI,
     index: Optional[BaseIndex] = None,
     vector_top_k=3,
+    query_expansion=QueryExpansion.NONE,
+    chat_histories: Optional[List[Message]] = None,
+    min_score: Optional[float] = MIN_RETRIEVAL_SCORE or None,
+    parent_token_budget=PARENT_TOKEN_BUDGET,
 ) -> List[str]:
     """
-    Query the knowledge base
+    Query the knowledge base, expanding the query with the latest messages
+    of the chat when a query expansion is set. Vector results scoring below
+    the minimum score are left out. Chunks inserted with parent sections are
+    expanded to their sections within the parent token budget.
     """
-    match technique:
-        case RagTechnique.VECTOR:
-            return await query_vector(chat_id, query, model, index, vector_top_k)
-        case RagTechnique.GRAPH:
-            return await query_graph(chat_id, query, model)
-        case _:
-            raise ValueError("Invalid technique")
+
+    # with a reranker, over-fetch candidates and keep the best top k of them;
+    # the model loads on first use, off the event loop
+    reranker = await run_vector_io(get_reranker)
+    top_k = max(vector_top_k, RERANK_CANDIDATES) if reranker else vector_top_k
+
+    expanded = query_expansion != QueryExpansion.NONE and technique in (
+        RagTechnique.VECTOR,
+        RagTechnique.HYBRID,
+    )
+    history = get_expansion_history(chat_histories or []) if expanded else ()
+
+    async def retrieve() -> List[str]:
+        match technique:
+            case RagTechnique.VECTOR | RagTechnique.HYBRID if expanded:
+                with log_latency(f"{query_expansion.value} expansion", chat_id):
+                    queries = await expand_query(
+                        query, chat_histories or [], query_expansion
+                    )
+                contexts = await query_expanded(
+                    chat_id,
+                    queries,
+                    technique,
+                    model,
+                    index,
+                    top_k,
+                    min_score,
+                    parent_token_budget,
+                )
+            case RagTechnique.VECTOR:
+                contexts = await query_vector(
+                    chat_id,
+                    query,
+                    model,
+                    index,
+                    top_k,
+                    min_score=min_score,
+                    parent_token_budget=parent_token_budget,
+                )
+            case RagTechnique.GRAPH:
+                return await query_graph(chat_id, query, model)
+            case RagTechnique.HYBRID:
+                contexts = await query_hybrid(
+                    chat_id, query, model, index, top_k, min_score, parent_token_budget
+                )
+            case _:
+                raise ValueError("Invalid technique")
+        if reranker is None:
+            return contexts
+        with log_latency("reranking", chat_id):
+            return await run_vector_io(
+                rerank, query, contexts, reranker, vector_top_k
+            )
+
+    key = (
+        normalise_query(query),
+        technique,
+        model,
+        vector_top_k,
+        min_score,
+        parent_token_budget,
+    )
+    if expanded:
+        # expansions depend on the conversation the query is asked in
+        key += (query_expansion, history)
+    collection = (
+        get_graph_space_name(chat_id)
+        if technique == RagTechnique.GRAPH
+        else get_vector_collection_name(chat_id)
+    )
+    if index is None:
+        results = retrieval_cache.get(collection, key)
+        if results is not None:
+            return results
+
+    version = retrieval_cache.version(collection)
+    # copy so that callers sharing a retrieval cannot modify each other's result
+    results = list(
+        await _retrieval_flights.do((collection, version, id(index), key), retrieve)
+    )
+    if index is None:
+        retrieval_cache.set(collection, version, key, results)
+    return results
+
+
+def to_retrieved_chunk(
+    text: str, metadata: Optional[dict], distance: float
+) -> RetrievedChunk:
+    """
+    Convert a chunk returned by a ChromaDB query to a retrieved chunk, with
+    the similarity score given by the vector store
+    """
+    metadata = metadata or {}
+    node = json.loads(metadata.get("_node_content") or "{}")
+    return to_chunk(
+        text,
+        metadata,
+        score=math.exp(-distance),
+        document_id=metadata.get("ref_doc_id"),
+        position=node.get("start_char_idx"),
+    )
+
+
+def query_collection_batch(
+    chat_id: int,
+    embeddings: List[List[float]],
+    top_k=3,
+    min_score: Optional[float] = None,
+) -> List[List[RetrievedChunk]]:
+    """
+    Query the vector database with many query embeddings in a single call
+    """
+    collection = get_chroma_collection(get_vector_collection_name(chat_id))
+    result = collection.query(
+        query_embeddings=embeddings,
+        n_results=top_k,
+        include=["documents", "metadatas", "distances"],
+    )
+    rankings = []
+    for texts, metadatas, distances in zip(
+        result["documents"], result["metadatas"], result["distances"]
+    ):
+        chunks = [
+            to_retrieved_chunk(text, metadata, distance)
+            for text, metadata, distance in zip(texts, metadatas, distances)
+        ]
+        rankings.append(
+            [chunk for chunk in chunks if clears_min_score(chunk.score, min_score)]
+        )
+    return rankings
+
+
+async def query_knowledge_batch(
+    chat_id: int,
+    queries: List[str],
+    technique=RagTechnique.VECTOR,
+    model=LlmModel.GPT4O_MINI,
+    vector_top_k=3,
+    min_score: Optional[float] = MIN_RETRIEVAL_SCORE or None,
+    parent_token_budget=PARENT_TOKEN_BUDGET,
+) -> List[List[str]]:
+    """
+    Query the knowledge base with many queries at once, such as the questions
+    of a dataset or of a bulk question answering job. The queries missing
+    from the retrieval cache are embedded in one batch and searched with one
+    vector database call, and the results are cached as by query_knowledge.
+
+    :param chat_id: Chat whose knowledge base is queried.
+    :type chat_id: int
+    :param queries: The queries.
+    :type queries: List[str]
+    :param technique: The RAG technique.
+    :type technique: RagTechnique
+    :param model: The LLM whose embedding model embeds the queries.
+    :type model: LlmModel
+    :param vector_top_k: Number of contexts retrieved per query.
+    :type vector_top_k: int
+    :param min_score: Minimum similarity score of the vector results.
+    :type min_score: Optional[float]
+    :param parent_token_budget: Maximum tokens of the parent sections of a query.
+    :type parent_token_budget: int
+    :return: The contexts of each query, in the order of the queries.
+    :rtype: List[List[str]]
+    """
+    if technique not in (RagTechnique.VECTOR, RagTechnique.HYBRID):
+        return list(
+            await asyncio.gather(
+                *[
+                    query_knowledge(
+                        chat_id,
+                        query,
+                        technique,
+                        model,
+                        vector_top_k=vector_top_k,
+                        min_score=min_score,
+                        parent_token_budget=parent_token_budget,
+                    )
+                    for query in queries
+                ]
+            )
+        )
+
+    reranker = await run_vector_io(get_reranker)
+    top_k = max(vector_top_k, RERANK_CANDIDATES) if reranker else vector_top_k
+    collection = get_vector_collection_name(chat_id)
+    version = retrieval_cache.version(collection)
+
+    keys = [
+        (
+            normalise_query(query),
+            technique,
+            model,
+            vector_top_k,
+            min_score,
+            parent_token_budget,
+        )
+        for query in queries
+    ]
+    results = {key: retrieval_cache.get(collection, key) for key in keys}
+    # identical queries are searched once
+    pending: dict = {}
+    for key, query in zip(keys, queries):
+        if results[key] is None:
+            pending.setdefault(key, query)
+    if pending:
+        with log_latency(f"embedding {len(pending)} queries", chat_id):
+            embeddings = await get_embedding_model(model).aget_text_embedding_batch(
+                list(pending.values())
+            )
+        candidates = (
+            top_k * HYBRID_CANDIDATE_FACTOR
+            if technique == RagTechnique.HYBRID
+            else top_k
+        )
+        with log_latency(f"searching {len(pending)} queries", chat_id):
+            chunk_rankings = await run_vector_io(
+                query_collection_batch, chat_id, embeddings, candidates, min_score
+            )
+            rankings = await run_vector_io(
+                get_parent_contexts_batch, chat_id, chunk_rankings, parent_token_budget
+            )
+            if technique == RagTechnique.HYBRID:
+                lexical_rankings = await asyncio.gather(
+                    *[
+                        query_lexical(chat_id, query, candidates, parent_token_budget)
+                        for query in pending.values()
+                    ]
+                )
+                rankings = [
+                    reciprocal_rank_fusion([vector_ranking, lexical_ranking])[:top_k]
+                    for vector_ranking, lexical_ranking in zip(
+                        rankings, lexical_rankings
+                    )
+                ]
+        if reranker is not None:
+            with log_latency(f"reranking {len(pending)} queries", chat_id):
+                rankings = await asyncio.gather(
+                    *[
+                        run_vector_io(rerank, query, contexts, reranker, vector_top_k)
+                        for query, contexts in zip(pending.values(), rankings)
+                    ]
+                )
+        for key, contexts in zip(pending, rankings):
+            results[key] = contexts
+            retrieval_cache.set(collection, version, key, contexts)
+
+    # copy so that callers cannot modify the cached results
+    return [list(results[key]) for key in keys]
@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from .retrieval_cache import retrieval_cache
+
+REGISTRY_IDLE_TTL = float(os.getenv("REGISTRY_IDLE_TTL", "900"))
+REGISTRY_MAX_ENTRIES = int(os.getenv("REGISTRY_MAX_ENTRIES", "64"))
+
+
+class Registry:
+    """
+    Per-process registry of objects which are expensive to build, such as
+    vector indexes and embedding models. Objects unused for longer than the
+    idle time to live are evicted, and objects built from a knowledge
+    collection are rebuilt once the collection's version has changed.
+    """
+
+    def __init__(
+        self,
+        idle_ttl: float = REGISTRY_IDLE_TTL,
+        max_entries: int = REGISTRY_MAX_ENTRIES,
+    ):
+        """
+        :param idle_ttl: Seconds after which an unused object is evicted.
+        :type idle_ttl: float
+        :param max_entries: Maximum number of objects kept.
+        :type max_entries: int
+        """
+        self.idle_ttl = idle_ttl
+        self.max_entries = max_entries
+        # key -> (object, collection version, last used), least recently used first
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        key: Hashable,
+        factory: Callable[[], Any],
+        collection: Optional[str] = None,
+    ) -> Any:
+        """
+        Get the object registered under the key, building it when missing,
+        idle for too long or built from an older version of the collection.
+
+        :param key: Key of the object.
+        :type key: Hashable
+        :param factory: Function building the object.
+        :type factory: Callable[[], Any]
+        :param collection: Knowledge collection the object is built from.
+        :type collection: Optional[str]
+        :return: The registered object.
+        """
+        now = time.monotonic()
+        version = retrieval_cache.version(collection) if collection else 0
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == version:
+                self._entries[key] = (entry[0], version, now)
+                self._entries.move_to_end(key)
+                return entry[0]
+
+        obj = factory()
+        with self._lock:
+            self._entries[key] = (obj, version, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return obj
+
+    def _evict_idle(self, now: float):
+        """
+        Evict the objects unused for longer than the idle time to live.
+        """
+        while self._entries:
+            key, (_, _, last_used) = next(iter(self._entries.items()))
+            if now - last_used <= self.idle_ttl:
+                return
+            del self._entries[key]
+
+    def clear(self):
+        """
+        Evict every object.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+# Ready to query vector indexes per (chat_id, model)
+vector_indexes = Registry()
+# Embedding models per model, shared by every chat
+embedding_models = Registry()
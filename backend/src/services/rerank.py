@@ -0,0 +1,143 @@
+import os
+import re
+import threading
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+from backend.src.llm.llm_utils import count_tokens
+
+from .lexical import BM25Index
+
+RERANKER = os.getenv("RERANKER", "").lower()
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_TOKEN_BUDGET = int(os.getenv("RERANK_TOKEN_BUDGET", "2000"))
+CROSS_ENCODER_MODEL = os.getenv(
+    "CROSS_ENCODER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"
+)
+
+IMAGES_PATTERN = re.compile(r"###IMAGES_START###.*?###IMAGES_END###", re.DOTALL)
+
+
+def strip_images(context: str) -> str:
+    """
+    Remove the images appended to a context
+    """
+    return IMAGES_PATTERN.sub("", context)
+
+
+class Reranker(ABC):
+    """
+    Scores retrieved contexts by their relevance to the query.
+    """
+
+    @abstractmethod
+    def score(self, query: str, contexts: List[str]) -> List[float]:
+        """Score the relevance of each context to the query"""
+
+    def rerank(self, query: str, contexts: List[str]) -> List[str]:
+        """
+        Order the contexts from most to least relevant, keeping the retrieval
+        order between contexts of the same score
+        """
+        scores = self.score(query, [strip_images(context) for context in contexts])
+        order = sorted(range(len(contexts)), key=lambda i: scores[i], reverse=True)
+        return [contexts[i] for i in order]
+
+
+class LexicalReranker(Reranker):
+    """
+    Scores contexts with BM25 over the retrieved contexts, which is cheap
+    and favours contexts containing the exact terms of the query.
+    """
+
+    def score(self, query: str, contexts: List[str]) -> List[float]:
+        scores = [0.0] * len(contexts)
+        for position, score in BM25Index(contexts).search(query, len(contexts)):
+            scores[position] = score
+        return scores
+
+
+class CrossEncoderReranker(Reranker):
+    """
+    Scores contexts with a small cross-encoder running on the CPU.
+    Requires the optional `sentence-transformers` package.
+    """
+
+    def __init__(self, model_name: str = CROSS_ENCODER_MODEL):
+        """
+        :param model_name: Name of the cross-encoder on HuggingFace.
+        :type model_name: str
+        """
+        # pylint: disable=import-outside-toplevel
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def score(self, query: str, contexts: List[str]) -> List[float]:
+        if not contexts:
+            return []
+        return [
+            float(score)
+            for score in self.model.predict([(query, context) for context in contexts])
+        ]
+
+
+def fit_token_budget(contexts: List[str], budget: int) -> List[str]:
+    """
+    Keep the leading contexts whose text fits in the token budget,
+    always keeping at least one context
+    """
+    kept, used = [], 0
+    for context in contexts:
+        tokens = count_tokens(strip_images(context))
+        if kept and used + tokens > budget:
+            break
+        kept.append(context)
+        used += tokens
+    return kept
+
+
+def _create_reranker() -> Optional[Reranker]:
+    match RERANKER:
+        case "lexical":
+            return LexicalReranker()
+        case "cross-encoder":
+            try:
+                return CrossEncoderReranker()
+            except ImportError:
+                print(
+                    "sentence-transformers is not installed, "
+                    "using the lexical reranker instead."
+                )
+                return LexicalReranker()
+        case _:
+            return None
+
+
+_reranker: Optional[Reranker] = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker() -> Optional[Reranker]:
+    """
+    Get the reranker configured by RERANKER, None when reranking is disabled
+    """
+    global _reranker  # pylint: disable=global-statement
+    if RERANKER and _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = _create_reranker()
+    return _reranker
+
+
+def rerank(
+    query: str,
+    contexts: List[str],
+    reranker: Reranker,
+    top_k: int,
+    token_budget: int = RERANK_TOKEN_BUDGET,
+) -> List[str]:
+    """
+    Keep the top k most relevant contexts that fit in the token budget
+    """
+    return fit_token_budget(reranker.rerank(query, contexts)[:top_k], token_budget)
@@ -0,0 +1,86 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional
+
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "2048"))
+
+
+def normalise_query(query: str) -> str:
+    """
+    Normalise a query so that queries differing only in case or whitespace
+    share their retrieval results.
+    """
+    return " ".join(query.lower().split())
+
+
+class RetrievalCache:
+    """
+    In-process LRU cache of retrieval results per knowledge collection.
+    Each collection has a version counter which is increased whenever its
+    data changes; results are stored under the version they were retrieved
+    from, so results of older versions can never be returned.
+    """
+
+    def __init__(self, max_entries: int = RETRIEVAL_CACHE_MAX_ENTRIES):
+        """
+        :param max_entries: Maximum number of cached retrieval results.
+        :type max_entries: int
+        """
+        self.max_entries = max_entries
+        self._versions: Dict[str, int] = {}
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def version(self, collection: str) -> int:
+        """
+        Get the current version of a collection.
+        """
+        with self._lock:
+            return self._versions.get(collection, 0)
+
+    def invalidate(self, collection: str):
+        """
+        Increase the version of a collection after its data has changed and
+        drop the results cached for it.
+        """
+        with self._lock:
+            self._versions[collection] = self._versions.get(collection, 0) + 1
+            for key in [key for key in self._entries if key[0] == collection]:
+                del self._entries[key]
+
+    def get(self, collection: str, key: Hashable) -> Optional[List[str]]:
+        """
+        Get the results cached for a query of the current collection version.
+        """
+        with self._lock:
+            entry_key = (collection, self._versions.get(collection, 0), key)
+            results = self._entries.get(entry_key)
+            if results is None:
+                return None
+            self._entries.move_to_end(entry_key)
+            return list(results)
+
+    def set(self, collection: str, version: int, key: Hashable, results: List[str]):
+        """
+        Cache the results of a query retrieved from the given collection version.
+        Results of a version that is no longer current are discarded.
+        """
+        with self._lock:
+            if version != self._versions.get(collection, 0):
+                return
+            entry_key = (collection, version, key)
+            self._entries[entry_key] = list(results)
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Drop every cached result.
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+retrieval_cache = RetrievalCache()
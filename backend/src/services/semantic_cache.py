@@ -0,0 +1,177 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional
+
+import numpy as np
+
+from backend.src.services.cache import create_digest
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "512"))
+SEMANTIC_CACHE_MAX_SCOPES = int(os.getenv("SEMANTIC_CACHE_MAX_SCOPES", "1024"))
+
+
+class _ScopeIndex:
+    """
+    Embeddings and answers of one scope. The embedding matrix grows on demand
+    and becomes a ring buffer once it holds `max_entries` answers, so that the
+    oldest answers are replaced first.
+    """
+
+    initial_capacity = 8
+
+    def __init__(self, dimension: int, max_entries: int):
+        self.max_entries = max_entries
+        self.embeddings = np.zeros(
+            (min(self.initial_capacity, max_entries), dimension), dtype=np.float32
+        )
+        self.results: List[Any] = []
+        self.size = 0
+        self.next = 0
+
+    def add(self, embedding: np.ndarray, result: Any):
+        """
+        Add a normalised embedding and its answer to the index.
+        """
+        if self.size < self.max_entries:
+            if self.size == len(self.embeddings):
+                capacity = min(2 * len(self.embeddings), self.max_entries)
+                grown = np.zeros((capacity, self.embeddings.shape[1]), np.float32)
+                grown[: self.size] = self.embeddings
+                self.embeddings = grown
+            self.embeddings[self.size] = embedding
+            self.results.append(result)
+            self.size += 1
+            return
+
+        self.embeddings[self.next] = embedding
+        self.results[self.next] = result
+        self.next = (self.next + 1) % self.max_entries
+
+    def nearest(self, embedding: np.ndarray) -> tuple[float, Any]:
+        """
+        Get the most similar answer and its cosine similarity.
+        """
+        scores = self.embeddings[: self.size] @ embedding
+        best = int(np.argmax(scores))
+        return float(scores[best]), self.results[best]
+
+
+class SemanticCache:
+    """
+    Response cache matching questions by the cosine similarity of their
+    embeddings, so that paraphrased questions reuse a previous answer.
+    Entries are grouped in scopes (chat, version of its knowledge, retrieved
+    contexts, model and technique),
+    a lookup only compares embeddings within the same scope, and the least
+    recently used scopes are dropped once there are too many of them.
+    """
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        max_scopes: int = SEMANTIC_CACHE_MAX_SCOPES,
+    ):
+        """
+        :param threshold: Minimum cosine similarity for a cached answer to be reused.
+        :type threshold: float
+        :param max_entries: Maximum number of answers kept per scope.
+        :type max_entries: int
+        :param max_scopes: Maximum number of scopes kept in memory.
+        :type max_scopes: int
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_scopes = max_scopes
+        self._scopes: OrderedDict[str, _ScopeIndex] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalise(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def get(self, scope: str, embedding: List[float]) -> Optional[Any]:
+        """
+        Get the answer of the most similar cached question in the scope.
+
+        :return: The cached answer, or None if no question is similar enough.
+        """
+        vector = self._normalise(embedding)
+        with self._lock:
+            index = self._scopes.get(scope)
+            if index is None or index.size == 0:
+                return None
+            if index.embeddings.shape[1] != vector.shape[0]:
+                return None
+            self._scopes.move_to_end(scope)
+            score, result = index.nearest(vector)
+        return result if score >= self.threshold else None
+
+    def set(self, scope: str, embedding: List[float], result: Any):
+        """
+        Cache the answer of a question in the scope.
+        """
+        vector = self._normalise(embedding)
+        with self._lock:
+            index = self._scopes.get(scope)
+            if index is None or index.embeddings.shape[1] != vector.shape[0]:
+                index = _ScopeIndex(vector.shape[0], self.max_entries)
+                self._scopes[scope] = index
+                if len(self._scopes) > self.max_scopes:
+                    self._scopes.popitem(last=False)
+            self._scopes.move_to_end(scope)
+            index.add(vector, result)
+
+    def clear(self, scope: Optional[str] = None):
+        """
+        Clear one scope, or the whole cache if no scope is given.
+        """
+        with self._lock:
+            if scope is None:
+                self._scopes.clear()
+            else:
+                self._scopes.pop(scope, None)
+
+    def clear_chats(self, chat_ids: List[int]):
+        """
+        Clear the scopes of the given chats.
+        """
+        prefixes = tuple(f"{chat_id}:" for chat_id in chat_ids)
+        with self._lock:
+            for scope in [scope for scope in self._scopes if scope.startswith(prefixes)]:
+                del self._scopes[scope]
+
+
+def create_semantic_scope(
+    chat_id: int,
+    model: str,
+    technique: str,
+    contexts: Optional[List[str]] = None,
+    version: int = 0,
+    history: Optional[List[str]] = None,
+) -> str:
+    """
+    Create the scope of a question: its chat, the version of the chat's
+    knowledge, the contexts retrieved for it in any order, the conversation
+    before it, the model and the prompting technique. Answers of a chat are
+    no longer found once its knowledge has changed, and a follow-up question
+    only matches answers given after the same conversation.
+    """
+    return ":".join(
+        [
+            str(chat_id),
+            str(version),
+            create_digest(sorted(contexts or [])),
+            create_digest(history or []),
+            model,
+            technique,
+        ]
+    )
+
+
+semantic_cache = SemanticCache()
@@ -0,0 +1,62 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Flight:
+    """
+    A call in flight and the number of callers awaiting it.
+    """
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Deduplicate concurrent calls: while a call for a key is in flight, other
+    callers with the same key await its result instead of starting their own.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Flight] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `func` unless a call with the same key is already in flight, in
+        which case the result (or exception) of that call is shared.
+
+        The call runs in its own task, so a cancelled caller does not cancel
+        it for the others; it is only cancelled once no caller awaits it.
+
+        :param key: Key identifying identical calls.
+        :type key: Hashable
+        :param func: Coroutine function producing the result.
+        :type func: Callable[[], Awaitable[Any]]
+        :return: Result of the call.
+        """
+        flight = self._calls.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.create_task(func()))
+            self._calls[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # nobody awaits the call anymore, later callers start a new one
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key: Hashable, flight: _Flight) -> None:
+        if self._calls.get(key) is flight:
+            del self._calls[key]
+
+    def in_flight(self) -> int:
+        """
+        Get the number of calls in flight.
+        """
+        return len(self._calls)
@@ -2,7 +2,7 @@ from unittest.mock import AsyncMock, patch
 
 import pytest
 
-from backend.src.constants import LlmModel, RagTechnique, Technique
+from backend.src.constants import LlmModel, QueryExpansion, RagTechnique, Technique
 from backend.src.models import Message, MessageRole
 from backend.src.prompts.techniques import TechniqueFactory
 from backend.src.services.ask import ChatService
@@ -36,7 +36,13 @@ async def test_get_response():
         )
 
         mock_ask.assert_called_once_with(
-            user_input, [], model, rag_technique, chat_id, 3
+            user_input,
+            [],
+            model,
+            rag_technique,
+            chat_id,
+            3,
+            query_expansion=QueryExpansion.NONE,
         )
 
         assert isinstance(response, Message)
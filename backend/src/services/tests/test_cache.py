@@ -0,0 +1,284 @@
+# pylint: disable=redefined-outer-name
+import json
+import os
+from unittest.mock import patch
+
+import pytest
+
+from backend.src.services import cache as cache_module
+from backend.src.services.cache import Cache, get_cache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    """
+    Cache stored in a temporary directory
+    """
+    cache = Cache(str(tmp_path))
+    yield cache
+    cache.close()
+
+
+def test_set_get_delete(cache):
+    """
+    Test basic cache operations
+    """
+    assert cache.get("missing") is None
+
+    cache.set("key", "value")
+    cache.set("other", {"answer": [1, 2]})
+    assert cache.get("key") == "value"
+    assert cache.get("other") == {"answer": [1, 2]}
+    assert len(cache) == 2
+
+    cache.set("key", "new value")
+    assert cache.get("key") == "new value"
+    assert len(cache) == 2
+
+    cache.delete("key")
+    assert cache.get("key") is None
+    cache.delete("key")
+
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_entries_are_persisted(tmp_path):
+    """
+    Test entries survive reopening the cache
+    """
+    cache = Cache(str(tmp_path))
+    cache.set("key", "value")
+    cache.close()
+
+    reopened = Cache(str(tmp_path))
+    assert reopened.get("key") == "value"
+    reopened.close()
+
+
+def test_import_legacy_json_cache(tmp_path):
+    """
+    Test a legacy cache.json file is imported on first use
+    """
+    with open(os.path.join(tmp_path, "cache.json"), "w") as f:
+        json.dump({"legacy": "answer"}, f)
+
+    cache = Cache(str(tmp_path))
+    assert cache.get("legacy") == "answer"
+
+    # the legacy file is only imported once
+    cache.delete("legacy")
+    cache.close()
+    reopened = Cache(str(tmp_path))
+    assert reopened.get("legacy") is None
+    reopened.close()
+
+
+def test_memory_lru_eviction(tmp_path):
+    """
+    Test the in-memory tier is bounded and evicts the least recently used entry
+    """
+    cache = Cache(str(tmp_path), max_entries=2, max_bytes=None)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+
+    stats = cache.stats()
+    assert stats["memory_entries"] == 2
+    assert stats["evictions"] == 1
+    assert "b" not in cache._memory  # pylint: disable=protected-access
+
+    # evicted entries are still served from disk
+    assert cache.get("b") == "2"
+    cache.close()
+
+
+def test_memory_byte_limit(tmp_path):
+    """
+    Test the in-memory tier respects the byte limit
+    """
+    cache = Cache(str(tmp_path), max_entries=None, max_bytes=20)
+    cache.set("a", "x" * 10)
+    cache.set("b", "y" * 10)
+    assert cache.stats()["memory_bytes"] <= 20
+    cache.set("big", "z" * 100)
+    assert cache.get("big") == "z" * 100
+    assert cache.stats()["memory_bytes"] <= 20
+    cache.close()
+
+
+def test_ttl_expiry(tmp_path):
+    """
+    Test entries expire after their time to live
+    """
+    cache = Cache(str(tmp_path))
+    with patch("backend.src.services.cache.time.time", return_value=1000.0):
+        cache.set("short", "value", ttl=10)
+        cache.set("forever", "value")
+        assert cache.get("short") == "value"
+
+    with patch("backend.src.services.cache.time.time", return_value=1011.0):
+        assert cache.get("short") is None
+        assert cache.get("forever") == "value"
+        assert cache.purge_expired() == 0
+    assert len(cache) == 1
+    cache.close()
+
+
+def test_hit_miss_counters(cache):
+    """
+    Test hits and misses are counted
+    """
+    cache.set("key", "value")
+    cache.get("key")
+    cache.get("missing")
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
+
+
+def test_savings_per_model(tmp_path):
+    """
+    Test hits account the latency, tokens and cost saved per model
+    """
+    cache = Cache(str(tmp_path))
+    metadata = {"model": "gpt-4o", "latency": 2.0, "tokens": 100, "cost": 0.01}
+    cache.set("key", "value", metadata=metadata)
+    cache.set("legacy", "value")
+    cache.get("key")
+    cache.get("legacy")
+    cache.close()
+
+    # metadata is read back from the database as well
+    cache = Cache(str(tmp_path))
+    cache.get("key")
+    savings = cache.stats()["savings"]
+    assert savings == {
+        "gpt-4o": {"hits": 1, "latency": 2.0, "tokens": 100, "cost": 0.01}
+    }
+    assert cache.top_keys(1) == [("key", 1)]
+    cache.close()
+
+
+def test_entries_and_delete_where(cache):
+    """
+    Test listing, searching and deleting entries by metadata
+    """
+    cache.set("a", "fever answer", metadata={"model": "m1", "technique": "io", "chat_id": 1})
+    cache.set("b", "cough answer", metadata={"model": "m1", "technique": "cot", "chat_id": 2})
+    cache.set("c", "fever again", metadata={"model": "m2", "technique": "io", "chat_id": 3})
+
+    assert {entry["key"] for entry in cache.entries(search="fever")} == {"a", "c"}
+    assert [entry["key"] for entry in cache.entries(model="m1", technique="cot")] == ["b"]
+    assert cache.size_bytes() > 0
+
+    assert cache.delete_where(model="m1", chat_ids=[1, 3]) == 1
+    assert cache.get("a") is None
+    assert cache.delete_where(technique="io") == 1
+    assert cache.get("c") is None
+    assert cache.get("b") == "cough answer"
+    assert cache.delete_where(chat_ids=[]) == 0
+    with pytest.raises(ValueError):
+        cache.delete_where()
+
+
+def test_token_usage(cache):
+    """
+    Test the average tokens and context tokens per answer of each chat
+    """
+    cache.set("a", "1", metadata={"chat_id": 1, "tokens": 100, "context_tokens": 60})
+    cache.set("b", "2", metadata={"chat_id": 1, "tokens": 200, "context_tokens": 80})
+    cache.set("c", "3", metadata={"chat_id": 2, "tokens": 50})
+    cache.set("d", "4")
+
+    assert cache.token_usage() == [
+        {"chat_id": 1, "answers": 2, "tokens": 150.0, "context_tokens": 70.0},
+        {"chat_id": 2, "answers": 1, "tokens": 50.0, "context_tokens": 0.0},
+    ]
+    assert [usage["chat_id"] for usage in cache.token_usage([2])] == [2]
+    assert cache.token_usage([]) == []
+
+
+def test_get_cache_is_shared(tmp_path, monkeypatch):
+    """
+    Test the process wide cache is only created once
+    """
+    monkeypatch.setattr(cache_module, "_shared_cache", None)
+    monkeypatch.setattr(cache_module, "CACHE_DIR", str(tmp_path))
+
+    shared = get_cache()
+    assert get_cache() is shared
+    assert shared.cache_dir == str(tmp_path)
+    shared.close()
+
+
+def test_create_cache_key(cache):
+    """
+    Test cache keys are normalised
+    """
+    assert cache.create_cache_key("GPT-4o ", " Hello") == cache.create_cache_key(
+        "gpt-4o", "hello"
+    )
+    assert cache.create_cache_key("gpt-4o", "hello") != cache.create_cache_key(
+        "gpt-4o-mini", "hello"
+    )
+
+
+def test_create_context_aware_cache_key(cache):
+    """
+    Test structured cache keys change with everything that changes the answer
+    """
+    base = {
+        "model": "gpt-4o-mini",
+        "prompt": "What is glaucoma?",
+        "technique": "cot",
+        "contexts": ["Glaucoma is an eye disease."],
+        "system_prompt": "You are a doctor.",
+        "history": ["USER:Hi", "ASSISTANT:Hello"],
+        "temperature": 0.6,
+    }
+    key = cache.create_cache_key(**base)
+    assert key == cache.create_cache_key(**base)
+    assert key != cache.create_cache_key("gpt-4o-mini", "What is glaucoma?")
+
+    variations = {
+        "technique": "got",
+        "contexts": ["Cataract is an eye disease."],
+        "system_prompt": "You are a pharmacist.",
+        "history": ["USER:Hi"],
+        "temperature": 0.0,
+    }
+    for name, value in variations.items():
+        assert key != cache.create_cache_key(**{**base, name: value}), name
+
+    # list boundaries are part of the digest
+    assert cache.create_cache_key(**{**base, "contexts": ["ab", "c"]}) != (
+        cache.create_cache_key(**{**base, "contexts": ["a", "bc"]})
+    )
+
+
+def test_items_and_put_entries(tmp_path):
+    """
+    Test entries are streamed and stored keeping the newest entry of a key
+    """
+    source = Cache(str(tmp_path / "source"))
+    source.set("a", "old", metadata={"model": "m1"})
+    source.set("b", [1, 2])
+    source.set("expired", "value", ttl=-1)
+    entries = list(source.items(batch_size=1))
+    assert [entry["key"] for entry in entries] == ["a", "b"]
+    assert entries[0]["model"] == "m1"
+
+    target = Cache(str(tmp_path / "target"))
+    target.set("a", "new")
+    assert target.put_entries(entries) == 1
+    assert target.get("a") == "new"
+    assert target.get("b") == [1, 2]
+
+    newer = dict(entries[0], value="newest", created_at=entries[0]["created_at"] + 1e6)
+    assert target.put_entries([newer]) == 1
+    assert target.get("a") == "newest"
+    source.close()
+    target.close()
@@ -0,0 +1,153 @@
+# pylint: disable=redefined-outer-name
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from backend.src.services.cache import Cache
+from backend.src.services.cache_admin import (
+    get_cache_report,
+    invalidate_cache,
+    parse_warm_questions,
+    search_cache,
+    warm_cache,
+)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    """
+    Cache stored in a temporary directory used by the admin service
+    """
+    cache = Cache(str(tmp_path))
+    with patch("backend.src.services.cache_admin.get_cache", return_value=cache):
+        yield cache
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_get_cache_report(cache):
+    """Test the report contains the counters, size and top keys"""
+    cache.set("key", "value", metadata={"model": "gpt-4o", "tokens": 10})
+    cache.get("key")
+
+    report = await get_cache_report()
+
+    assert report["entries"] == 1
+    assert report["bytes"] == len('"value"')
+    assert report["hits"] == 1
+    assert report["savings"]["gpt-4o"]["tokens"] == 10
+    assert report["top_keys"] == [("key", 1)]
+
+
+@pytest.mark.asyncio
+@patch(
+    "backend.src.services.cache_admin.get_chat_ids_by_user",
+    new_callable=AsyncMock,
+    return_value=[2],
+)
+async def test_get_cache_report_of_user(_, cache):
+    """Test the report of a user only counts the entries of their own chats"""
+    cache.set("mine", "value", metadata={"model": "gpt-4o", "tokens": 10, "chat_id": 2})
+    cache.set("other", "other", metadata={"model": "gpt-4o", "tokens": 7, "chat_id": 1})
+    for key in ("mine", "mine", "other"):
+        cache.get(key)
+
+    report = await get_cache_report(user_id=1)
+
+    assert report["entries"] == 1
+    assert report["bytes"] == len('"value"')
+    assert report["hits"] == 2
+    assert report["savings"]["gpt-4o"]["tokens"] == 20
+    assert report["top_keys"] == [("mine", 2)]
+
+
+@pytest.mark.asyncio
+@patch("backend.src.services.cache_admin.semantic_cache")
+@patch(
+    "backend.src.services.cache_admin.get_chat_ids_by_task",
+    new_callable=AsyncMock,
+    return_value=[1, 2],
+)
+async def test_invalidate_cache_by_task(_, mock_semantic_cache, cache):
+    """Test responses of the chats of a task are invalidated"""
+    for chat_id in (1, 2, 3):
+        cache.set(str(chat_id), "answer", metadata={"chat_id": chat_id})
+
+    assert await invalidate_cache(task_id=7) == 2
+
+    assert cache.get("1") is None
+    assert cache.get("3") == "answer"
+    mock_semantic_cache.clear_chats.assert_called_once_with([1, 2])
+
+
+@pytest.mark.asyncio
+@patch("backend.src.services.cache_admin.semantic_cache")
+@patch(
+    "backend.src.services.cache_admin.get_chat_ids_by_user",
+    new_callable=AsyncMock,
+    return_value=[2, 3],
+)
+@patch(
+    "backend.src.services.cache_admin.get_chat_ids_by_task",
+    new_callable=AsyncMock,
+    return_value=[1, 2],
+)
+async def test_invalidate_cache_of_user(_, __, mock_semantic_cache, cache):
+    """Test a user only invalidates the responses of their own chats"""
+    for chat_id in (1, 2, 3):
+        cache.set(str(chat_id), "answer", metadata={"chat_id": chat_id, "model": "m"})
+
+    assert await invalidate_cache(task_id=7, user_id=1) == 1
+    assert cache.get("1") == "answer"
+    assert cache.get("2") is None
+    mock_semantic_cache.clear_chats.assert_called_once_with([2])
+
+    assert await invalidate_cache(model="m", user_id=1) == 1
+    assert cache.get("1") == "answer"
+    assert cache.get("3") is None
+
+
+@pytest.mark.asyncio
+@patch(
+    "backend.src.services.cache_admin.get_chat_ids_by_user",
+    new_callable=AsyncMock,
+    return_value=[2],
+)
+async def test_search_cache_of_user(_, cache):
+    """Test a user only browses the responses of their own chats"""
+    for chat_id in (1, 2):
+        cache.set(str(chat_id), f"answer {chat_id}", metadata={"chat_id": chat_id})
+
+    entries = await search_cache(user_id=1)
+    assert [entry["value"] for entry in entries] == ["answer 2"]
+    assert len(await search_cache()) == 2
+
+
+@pytest.mark.asyncio
+@patch(
+    "backend.src.services.cache_admin.get_chat_by_id",
+    new_callable=AsyncMock,
+    return_value=MagicMock(user_id=2),
+)
+async def test_warm_cache_of_other_user(_):
+    """Test a user cannot warm the cache of another user's chat"""
+    with pytest.raises(ValueError, match="Chat 5 not found"):
+        await warm_cache(5, ["What is a fever?"], user_id=1)
+
+
+def test_parse_warm_questions():
+    """Test questions are read from the supported JSONL fields"""
+    lines = [
+        '{"question": "What is a fever?"}',
+        "",
+        '{"prompt": "What is a cough?"}',
+        '{"request_id": "1", "title": "Title", "body": "Body"}',
+        "not json",
+        '{"answer": "no question"}',
+    ]
+
+    assert parse_warm_questions(lines) == [
+        "What is a fever?",
+        "What is a cough?",
+        "Title\nBody",
+    ]
@@ -0,0 +1,46 @@
+import gzip
+import json
+
+from backend.src.services.cache import Cache
+from backend.src.services.cache_transfer import (
+    export_cache,
+    import_cache,
+    merge_exports,
+    read_entries,
+)
+
+
+def test_export_import(tmp_path):
+    """Test a cache is restored from its export with the same keys"""
+    source = Cache(str(tmp_path / "source"))
+    key = source.create_cache_key("gpt-4o", "What is a fever?")
+    source.set(key, "answer", metadata={"model": "gpt-4o", "tokens": 10})
+    path = str(tmp_path / "cache.jsonl.gz")
+
+    assert export_cache(source, path) == 1
+
+    target = Cache(str(tmp_path / "target"))
+    assert import_cache(target, [path]) == 1
+    assert target.get(target.create_cache_key("gpt-4o", "What is a fever?")) == "answer"
+    assert target.stats()["savings"]["gpt-4o"]["tokens"] == 10
+    source.close()
+    target.close()
+
+
+def test_merge_exports(tmp_path):
+    """Test exports are merged keeping the newest entry of each key"""
+    paths = []
+    for node, created_at in (("node1", 1.0), ("node2", 2.0)):
+        path = str(tmp_path / f"{node}.jsonl.gz")
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps({"key": "shared", "value": node, "created_at": created_at}))
+            f.write("\n")
+            f.write(json.dumps({"key": node, "value": node, "created_at": created_at}))
+            f.write("\nnot json\n")
+        paths.append(path)
+    output = str(tmp_path / "merged.jsonl.gz")
+
+    assert merge_exports(paths, output) == 3
+
+    entries = {entry["key"]: entry["value"] for entry in read_entries(output)}
+    assert entries == {"shared": "node2", "node1": "node1", "node2": "node2"}
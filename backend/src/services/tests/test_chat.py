@@ -23,6 +23,8 @@ from backend.src.services.chat import (
     delete_chat_by_id,
     delete_chats_by_task_id,
     get_chat_by_id,
+    get_chat_ids_by_task,
+    get_chat_ids_by_user,
     get_chats_by_user,
     get_reasoning_steps_by_message,
 )
@@ -503,3 +505,62 @@ async def test_delete_chats_by_task_id_no_chats(async_session):
     chats, count = await get_chats_by_user(user_id=user.id)
     assert len(chats) == 0
     assert count == 0
+
+
+# Test getting the chat ids of a task
+@pytest.mark.asyncio
+async def test_get_chat_ids_by_task(async_session):
+    """Test the get_chat_ids_by_task function with ORM interactions."""
+    async with async_session() as session:
+        user = User(email="testuser9@example.com")
+        session.add(user)
+        await session.commit()
+
+        tasks = [
+            Task(
+                user_id=user.id,
+                description=f"Test Task {i}",
+                name=f"Test{i}",
+                initial_system_prompt="Test Prompt",
+            )
+            for i in range(2)
+        ]
+        session.add_all(tasks)
+        await session.commit()
+
+        chats = [Chat(user_id=user.id, task_id=tasks[i % 2].id) for i in range(3)]
+        session.add_all(chats)
+        await session.commit()
+
+    chat_ids = await get_chat_ids_by_task(tasks[0].id)
+
+    assert sorted(chat_ids) == [chats[0].id, chats[2].id]
+    assert await get_chat_ids_by_task(999) == []
+
+
+# Test getting the chat ids of a user
+@pytest.mark.asyncio
+async def test_get_chat_ids_by_user(async_session):
+    """Test the get_chat_ids_by_user function with ORM interactions."""
+    async with async_session() as session:
+        users = [User(email=f"testuser1{i}@example.com") for i in range(2)]
+        session.add_all(users)
+        await session.commit()
+
+        task = Task(
+            user_id=users[0].id,
+            description="Test Task",
+            name="Test",
+            initial_system_prompt="Test Prompt",
+        )
+        session.add(task)
+        await session.commit()
+
+        chats = [Chat(user_id=users[i % 2].id, task_id=task.id) for i in range(3)]
+        session.add_all(chats)
+        await session.commit()
+
+    chat_ids = await get_chat_ids_by_user(users[0].id)
+
+    assert sorted(chat_ids) == [chats[0].id, chats[2].id]
+    assert await get_chat_ids_by_user(999) == []
@@ -0,0 +1,54 @@
+from unittest.mock import patch
+
+from backend.src.services.context_packing import (
+    CONTEXT_TOKEN_BUDGET,
+    get_context_token_budget,
+    pack_contexts,
+)
+
+IMAGES = "###IMAGES_START###['a.png']###IMAGES_END###"
+
+
+def test_get_context_token_budget():
+    """Test budgets are looked up per model with a default"""
+    assert get_context_token_budget("gpt-4o-mini") == 16000
+    assert get_context_token_budget("unknown-model") == CONTEXT_TOKEN_BUDGET
+
+
+def test_pack_contexts_deduplicates():
+    """Test duplicated and contained chunks are dropped"""
+    contexts = [
+        "Glaucoma damages the optic nerve of the eye.",
+        "Glaucoma damages the optic nerve of the eye.",
+        "the optic nerve",
+        "Cataracts cloud the lens.",
+    ]
+
+    assert pack_contexts(contexts, 1000) == [
+        "Glaucoma damages the optic nerve of the eye.",
+        "Cataracts cloud the lens.",
+    ]
+
+
+def test_pack_contexts_merges_adjacent_chunks():
+    """Test chunks sharing their overlap are merged keeping their images"""
+    first = "Glaucoma is a group of eye diseases that damage the optic nerve."
+    second = "that damage the optic nerve. It is a leading cause of blindness."
+
+    packed = pack_contexts([second + IMAGES, "Unrelated.", first], 1000)
+
+    assert packed == [
+        "Glaucoma is a group of eye diseases that damage the optic nerve. "
+        "It is a leading cause of blindness." + IMAGES,
+        "Unrelated.",
+    ]
+
+
+@patch("backend.src.services.rerank.count_tokens", side_effect=len)
+def test_pack_contexts_fits_budget(_):
+    """Test the most relevant contexts within the budget are kept"""
+    contexts = ["a" * 10, "b" * 10 + IMAGES, "c" * 10]
+
+    assert pack_contexts(contexts, 25) == ["a" * 10, "b" * 10 + IMAGES]
+    assert pack_contexts(contexts, 5) == ["a" * 10]
+    assert pack_contexts([IMAGES], 5) == [IMAGES]
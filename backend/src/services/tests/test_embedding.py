@@ -0,0 +1,89 @@
+from typing import List
+from unittest.mock import patch
+
+import pytest
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.embeddings.openai import OpenAIEmbedding
+from llama_index.core.schema import TextNode
+
+from backend.src.constants import LlmModel
+from backend.src.llm.rate_limit import TokenRateLimiter
+from backend.src.services.cache import Cache
+from backend.src.llm.embedding_cache import CachedEmbedding
+from backend.src.services.embedding import embed_nodes, limit_client_retries
+
+
+class RateLimitError(Exception):
+    """Error of a request rejected by the provider's rate limit"""
+
+    status_code = 429
+
+
+class FlakyEmbedding(BaseEmbedding):
+    """Embedding model rejecting its first requests with a 429"""
+
+    batches: List[List[str]] = []
+    rejections: int = 0
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return [float(len(query))]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return [float(len(text))]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        if self.rejections:
+            self.rejections -= 1
+            raise RateLimitError("Rate limit reached")
+        self.batches.append(texts)
+        return [self._get_text_embedding(text) for text in texts]
+
+
+@pytest.mark.asyncio
+@patch("backend.src.services.embedding.EMBEDDING_BATCH_SIZE", 2)
+@patch("backend.src.llm.rate_limit.RATE_LIMIT_BACKOFF", 0.01)
+async def test_embed_nodes():
+    """
+    Test chunks are embedded in batches, retrying batches rejected with 429
+    """
+    rate_limiter = TokenRateLimiter()
+    embedding_model = FlakyEmbedding(model_name="flaky", batches=[], rejections=1)
+    nodes = [TextNode(text="a" * length) for length in range(1, 6)]
+    nodes[2].embedding = [0.0]
+
+    with patch(
+        "backend.src.services.embedding.get_embedding_rate_limiter",
+        return_value=rate_limiter,
+    ):
+        await embed_nodes(nodes, LlmModel.GPT4O_MINI, embedding_model)
+
+    assert [node.embedding for node in nodes] == [[1.0], [2.0], [0.0], [4.0], [5.0]]
+    assert sorted(embedding_model.batches) == [["a", "aa"], ["aaaa", "aaaaa"]]
+    assert embedding_model.rejections == 0
+    assert rate_limiter.tokens_last_minute > 0
+
+
+@pytest.mark.asyncio
+async def test_embed_nodes_error():
+    """
+    Test errors other than rate limits are raised
+    """
+    embedding_model = FlakyEmbedding(model_name="flaky", batches=[], rejections=0)
+
+    with patch.object(
+        FlakyEmbedding, "_aget_text_embeddings", side_effect=ValueError("invalid")
+    ), pytest.raises(ValueError, match="invalid"):
+        await embed_nodes([TextNode(text="a")], LlmModel.GPT4O_MINI, embedding_model)
+
+
+def test_limit_client_retries(tmp_path):
+    """
+    Test the retries of the provider's client are lowered behind the embedding cache
+    """
+    embedding_model = OpenAIEmbedding(api_key="key")
+    limit_client_retries(CachedEmbedding(embedding_model, Cache(str(tmp_path))), 1)
+
+    assert embedding_model.max_retries == 1
@@ -1,25 +1,54 @@
 # pylint: disable=redefined-outer-name, unused-argument
+import json
+from multiprocessing import shared_memory
+from tempfile import SpooledTemporaryFile
+from typing import Optional
 from unittest import mock
 from unittest.mock import MagicMock, patch
 
+import fitz
 import pytest
+from chromadb.errors import NotFoundError
 from llama_index.core import Document
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MetadataMode
 from nebula3.common.ttypes import ErrorCode
 
 from backend.src.constants import LlmModel, RagTechnique
 from backend.src.services.etl import (
+    BASE_COLLECTION_KEY,
+    DOC_HASH_KEY,
+    MANIFEST_KEY,
+    PARENT_ID_KEY,
     create_nebula_space,
+    create_parent_child_nodes,
     delete_graph_data,
     delete_vector_data,
     get_chroma_client,
     get_chroma_collection,
+    get_collection_manifest,
     get_documents_from_binaries,
     get_exponetial_backoff,
+    get_file_hashes,
     get_nebula_storage_context,
+    get_parsing_tasks,
+    get_task_collection_name,
+    get_vector_manifest,
     insert_data,
     insert_graph_data,
+    insert_parent_nodes,
     insert_vector_data,
+    insert_vector_files,
+    invalidate_collection,
+    link_chat_collections,
+    load_documents,
+    reset_chroma_client,
+    set_chunk_ids,
+    set_document_hashes,
+    shutdown_parsing_pool,
 )
+from backend.src.services.pdf_parsing import read_shared_pdf_pages
+from backend.src.services.retrieval_cache import retrieval_cache
 from common import File
 
 
@@ -36,6 +65,16 @@ def mock_env_vars(monkeypatch):
     monkeypatch.setenv("CHROMA_TOKEN", "test_token")
 
 
+@pytest.fixture(autouse=True)
+def clear_chroma_client():
+    """
+    Forget the shared ChromaDB client and collection handles between tests
+    """
+    reset_chroma_client()
+    yield
+    reset_chroma_client()
+
+
 @pytest.fixture
 def mock_time_sleep():
     """
@@ -58,12 +97,15 @@ def test_get_chroma_client(mock_http_client, mock_env_vars):
     """
     Test create chroma client
     """
-    get_chroma_client()
+    client = get_chroma_client()
     mock_http_client.assert_called_once_with(
         host="localhost",
         port="8000",
         settings=mock.ANY,
     )
+    # the client is shared
+    assert get_chroma_client() is client
+    mock_http_client.assert_called_once()
 
 
 @patch("backend.src.services.etl.get_chroma_client")
@@ -80,46 +122,194 @@ def test_get_chroma_collection(mock_get_chroma_client):
     assert collection == mock_collection
     mock_get_chroma_client.assert_called_once()
 
+    # the collection handle is reused
+    assert get_chroma_collection("test_chat_id") == mock_collection
+    mock_get_chroma_client.return_value.get_or_create_collection.assert_called_once()
+
+
+@patch("backend.src.services.etl.CHROMA_COLLECTION_CACHE_SIZE", 1)
+@patch("backend.src.services.etl.get_chroma_client")
+def test_get_chroma_collection_eviction(mock_get_chroma_client):
+    """
+    Test collection handles are evicted when there are too many or deleted
+    """
+    get_or_create_collection = (
+        mock_get_chroma_client.return_value.get_or_create_collection
+    )
+
+    get_chroma_collection("chat-1")
+    get_chroma_collection("chat-2")
+    get_chroma_collection("chat-1")
+    assert get_or_create_collection.call_count == 3
+
+    delete_vector_data(1)
+    get_chroma_collection("chat-1")
+    assert get_or_create_collection.call_count == 4
+
+
+def create_upload(name: str, data: bytes, max_size: int = 0) -> File:
+    """
+    Create an uploaded file, spooled to disk when larger than max_size
+    """
+    content = SpooledTemporaryFile(max_size=max_size)  # pylint: disable=consider-using-with
+    content.write(data)
+    return File(name=name, content=content)
+
+
+def create_pdf(*texts: str) -> bytes:
+    """
+    Create a PDF file with a page per text
+    """
+    with fitz.open() as pdf:
+        for text in texts:
+            pdf.new_page().insert_text((72, 72), text)
+        return pdf.tobytes()
+
 
 @patch("backend.src.services.etl.Path")
 @patch("backend.src.services.etl.os.path.exists")
 @patch("backend.src.services.etl.os.remove")
 @patch("backend.src.services.etl.tempfile.NamedTemporaryFile")
-@patch("backend.src.services.etl.SimpleDirectoryReader.load_file")
+@patch("backend.src.services.etl.SimpleDirectoryReader")
 def test_get_documents_from_binaries(
-    mock_load_file, mock_tempfile, mock_remove, mock_path_exist, mock_path, mock_file
+    mock_reader, mock_tempfile, mock_remove, mock_path_exist, mock_path
 ):
     """
     Test get documents from binaries
     """
     mock_tempfile.return_value.__enter__.return_value.name = "temp_file"
-    mock_load_file.return_value = [Document(text="test")]
+    mock_reader.return_value.load_data.return_value = [Document(text="test")]
     mock_path_exist.return_value = True
     mock_path.return_value = "temp_path"
 
-    documents = get_documents_from_binaries([mock_file])
+    documents = get_documents_from_binaries([create_upload("test_file", b"test")])
 
     assert len(documents) == 1
     assert documents[0].text == "test"
     mock_tempfile.assert_called_once_with(suffix=".bin.test_file", delete=False)
-    mock_file.content.read.assert_called_once()
     mock_tempfile.return_value.__enter__.return_value.write.assert_called_once()
     mock_tempfile.return_value.__enter__.return_value.flush.assert_called_once()
     mock_path.assert_called_once_with("temp_file")
-    mock_load_file.assert_called_once_with("temp_path", mock.ANY, {})
+    mock_reader.assert_called_once_with(input_files=["temp_path"])
+    mock_reader.return_value.load_data.assert_called_once_with()
     mock_path_exist.assert_called_once()
     mock_remove.assert_called_once()
 
 
+@pytest.mark.parametrize("max_size", [0, 16])
+@patch("backend.src.services.etl.tempfile.NamedTemporaryFile")
+def test_get_documents_from_binaries_buffer(mock_tempfile, max_size):
+    """
+    Test PDF and text files are parsed from the upload, in memory or spooled to disk
+    """
+    files = [
+        create_upload("report.pdf", create_pdf("first page", "second page"), max_size),
+        create_upload("notes.txt", "some notes".encode("utf-8"), max_size),
+    ]
+
+    documents = get_documents_from_binaries(files)
+
+    assert [document.text.strip() for document in documents] == [
+        "first page",
+        "second page",
+        "some notes",
+    ]
+    assert documents[1].metadata["page_label"] == "2"
+    assert documents[1].metadata["file_name"] == "report.pdf"
+    assert documents[2].metadata["file_type"] == "text/plain"
+    assert "file_size" not in documents[0].get_metadata_str(MetadataMode.EMBED)
+    assert "report.pdf" in documents[0].get_metadata_str(MetadataMode.LLM)
+    mock_tempfile.assert_not_called()
+
+
+def test_get_documents_from_binaries_invalid_pdf():
+    """
+    Test a file which fails to parse is skipped
+    """
+    files = [
+        create_upload("broken.pdf", b"not a pdf"),
+        create_upload("notes.txt", b"some notes"),
+    ]
+
+    documents = get_documents_from_binaries(files)
+
+    assert [document.text for document in documents] == ["some notes"]
+
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("workers", [0, 2])
+async def test_load_documents(workers):
+    """
+    Test files and pages of large PDF files are parsed in order, skipping failures
+    """
+    files = [
+        create_upload("manual.pdf", create_pdf("page 1", "page 2", "page 3")),
+        create_upload("broken.pdf", b"not a pdf"),
+        create_upload("notes.txt", b"some notes"),
+    ]
+
+    with patch("backend.src.services.etl.PARSING_WORKERS", workers), patch(
+        "backend.src.services.etl.PDF_PAGES_PER_TASK", 2
+    ):
+        try:
+            documents = await load_documents(files)
+        finally:
+            shutdown_parsing_pool()
+
+    assert [document.text.strip() for document in documents] == [
+        "page 1",
+        "page 2",
+        "page 3",
+        "some notes",
+    ]
+    assert [document.metadata.get("page_label") for document in documents] == [
+        "1",
+        "2",
+        "3",
+        None,
+    ]
+
+
+@patch("backend.src.services.etl.PDF_PAGES_PER_TASK", 2)
+def test_get_parsing_tasks():
+    """
+    Test PDF files are shared in memory with their page ranges, other files parsed
+    """
+    content = create_pdf("page 1", "page 2", "page 3")
+    files = [
+        create_upload("manual.pdf", content),
+        create_upload("broken.pdf", b"not a pdf"),
+        create_upload("notes.txt", b"some notes"),
+    ]
+
+    tasks = get_parsing_tasks(files)
+    try:
+        assert [task.name for task in tasks] == ["manual.pdf", "notes.txt"]
+        assert tasks[0].page_ranges == [range(0, 2), range(2, 3)]
+        assert bytes(tasks[0].memory.buf[: tasks[0].size]) == content
+        pages = read_shared_pdf_pages(tasks[0].memory.name, tasks[0].size, range(2, 3))
+        assert pages == [("3", "page 3\n")]
+        assert [document.text for document in tasks[1].documents] == ["some notes"]
+    finally:
+        memory_name = tasks[0].memory.name
+        for task in tasks:
+            task.close()
+
+    assert tasks[0].memory is None
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=memory_name)
+
+
 @patch("backend.src.services.etl.get_chroma_collection")
 @patch("backend.src.llm.models.LlmFactory.create_embedding_model")
 @patch("backend.src.services.etl.ChromaVectorStore")
 @patch("backend.src.services.etl.StorageContext.from_defaults")
-@patch("backend.src.services.etl.VectorStoreIndex.from_documents")
-@patch("backend.src.services.etl.LlamaIndexSettings")
+@patch("backend.src.services.etl.VectorStoreIndex")
+@patch("backend.src.services.etl.embed_nodes")
 def test_insert_vector_data(
-    mock_llama_index_settings,
-    mock_from_documents,
+    mock_embed_nodes,
+    mock_vector_store_index,
     mock_storage_context,
     mock_vector_store,
     mock_create_model,
@@ -128,31 +318,80 @@ def test_insert_vector_data(
     """
     Test insert data to vector database
     """
-    mock_collection = mock.Mock()
+    mock_collection = mock.Mock(metadata={})
+    mock_collection.name = "chat-1"
+    mock_collection.count.return_value = 0
     mock_get_collection.return_value = mock_collection
     mock_model = mock.Mock()
     mock_create_model.return_value = mock_model
     mock_vector_store.return_value = mock.Mock()
     mock_storage_context.return_value = mock.Mock()
-    mock_from_documents.return_value = mock.Mock()
+    mock_vector_store_index.return_value = mock.Mock()
 
-    documents = [Document(text="test")]
-    index = insert_vector_data(1, documents, chunk_size=512, chunk_overlap=10)
+    text = " ".join(f"Sentence number {i} about glaucoma." for i in range(100))
+    documents = [Document(text=text)]
+    index = insert_vector_data(1, documents, chunk_size=128, chunk_overlap=10)
 
-    assert index == mock_from_documents.return_value
+    assert index == mock_vector_store_index.return_value
     mock_get_collection.assert_called_once_with("chat-1")
     mock_create_model.assert_called_once_with(LlmModel.GPT4O_MINI)
     mock_vector_store.assert_called_once_with(chroma_collection=mock_collection)
     mock_storage_context.assert_called_once_with(
         vector_store=mock_vector_store.return_value
     )
-    mock_llama_index_settings.chunk_size = 512
-    mock_llama_index_settings.chunk_overlap = 10
-    mock_from_documents.assert_called_once_with(
-        documents,
+    # the chunks are embedded before being stored
+    nodes = mock_embed_nodes.call_args.args[0]
+    assert len(nodes) > 1
+    assert all(node.ref_doc_id == documents[0].doc_id for node in nodes)
+    mock_embed_nodes.assert_called_once_with(nodes, LlmModel.GPT4O_MINI, mock_model)
+    mock_vector_store_index.assert_called_once_with(
+        nodes,
         storage_context=mock_storage_context.return_value,
         embed_model=mock_model,
     )
+    mock_collection.modify.assert_called_once_with(metadata={MANIFEST_KEY: "{}"})
+
+
+def test_create_parent_child_nodes():
+    """
+    Test documents are split into parent sections and their small chunks
+    """
+    text = " ".join(f"Sentence number {i} about glaucoma." for i in range(200))
+    documents = [Document(text=text, metadata={"image_paths": "a.png"})]
+
+    parents, children = create_parent_child_nodes(
+        documents, chunk_size=64, chunk_overlap=0, parent_chunk_size=512
+    )
+
+    assert 1 < len(parents) < len(children)
+    parent_texts = {parent.node_id: parent.text for parent in parents}
+    for child in children:
+        assert child.text in parent_texts[child.metadata[PARENT_ID_KEY]]
+        assert child.metadata["image_paths"] == "a.png"
+        assert PARENT_ID_KEY not in child.get_metadata_str(MetadataMode.EMBED)
+        assert PARENT_ID_KEY not in child.get_metadata_str(MetadataMode.LLM)
+
+
+@patch("backend.src.services.etl.get_chroma_collection")
+def test_insert_parent_nodes(mock_get_collection):
+    """
+    Test parent sections are stored without embeddings by id
+    """
+    parents, _ = create_parent_child_nodes(
+        [Document(text="Glaucoma damages the optic nerve.", metadata={"page": 1})]
+    )
+    mock_get_collection.return_value.metadata = {}
+    mock_get_collection.return_value.count.return_value = 0
+
+    insert_parent_nodes(1, parents)
+
+    mock_get_collection.assert_called_once_with("chat-1-parents")
+    mock_get_collection.return_value.upsert.assert_called_once_with(
+        ids=[parents[0].node_id],
+        documents=["Glaucoma damages the optic nerve."],
+        metadatas=[{"page": 1}],
+        embeddings=[[0.0]],
+    )
 
 
 @patch("backend.src.services.etl.get_chroma_client")
@@ -164,7 +403,11 @@ def test_delete_vector_data(mock_get_chroma_client):
     mock_get_chroma_client.return_value.delete_collection = mock_delete
 
     delete_vector_data(1)
-    mock_delete.assert_called_once_with("chat-1")
+    assert mock_delete.call_args_list == [mock.call("chat-1"), mock.call("chat-1-parents")]
+
+    # chats inserted without parent sections have no parent collection
+    mock_delete.side_effect = [None, NotFoundError("not found")]
+    delete_vector_data(1)
 
 
 def test_get_exponetial_backoff():
@@ -356,40 +599,332 @@ def test_delete_graph_data(mock_connection, mock_env_vars):
 
 
 @pytest.mark.asyncio
-@patch("backend.src.services.etl.get_documents_from_binaries")
-@patch("backend.src.services.etl.insert_vector_data")
+@patch("backend.src.services.etl.get_lexical_index")
+@patch("backend.src.services.etl.load_documents")
+@patch("backend.src.services.etl.insert_vector_files")
 @patch("backend.src.services.etl.insert_graph_data")
-@patch("backend.src.services.file.create_files")
+@patch("backend.src.services.etl.create_files")
 async def test_insert_data(
     mock_create_files,
     mock_insert_graph,
-    mock_insert_vector,
-    mock_get_documents,
+    mock_insert_vector_files,
+    mock_load_documents,
+    mock_get_lexical_index,
     mock_file,
 ):
     """
     Test insert data into knowledge database
     """
-    mock_get_documents.return_value = [
+    mock_load_documents.return_value = [
         Document(text="test", metadata={"file_name": "test_file"})
     ]
-    mock_insert_vector.return_value = mock.Mock()
+    mock_insert_vector_files.return_value = mock.Mock()
     mock_insert_graph.return_value = mock.Mock()
-    mock_create_files.return_value = None
 
     index = await insert_data(1, [mock_file], technique=RagTechnique.VECTOR)
-    assert index == mock_insert_vector.return_value
-    mock_get_documents.assert_called_with([mock_file])
-    mock_insert_vector.assert_called_once_with(
-        1, mock_get_documents.return_value, LlmModel.GPT4O_MINI, 1024, 20
+    assert index == mock_insert_vector_files.return_value
+    mock_insert_vector_files.assert_called_once_with(
+        1, [mock_file], LlmModel.GPT4O_MINI, 1024, 20, None, False, None
+    )
+    mock_get_lexical_index.assert_not_called()
+
+    await insert_data(1, [mock_file], technique=RagTechnique.HYBRID, task_id=2)
+    mock_insert_vector_files.assert_called_with(
+        1, [mock_file], LlmModel.GPT4O_MINI, 1024, 20, None, False, 2
+    )
+    mock_get_lexical_index.assert_called_once_with(1)
+
+    await insert_data(1, [mock_file], technique=RagTechnique.VECTOR, replace=True)
+    mock_insert_vector_files.assert_called_with(
+        1, [mock_file], LlmModel.GPT4O_MINI, 1024, 20, None, True, None
     )
 
     index = await insert_data(1, [mock_file], technique=RagTechnique.GRAPH)
     assert index == mock_insert_graph.return_value
-    mock_get_documents.assert_called_with([mock_file])
+    mock_load_documents.assert_called_once_with([mock_file])
     mock_insert_graph.assert_called_once_with(
-        1, mock_get_documents.return_value, LlmModel.GPT4O_MINI, 1024, 20
+        1, mock_load_documents.return_value, LlmModel.GPT4O_MINI, 1024, 20
     )
+    mock_create_files.assert_called_once_with(1, ["test_file"])
 
     with pytest.raises(ValueError, match="Invalid technique"):
         index = await insert_data(1, [mock_file], technique="invalid")
+
+
+@pytest.mark.asyncio
+@patch("backend.src.services.etl.PARSING_WORKERS", 0)
+@patch("backend.src.services.etl.get_vector_manifest")
+@patch("backend.src.services.etl.ainsert_vector_data")
+@patch("backend.src.services.etl.create_files")
+@patch("backend.src.services.etl.delete_files_by_names")
+@patch("backend.src.services.etl.get_file_names_by_chat")
+async def test_insert_vector_files(
+    mock_get_file_names,
+    mock_delete_files,
+    mock_create_files,
+    mock_insert_vector,
+    mock_get_manifest,
+):
+    """
+    Test only new and changed files are ingested, and removed files are deleted
+    """
+    files = [
+        create_upload("same.txt", b"same"),
+        create_upload("changed.txt", b"changed"),
+        create_upload("new.txt", b"new"),
+    ]
+    hashes = get_file_hashes(files)
+    mock_get_manifest.return_value = {
+        "same.txt": hashes["same.txt"],
+        "changed.txt": "old hash",
+        "gone.txt": "gone hash",
+    }
+    mock_get_file_names.return_value = ["same.txt", "changed.txt", "gone.txt"]
+
+    await insert_vector_files(1, files, replace=True)
+
+    documents = mock_insert_vector.call_args.args[1]
+    assert [document.text for document in documents] == ["changed", "new"]
+    assert [document.metadata[DOC_HASH_KEY] for document in documents] == [
+        hashes["changed.txt"],
+        hashes["new.txt"],
+    ]
+    assert DOC_HASH_KEY not in documents[0].get_metadata_str(MetadataMode.EMBED)
+    mock_insert_vector.assert_called_once_with(
+        1, documents, LlmModel.GPT4O_MINI, 1024, 20, None, ["gone.txt"]
+    )
+    mock_create_files.assert_called_once_with(1, ["new.txt"])
+    mock_delete_files.assert_called_once_with(1, ["gone.txt"])
+
+    # without replace, the chat keeps the files missing from the upload
+    await insert_vector_files(1, files[:1])
+    assert mock_insert_vector.call_args.args[1:] == (
+        [],
+        LlmModel.GPT4O_MINI,
+        1024,
+        20,
+        None,
+        [],
+    )
+    mock_delete_files.assert_called_once()
+
+
+def create_version(changed: Optional[int] = None) -> Document:
+    """
+    Create a version of a file, one sentence of which may be changed
+    """
+    text = " ".join(
+        f"Sentence number {i} about {'cataract' if i == changed else 'glaucoma'}."
+        for i in range(100)
+    )
+    return Document(text=text, metadata={"file_name": "a.txt"})
+
+
+@patch("backend.src.services.etl.get_chroma_collection")
+@patch("backend.src.llm.models.LlmFactory.create_embedding_model")
+@patch("backend.src.services.etl.VectorStoreIndex")
+@patch("backend.src.services.etl.embed_nodes")
+def test_insert_vector_data_incremental(
+    mock_embed_nodes, mock_vector_store_index, mock_create_model, mock_get_collection
+):
+    """
+    Test an edited file only embeds its changed chunks and deletes the chunks
+    they replace, and removed files are deleted
+    """
+    mock_collection = mock_get_collection.return_value
+    mock_collection.name = "chat-1"
+    mock_collection.metadata = {
+        MANIFEST_KEY: json.dumps({"b.txt": {"hash": "b", "chunks": ["b"]}})
+    }
+    v1, v2 = create_version(), create_version(changed=50)
+    set_document_hashes([v1], {"a.txt": "v1"})
+    set_document_hashes([v2], {"a.txt": "v2"})
+
+    insert_vector_data(1, [v1], chunk_size=128, chunk_overlap=0)
+    v1_ids = [node.node_id for node in mock_embed_nodes.call_args.args[0]]
+    # the manifest written by the first ingestion is the one the second reads
+    mock_collection.metadata = mock_collection.modify.call_args.kwargs["metadata"]
+    mock_collection.delete.reset_mock()
+
+    insert_vector_data(
+        1, [v2], chunk_size=128, chunk_overlap=0, removed_files=["b.txt"]
+    )
+    embedded = mock_embed_nodes.call_args.args[0]
+    metadata = mock_collection.modify.call_args.kwargs["metadata"]
+    manifest = json.loads(metadata[MANIFEST_KEY])
+    v2_ids = manifest["a.txt"]["chunks"]
+
+    # only the chunk holding the changed sentence is embedded again
+    changed = [node.node_id for node in embedded]
+    assert len(v1_ids) == len(v2_ids) > 2
+    assert len(changed) == 1 and "cataract" in embedded[0].text
+    assert changed == [chunk_id for chunk_id in v2_ids if chunk_id not in v1_ids]
+    assert mock_vector_store_index.call_args.args[0] == embedded
+    # the stored chunks are known from the manifest, without reading the collection
+    mock_collection.get.assert_not_called()
+    assert mock_collection.delete.call_args_list == [
+        mock.call(where={"file_name": {"$in": ["b.txt"]}}),
+        mock.call(ids=[chunk_id for chunk_id in v1_ids if chunk_id not in v2_ids]),
+    ]
+    assert manifest == {"a.txt": {"hash": "v2", "chunks": v2_ids}}
+
+
+def test_set_chunk_ids():
+    """
+    Test chunk ids depend on the file name and the text, repeated texts
+    getting distinct ids
+    """
+    chunks = [("a.txt", "x"), ("a.txt", "y"), ("a.txt", "x"), ("b.txt", "x")]
+    nodes = [Document(text=text, metadata={"file_name": name}) for name, text in chunks]
+    moved = [Document(text="y", metadata={"file_name": "a.txt"})]
+
+    set_chunk_ids(nodes)
+    set_chunk_ids(moved)
+
+    assert len({node.node_id for node in nodes}) == 4
+    assert moved[0].node_id == nodes[1].node_id
+
+
+@patch("backend.src.services.etl.get_chroma_collection")
+def test_get_vector_manifest(mock_get_collection):
+    """
+    Test the manifest lists the content hash of every stored file, from the
+    collection's metadata
+    """
+    mock_collection = mock_get_collection.return_value
+    mock_collection.metadata = {
+        MANIFEST_KEY: json.dumps(
+            {
+                "a.txt": {"hash": "1", "chunks": ["a1", "a2"]},
+                "legacy.pdf": {"hash": None, "chunks": ["l1"]},
+            }
+        )
+    }
+
+    assert get_vector_manifest(1) == {"a.txt": "1"}
+    mock_get_collection.assert_called_once_with("chat-1")
+    mock_collection.get.assert_not_called()
+
+
+def test_get_collection_manifest_legacy():
+    """
+    Test the manifest of a collection stored without one is built once from its chunks
+    """
+    collection = mock.Mock(metadata=None)
+    collection.count.return_value = 5
+    collection.get.return_value = {
+        "ids": ["a1", "a2", "b1", "l1", "x"],
+        "metadatas": [
+            {"file_name": "a.txt", "doc_hash": "1"},
+            {"file_name": "a.txt", "doc_hash": "1"},
+            {"file_name": "b.pdf", "doc_hash": "2"},
+            {"file_name": "legacy.pdf"},
+            None,
+        ],
+    }
+
+    manifest = get_collection_manifest(collection)
+
+    assert manifest == {
+        "a.txt": {"hash": "1", "chunks": ["a1", "a2"]},
+        "b.pdf": {"hash": "2", "chunks": ["b1"]},
+        "legacy.pdf": {"hash": None, "chunks": ["l1"]},
+    }
+    collection.modify.assert_called_once_with(
+        metadata={MANIFEST_KEY: json.dumps(manifest)}
+    )
+
+
+@pytest.mark.asyncio
+@patch("backend.src.services.etl.PARSING_WORKERS", 0)
+@patch("backend.src.services.etl.link_chat_collections")
+@patch("backend.src.services.etl.get_vector_manifest")
+@patch("backend.src.services.etl.ainsert_vector_data")
+@patch("backend.src.services.etl.create_files")
+@patch("backend.src.services.etl.get_file_names_by_chat", return_value=[])
+async def test_insert_vector_files_shared(
+    mock_get_file_names,
+    mock_create_files,
+    mock_insert_vector,
+    mock_get_manifest,
+    mock_link,
+):
+    """
+    Test a chat sharing its task's collection only ingests the new documents
+    """
+    files = [create_upload("manual.txt", b"manual"), create_upload("new.txt", b"new")]
+    mock_get_manifest.return_value = {
+        "manual.txt": get_file_hashes(files[:1])["manual.txt"],
+        "other.txt": "other hash",
+    }
+
+    await insert_vector_files(2, files, task_id=7)
+
+    task_collection_name = get_task_collection_name(7)
+    mock_link.assert_called_once_with(2, task_collection_name)
+    documents = mock_insert_vector.call_args.args[1]
+    assert [document.text for document in documents] == ["new"]
+    # the chat lists every document of the task
+    mock_create_files.assert_called_once_with(2, ["manual.txt", "new.txt", "other.txt"])
+
+    # a chat of the task starts without uploading the documents again
+    await insert_vector_files(3, [], task_id=7)
+    assert mock_insert_vector.call_args.args[1] == []
+
+    # the documents of the other chats of the task are never replaced
+    with pytest.raises(ValueError, match="cannot be replaced"):
+        await insert_vector_files(2, files[:1], replace=True, task_id=7)
+    assert mock_insert_vector.call_count == 2
+
+
+def test_get_task_collection_name():
+    """
+    Test chats of a task share a collection when they split and embed alike
+    """
+    name = get_task_collection_name(7, LlmModel.GPT4O_MINI, 512, 20)
+    assert name.startswith("task-7-")
+    assert name == get_task_collection_name(7, LlmModel.GPT4O, 512, 20, None)
+    assert name != get_task_collection_name(8, LlmModel.GPT4O_MINI, 512, 20)
+    assert name != get_task_collection_name(7, LlmModel.GPT4O_MINI, 1024, 20)
+    assert name != get_task_collection_name(7, LlmModel.LLAMA2_LOCAL, 512, 20)
+    assert name != get_task_collection_name(7, LlmModel.GPT4O_MINI, 512, 20, 2048)
+
+
+@patch("backend.src.services.etl.get_chroma_client")
+def test_shared_chat_collections(mock_get_chroma_client):
+    """
+    Test the collection of a chat sharing its task's documents resolves to the
+    task collection, and changes to it invalidate every chat sharing it
+    """
+    collections = {}
+
+    def get_or_create_collection(name, metadata=None):
+        if name not in collections:
+            collections[name] = mock.Mock(metadata=metadata)
+            collections[name].name = name
+        return collections[name]
+
+    chroma_client = mock_get_chroma_client.return_value
+    chroma_client.get_or_create_collection.side_effect = get_or_create_collection
+    # a chat linked to the task by another process
+    get_or_create_collection("chat-4", metadata={BASE_COLLECTION_KEY: "task-7-abc"})
+
+    link_chat_collections(1, "task-7-abc")
+    link_chat_collections(2, "task-7-abc")
+
+    assert get_chroma_collection("chat-1") is collections["task-7-abc"]
+    assert get_chroma_collection("chat-2-parents") is collections["task-7-abc-parents"]
+    assert get_chroma_collection("chat-3") is collections["chat-3"]
+    assert get_chroma_collection("chat-4") is collections["task-7-abc"]
+
+    chats = (1, 2, 3, 4)
+    versions = [retrieval_cache.version(f"chat-{i}") for i in chats]
+    invalidate_collection("chat-1", get_chroma_collection("chat-1").name)
+    assert [retrieval_cache.version(f"chat-{i}") for i in chats] == [
+        versions[0] + 1,
+        versions[1] + 1,
+        versions[2],
+        versions[3] + 1,
+    ]
+    # the chats sharing the task collection are known without listing collections
+    chroma_client.list_collections.assert_not_called()
@@ -8,7 +8,9 @@ from backend.src.services.file import (
     create_file,
     create_files,
     delete_file_by_id,
+    delete_files_by_names,
     get_file_by_name,
+    get_file_names_by_chat,
     get_files_by_chat,
     get_files_by_names,
 )
@@ -193,3 +195,53 @@ async def test_delete_file_by_id(async_session):
     async with async_session() as session:
         deleted_file = await session.get(File, file_id)
         assert deleted_file is None
+
+
+# Test deleting the files of a chat by name
+@pytest.mark.asyncio
+async def test_delete_files_by_names(async_session):
+    """Test the delete_files_by_names function."""
+    async with async_session() as session:
+        chats = [Chat(user_id=1, task_id=1), Chat(user_id=1, task_id=1)]
+        session.add_all(chats)
+        await session.commit()
+
+        session.add_all(
+            [
+                File(chat_id=chats[0].id, name="removed.txt"),
+                File(chat_id=chats[0].id, name="kept.txt"),
+                File(chat_id=chats[1].id, name="removed.txt"),
+            ]
+        )
+        await session.commit()
+
+    await delete_files_by_names(chats[0].id, ["removed.txt"])
+
+    # Verify that only the file of the chat has been deleted
+    async with async_session() as session:
+        files = (await session.scalars(select(File).order_by(File.id))).all()
+        assert [(file.chat_id, file.name) for file in files] == [
+            (chats[0].id, "kept.txt"),
+            (chats[1].id, "removed.txt"),
+        ]
+
+
+# Test getting the names of every file of a chat
+@pytest.mark.asyncio
+async def test_get_file_names_by_chat(async_session):
+    """Test the get_file_names_by_chat function."""
+    async with async_session() as session:
+        chats = [Chat(user_id=1, task_id=1), Chat(user_id=1, task_id=1)]
+        session.add_all(chats)
+        await session.commit()
+
+        session.add_all(
+            [File(chat_id=chats[0].id, name=f"file_{i}.txt") for i in range(12)]
+            + [File(chat_id=chats[1].id, name="other.txt")]
+        )
+        await session.commit()
+
+    names = await get_file_names_by_chat(chats[0].id)
+
+    # Verify that every file of the chat is listed, beyond a page
+    assert sorted(names) == sorted(f"file_{i}.txt" for i in range(12))
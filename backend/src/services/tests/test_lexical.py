@@ -0,0 +1,59 @@
+from unittest.mock import MagicMock
+
+from backend.src.services.lexical import (
+    BM25Index,
+    build_lexical_index,
+    reciprocal_rank_fusion,
+    tokenize,
+)
+
+
+def test_tokenize():
+    """Test identifiers such as part numbers are kept in one piece"""
+    assert tokenize("Replace filter AB-12.5 with Ibuprofen!") == [
+        "replace",
+        "filter",
+        "ab-12.5",
+        "with",
+        "ibuprofen",
+    ]
+
+
+def test_bm25_search():
+    """Test chunks containing rare query terms rank first"""
+    index = BM25Index(
+        [
+            "The pump uses filter AB-12.5 for water.",
+            "The pump needs regular maintenance of the pump and the filter.",
+            "Take ibuprofen for the pain.",
+        ]
+    )
+
+    results = index.search("Which filter is AB-12.5?", top_k=2)
+
+    assert [position for position, _ in results] == [0, 1]
+    assert results[0][1] > results[1][1]
+    assert index.search("unknown words") == []
+    assert BM25Index([]).search("filter") == []
+
+
+def test_build_lexical_index():
+    """Test the index is built from the chunks of a collection"""
+    collection = MagicMock()
+    collection.get.return_value = {
+        "documents": ["first chunk", "second chunk"],
+        "metadatas": [{"image_paths": "a.png"}, None],
+    }
+
+    index = build_lexical_index(collection)
+
+    assert len(index) == 2
+    assert index.metadatas[0] == {"image_paths": "a.png"}
+    collection.get.assert_called_once_with(include=["documents", "metadatas"])
+
+
+def test_reciprocal_rank_fusion():
+    """Test items ranked well by several rankings come first"""
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "b", "d"]])
+
+    assert fused == ["c", "b", "a", "d"]
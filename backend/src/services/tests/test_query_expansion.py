@@ -0,0 +1,83 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from backend.src.constants import QueryExpansion
+from backend.src.models import Message, MessageRole
+from backend.src.services.query_expansion import (
+    expand_query,
+    get_expansion_history,
+    parse_queries,
+)
+
+
+def test_get_expansion_history():
+    """Test only the latest non system messages are given to the rewriting model"""
+    chat_histories = [Message(content="Be concise.", role=MessageRole.SYSTEM)] + [
+        Message(content=f"message {i}", role=MessageRole.USER) for i in range(6)
+    ]
+
+    assert get_expansion_history(chat_histories) == (
+        "USER:message 2",
+        "USER:message 3",
+        "USER:message 4",
+        "USER:message 5",
+    )
+
+
+def test_parse_queries():
+    """Test reformulations are parsed without markers nor duplicates"""
+    response = "1. glaucoma symptoms\n- Glaucoma Symptoms\n\n2) eye pressure\n* optic nerve damage\nextra"
+
+    assert parse_queries("What is glaucoma?", response) == [
+        "What is glaucoma?",
+        "glaucoma symptoms",
+        "eye pressure",
+        "optic nerve damage",
+    ]
+
+
+@pytest.mark.asyncio
+@patch("backend.src.services.query_expansion.LlmFactory.create_llm")
+@patch("backend.src.services.query_expansion.query_llm", new_callable=AsyncMock)
+async def test_expand_query_multi_query(mock_query_llm, _):
+    """Test a multi-query expansion rewrites the query with the conversation"""
+    mock_query_llm.return_value = ["pressure in the eye\nglaucoma treatment"]
+    chat_histories = [Message(content="Tell me about glaucoma", role=MessageRole.USER)]
+
+    queries = await expand_query(
+        "How is it treated?", chat_histories, QueryExpansion.MULTI_QUERY
+    )
+
+    assert queries == ["How is it treated?", "pressure in the eye", "glaucoma treatment"]
+    prompt = mock_query_llm.call_args.args[1][0].content
+    assert "USER:Tell me about glaucoma" in prompt
+    assert "Question: How is it treated?" in prompt
+
+
+@pytest.mark.asyncio
+@patch("backend.src.services.query_expansion.LlmFactory.create_llm")
+@patch("backend.src.services.query_expansion.query_llm", new_callable=AsyncMock)
+async def test_expand_query_hyde(mock_query_llm, _):
+    """Test a HyDE expansion adds a hypothetical answer to the query"""
+    mock_query_llm.return_value = [" Glaucoma damages the optic nerve. "]
+
+    queries = await expand_query("What is glaucoma?", [], QueryExpansion.HYDE)
+
+    assert queries == ["What is glaucoma?", "Glaucoma damages the optic nerve."]
+
+
+@pytest.mark.asyncio
+@patch("backend.src.services.query_expansion.LlmFactory.create_llm")
+@patch("backend.src.services.query_expansion.query_llm", new_callable=AsyncMock)
+async def test_expand_query_failure(mock_query_llm, mock_create_llm):
+    """Test the query is searched alone when it cannot be expanded"""
+    mock_query_llm.side_effect = RuntimeError("rate limited")
+
+    assert await expand_query("What is glaucoma?", [], QueryExpansion.HYDE) == [
+        "What is glaucoma?"
+    ]
+    assert await expand_query("What is glaucoma?", [], QueryExpansion.NONE) == [
+        "What is glaucoma?"
+    ]
+    mock_create_llm.assert_called_once()
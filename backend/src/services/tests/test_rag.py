@@ -1,9 +1,37 @@
+import asyncio
+import threading
+import time
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
-from backend.src.constants import LlmModel, RagTechnique
-from backend.src.services.rag import query_graph, query_knowledge, query_vector
+from backend.src.constants import LlmModel, QueryExpansion, RagTechnique
+from backend.src.models import Message, MessageRole
+from backend.src.services.rag import (
+    PARENT_TOKEN_BUDGET,
+    RetrievedChunk,
+    get_parent_contexts,
+    get_parent_contexts_batch,
+    query_graph,
+    query_knowledge,
+    query_knowledge_batch,
+    query_vector,
+    query_vector_with_score,
+)
+from backend.src.services.lexical import BM25Index
+from backend.src.services.registry import embedding_models, vector_indexes
+from backend.src.services.rerank import LexicalReranker
+from backend.src.services.retrieval_cache import retrieval_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_retrieval_cache():
+    """
+    Start every test with an empty retrieval cache and registries
+    """
+    retrieval_cache.clear()
+    vector_indexes.clear()
+    embedding_models.clear()
 
 
 @pytest.mark.asyncio
@@ -26,9 +54,9 @@ async def test_query_vector(
     mock_chroma_vector_store.return_value = "mock_vector_store"
     mock_create_embedding_model.return_value = "mock_embedding_model"
     mock_from_vector_store.return_value = "mock_index"
-    mock_aretrieve = AsyncMock()
-    mock_aretrieve.return_value = [AsyncMock(text="doc1"), AsyncMock(text="doc2")]
-    mock_vector_index_retriever.return_value.aretrieve = mock_aretrieve
+    mock_retrieve = MagicMock()
+    mock_retrieve.return_value = [MagicMock(text="doc1"), MagicMock(text="doc2")]
+    mock_vector_index_retriever.return_value.retrieve = mock_retrieve
 
     result = await query_vector(chat_id=1, query="test query")
 
@@ -44,7 +72,100 @@ async def test_query_vector(
     mock_vector_index_retriever.assert_called_once_with(
         index="mock_index", similarity_top_k=3
     )
-    mock_aretrieve.assert_called_once_with("test query")
+    mock_retrieve.assert_called_once_with("test query")
+
+    # the index is reused until the collection changes
+    await query_vector(chat_id=1, query="other query", top_k=5)
+    mock_from_vector_store.assert_called_once()
+    mock_vector_index_retriever.assert_called_with(
+        index="mock_index", similarity_top_k=5
+    )
+    retrieval_cache.invalidate("chat-1")
+    await query_vector(chat_id=1, query="test query")
+    assert mock_from_vector_store.call_count == 2
+    mock_create_embedding_model.assert_called_once()
+
+
+@pytest.mark.asyncio
+@patch("backend.src.services.rag.get_vector_index", return_value="mock_index")
+@patch("backend.src.services.rag.VectorIndexRetriever")
+async def test_query_vector_with_score(mock_vector_index_retriever, _):
+    """
+    Test scored retrieval returns typed chunks clearing the minimum score
+    """
+    mock_vector_index_retriever.return_value.retrieve.return_value = [
+        MagicMock(
+            text="doc1",
+            score=0.9,
+            metadata={"image_paths": "a.png"},
+            node=MagicMock(ref_doc_id="file1", start_char_idx=0),
+        ),
+        MagicMock(
+            text="doc2",
+            score=0.4,
+            metadata={},
+            node=MagicMock(ref_doc_id="file1", start_char_idx=980),
+        ),
+    ]
+
+    result = await query_vector_with_score(chat_id=1, query="test query", min_score=0.5)
+
+    assert result == [
+        RetrievedChunk(
+            text="doc1",
+            score=0.9,
+            document_id="file1",
+            position=0,
+            image_paths="a.png",
+        )
+    ]
+    assert result[0].context == "doc1###IMAGES_START###a.png###IMAGES_END###"
+    assert len(await query_vector_with_score(chat_id=1, query="test query")) == 2
+    assert await query_vector(chat_id=1, query="test query", min_score=0.95) == []
+
+
+@pytest.mark.asyncio
+@patch("backend.src.services.rag.get_vector_index")
+@patch("backend.src.services.rag.VectorIndexRetriever")
+async def test_query_vector_does_not_block_event_loop(
+    mock_vector_index_retriever, mock_get_vector_index
+):
+    """
+    Load test: 50 chats retrieving concurrently from a slow, blocking vector
+    store must not delay the other coroutines of the event loop
+    """
+
+    def slow_retrieve(_):
+        time.sleep(0.05)
+        return [MagicMock(text="doc1")]
+
+    def slow_get_vector_index(*_):
+        time.sleep(0.05)
+        return "mock_index"
+
+    mock_get_vector_index.side_effect = slow_get_vector_index
+    mock_vector_index_retriever.return_value.retrieve.side_effect = slow_retrieve
+
+    lags = []
+    done = False
+
+    async def measure_lag():
+        loop = asyncio.get_running_loop()
+        while not done:
+            started = loop.time()
+            await asyncio.sleep(0.005)
+            lags.append(loop.time() - started - 0.005)
+
+    monitor = asyncio.create_task(measure_lag())
+    results = await asyncio.gather(
+        *[query_vector(chat_id=chat_id, query="test query") for chat_id in range(50)]
+    )
+    done = True
+    await monitor
+
+    assert results == [["doc1"]] * 50
+    # blocking the loop for every call would lag it by 50 * 0.1 seconds
+    assert max(lags) < 0.05
 
 
 @pytest.mark.asyncio
@@ -102,7 +223,13 @@ async def test_query_knowledge_vector(mock_query_graph, mock_query_vector):
 
     assert result == ["doc1", "doc2"]
     mock_query_vector.assert_called_once_with(
-        1, "test query", LlmModel.GPT4O_MINI, None, 3
+        1,
+        "test query",
+        LlmModel.GPT4O_MINI,
+        None,
+        3,
+        min_score=None,
+        parent_token_budget=PARENT_TOKEN_BUDGET,
     )
     mock_query_graph.assert_not_called()
 
@@ -125,6 +252,128 @@ async def test_query_knowledge_graph(mock_query_graph, mock_query_vector):
     mock_query_vector.assert_not_called()
 
 
+@pytest.mark.asyncio
+@patch("backend.src.services.rag.query_vector")
+@patch("backend.src.services.rag.get_lexical_index")
+async def test_query_knowledge_hybrid(mock_get_lexical_index, mock_query_vector):
+    """
+    Test query_knowledge function with technique=HYBRID fuses vector and
+    lexical results
+    """
+    mock_query_vector.return_value = ["doc1", "doc2", "doc3", "doc4"]
+    mock_get_lexical_index.return_value = BM25Index(
+        ["doc4 pump AB-12", "unrelated", "doc2 AB-12"], [None, None, None]
+    )
+
+    result = await query_knowledge(
+        chat_id=1, query="pump AB-12", technique=RagTechnique.HYBRID, vector_top_k=2
+    )
+
+    assert result == ["doc1", "doc4 pump AB-12"]
+    mock_query_vector.assert_called_once_with(
+        1,
+        "pump AB-12",
+        LlmModel.GPT4O_MINI,
+        None,
+        4,
+        min_score=None,
+        parent_token_budget=PARENT_TOKEN_BUDGET,
+    )
+    mock_get_lexical_index.assert_called_once_with(1)
+
+
+@pytest.mark.asyncio
+@patch("backend.src.services.rag.RERANK_CANDIDATES", 20)
+@patch("backend.src.services.rag.get_reranker")
+@patch("backend.src.services.rag.query_vector")
+async def test_query_knowledge_rerank(mock_query_vector, mock_get_reranker):
+    """
+    Test candidates are over-fetched and reranked when a reranker is set,
+    the reranker being loaded off the event loop
+    """
+    loading_threads = []
+
+    def get_reranker():
+        loading_threads.append(threading.current_thread())
+        return LexicalReranker()
+
+    mock_get_reranker.side_effect = get_reranker
+    mock_query_vector.return_value = ["eye health", "glaucoma damage", "other"]
+
+    result = await query_knowledge(chat_id=1, query="glaucoma", vector_top_k=2)
+
+    assert result == ["glaucoma damage", "eye health"]
+    assert loading_threads and threading.main_thread() not in loading_threads
+    mock_query_vector.assert_called_once_with(
+        1,
+        "glaucoma",
+        LlmModel.GPT4O_MINI,
+        None,
+        20,
+        min_score=None,
+        parent_token_budget=PARENT_TOKEN_BUDGET,
+    )
+
+
+@pytest.mark.asyncio
+@patch("backend.src.services.rag.get_vector_index", return_value="mock_index")
+@patch("backend.src.services.rag.get_embedding_model")
+@patch("backend.src.services.rag.expand_query", new_callable=AsyncMock)
+@patch("backend.src.services.rag.query_vector")
+async def test_query_knowledge_expansion(
+    mock_query_vector, mock_expand_query, mock_get_embedding_model, _
+):
+    """
+    Test expanded queries are embedded in one batch, searched concurrently
+    and fused, and cached per conversation
+    """
+    mock_expand_query.return_value = ["how is it treated", "glaucoma treatment"]
+    embed_batch = AsyncMock(return_value=[[0.1], [0.2]])
+    mock_get_embedding_model.return_value.aget_text_embedding_batch = embed_batch
+    mock_query_vector.side_effect = [["doc1", "doc2"], ["doc3", "doc2"]]
+    chat_histories = [Message(content="Tell me about glaucoma", role=MessageRole.USER)]
+
+    result = await query_knowledge(
+        chat_id=1,
+        query="how is it treated",
+        vector_top_k=2,
+        query_expansion=QueryExpansion.MULTI_QUERY,
+        chat_histories=chat_histories,
+    )
+
+    assert result == ["doc2", "doc1"]
+    mock_expand_query.assert_awaited_once_with(
+        "how is it treated", chat_histories, QueryExpansion.MULTI_QUERY
+    )
+    embed_batch.assert_awaited_once_with(["how is it treated", "glaucoma treatment"])
+    mock_query_vector.assert_any_call(
+        1, "how is it treated", LlmModel.GPT4O_MINI, "mock_index", 2, [0.1], None, PARENT_TOKEN_BUDGET
+    )
+    mock_query_vector.assert_any_call(
+        1, "glaucoma treatment", LlmModel.GPT4O_MINI, "mock_index", 2, [0.2], None, PARENT_TOKEN_BUDGET
+    )
+
+    # the expanded retrieval is cached in the same conversation
+    await query_knowledge(
+        chat_id=1,
+        query="how is it treated",
+        vector_top_k=2,
+        query_expansion=QueryExpansion.MULTI_QUERY,
+        chat_histories=chat_histories,
+    )
+    assert mock_expand_query.await_count == 1
+    # and expanded again in another conversation
+    mock_query_vector.side_effect = [["doc4"], ["doc4"]]
+    assert await query_knowledge(
+        chat_id=1,
+        query="how is it treated",
+        vector_top_k=2,
+        query_expansion=QueryExpansion.MULTI_QUERY,
+        chat_histories=[],
+    ) == ["doc4"]
+    assert mock_expand_query.await_count == 2
+
+
 @pytest.mark.asyncio
 async def test_query_knowledge_invalid_technique():
     """
@@ -132,3 +381,164 @@ async def test_query_knowledge_invalid_technique():
     """
     with pytest.raises(ValueError, match="Invalid technique"):
         await query_knowledge(chat_id=1, query="test query", technique="INVALID")
+
+
+@pytest.mark.asyncio
+@patch("backend.src.services.rag.query_vector")
+async def test_query_knowledge_coalesces_identical_queries(mock_query_vector):
+    """
+    Test identical concurrent retrievals share a single query
+    """
+
+    async def slow_query(*_, **__):
+        await asyncio.sleep(0.01)
+        return ["doc1"]
+
+    mock_query_vector.side_effect = slow_query
+
+    results = await asyncio.gather(
+        *[query_knowledge(chat_id=1, query="test query") for _ in range(3)],
+        query_knowledge(chat_id=2, query="test query"),
+    )
+
+    assert results == [["doc1"]] * 4
+    assert mock_query_vector.call_count == 2
+
+
+@pytest.mark.asyncio
+@patch("backend.src.services.rag.query_vector")
+async def test_query_knowledge_uses_retrieval_cache(mock_query_vector):
+    """
+    Test repeated queries are served from the retrieval cache until the
+    chat's collection changes
+    """
+    mock_query_vector.return_value = ["doc1"]
+
+    assert await query_knowledge(chat_id=1, query="test query") == ["doc1"]
+    assert await query_knowledge(chat_id=1, query="  Test   QUERY ") == ["doc1"]
+    assert mock_query_vector.call_count == 1
+
+    # other chats and top k values are cached separately
+    await query_knowledge(chat_id=2, query="test query")
+    await query_knowledge(chat_id=1, query="test query", vector_top_k=5)
+    assert mock_query_vector.call_count == 3
+
+    retrieval_cache.invalidate("chat-1")
+    mock_query_vector.return_value = ["doc2"]
+    assert await query_knowledge(chat_id=1, query="test query") == ["doc2"]
+    assert mock_query_vector.call_count == 4
+
+
+@pytest.mark.asyncio
+@patch("backend.src.services.rag.get_chroma_collection")
+@patch("backend.src.services.rag.get_embedding_model")
+@patch("backend.src.services.rag.query_vector")
+async def test_query_knowledge_batch(
+    mock_query_vector, mock_get_embedding_model, mock_get_chroma_collection
+):
+    """
+    Test queries are embedded in one batch and searched in one call, with
+    results aligned with the queries and cached for query_knowledge
+    """
+    retrieval_cache.set(
+        "chat-1",
+        retrieval_cache.version("chat-1"),
+        ("cached", RagTechnique.VECTOR, LlmModel.GPT4O_MINI, 2, None, PARENT_TOKEN_BUDGET),
+        ["doc0"],
+    )
+    embed_batch = AsyncMock(return_value=[[0.1], [0.2]])
+    mock_get_embedding_model.return_value.aget_text_embedding_batch = embed_batch
+    mock_query = mock_get_chroma_collection.return_value.query
+    mock_query.return_value = {
+        "documents": [["doc1", "doc2"], ["doc3"]],
+        "metadatas": [[None, {"image_paths": "a.png"}], [None]],
+        "distances": [[0.1, 0.2], [0.3]],
+    }
+
+    results = await query_knowledge_batch(
+        1, ["first", "cached", "second", "  FIRST "], vector_top_k=2
+    )
+
+    assert results == [
+        ["doc1", "doc2###IMAGES_START###a.png###IMAGES_END###"],
+        ["doc0"],
+        ["doc3"],
+        ["doc1", "doc2###IMAGES_START###a.png###IMAGES_END###"],
+    ]
+    embed_batch.assert_awaited_once_with(["first", "second"])
+    mock_get_chroma_collection.assert_called_once_with("chat-1")
+    mock_query.assert_called_once_with(
+        query_embeddings=[[0.1], [0.2]],
+        n_results=2,
+        include=["documents", "metadatas", "distances"],
+    )
+
+    assert await query_knowledge(chat_id=1, query="second", vector_top_k=2) == ["doc3"]
+    mock_query_vector.assert_not_called()
+
+
+@patch("backend.src.services.rag.get_chroma_collection")
+def test_get_parent_contexts(mock_get_chroma_collection):
+    """
+    Test chunks are expanded to their parent sections once each, within
+    the token budget
+    """
+    mock_get = mock_get_chroma_collection.return_value.get
+    mock_get.return_value = {
+        "ids": ["p1", "p2"],
+        "documents": ["section one " * 10, "section two " * 100],
+        "metadatas": [{"image_paths": "a.png"}, None],
+    }
+    chunks = [
+        RetrievedChunk(text="one", parent_id="p1"),
+        RetrievedChunk(text="other one", parent_id="p1"),
+        RetrievedChunk(text="orphan"),
+        RetrievedChunk(text="two", parent_id="p2"),
+    ]
+
+    contexts = get_parent_contexts(1, chunks, token_budget=100)
+
+    assert contexts == [
+        "section one " * 10 + "###IMAGES_START###a.png###IMAGES_END###",
+        "orphan",
+    ]
+    mock_get_chroma_collection.assert_called_once_with("chat-1-parents")
+    mock_get.assert_called_once_with(
+        ids=["p1", "p2"], include=["documents", "metadatas"]
+    )
+
+    # chunks without parent sections are kept without querying them
+    assert get_parent_contexts(1, [RetrievedChunk(text="orphan")]) == ["orphan"]
+    mock_get.assert_called_once()
+
+
+@patch("backend.src.services.rag.get_chroma_collection")
+def test_get_parent_contexts_batch(mock_get_chroma_collection):
+    """
+    Test the parent sections of many queries are fetched in one lookup
+    """
+    mock_get = mock_get_chroma_collection.return_value.get
+    mock_get.return_value = {
+        "ids": ["p1", "p2"],
+        "documents": ["section one", "section two"],
+        "metadatas": [None, None],
+    }
+    chunk_rankings = [
+        [RetrievedChunk(text="one", parent_id="p1")],
+        [
+            RetrievedChunk(text="two", parent_id="p2"),
+            RetrievedChunk(text="1", parent_id="p1"),
+        ],
+        [RetrievedChunk(text="orphan")],
+    ]
+
+    contexts = get_parent_contexts_batch(1, chunk_rankings, token_budget=100)
+
+    assert contexts == [
+        ["section one"],
+        ["section two", "section one"],
+        ["orphan"],
+    ]
+    mock_get.assert_called_once_with(
+        ids=["p1", "p2"], include=["documents", "metadatas"]
+    )
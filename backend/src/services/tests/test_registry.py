@@ -0,0 +1,48 @@
+from unittest.mock import MagicMock, patch
+
+from backend.src.services.registry import Registry
+from backend.src.services.retrieval_cache import retrieval_cache
+
+
+def test_get_reuses_objects():
+    """Test objects are built once per key"""
+    registry = Registry()
+    factory = MagicMock(side_effect=lambda: object())
+
+    first = registry.get("a", factory)
+    assert registry.get("a", factory) is first
+    assert registry.get("b", factory) is not first
+    assert factory.call_count == 2
+    assert len(registry) == 2
+
+
+def test_get_rebuilds_after_collection_changes():
+    """Test objects built from a collection are rebuilt once it changes"""
+    registry = Registry()
+    factory = MagicMock(side_effect=lambda: object())
+
+    first = registry.get("a", factory, "registry-test")
+    assert registry.get("a", factory, "registry-test") is first
+    retrieval_cache.invalidate("registry-test")
+    assert registry.get("a", factory, "registry-test") is not first
+    assert factory.call_count == 2
+
+
+@patch("backend.src.services.registry.time.monotonic")
+def test_idle_and_lru_eviction(mock_monotonic):
+    """Test idle objects and objects over the limit are evicted"""
+    registry = Registry(idle_ttl=10, max_entries=2)
+    mock_monotonic.return_value = 0
+    registry.get("a", object)
+    mock_monotonic.return_value = 5
+    registry.get("b", object)
+    registry.get("c", object)
+    assert len(registry) == 2
+
+    mock_monotonic.return_value = 12
+    registry.get("c", object)
+    # b has been idle for 7 seconds, a was evicted as least recently used
+    assert len(registry) == 2
+    mock_monotonic.return_value = 16
+    registry.get("c", object)
+    assert len(registry) == 1
@@ -0,0 +1,50 @@
+from unittest.mock import patch
+
+from backend.src.services.rerank import (
+    LexicalReranker,
+    fit_token_budget,
+    rerank,
+    strip_images,
+)
+
+
+def test_strip_images():
+    """Test images appended to a context are removed"""
+    context = "text###IMAGES_START###['a.png']###IMAGES_END###"
+    assert strip_images(context) == "text"
+
+
+def test_lexical_reranker():
+    """Test contexts containing the query terms are moved first"""
+    contexts = [
+        "General advice about eye health.",
+        "Glaucoma damages the optic nerve.###IMAGES_START###['a.png']###IMAGES_END###",
+        "Unrelated text.",
+    ]
+
+    reranked = LexicalReranker().rerank("What does glaucoma damage?", contexts)
+
+    assert reranked == [contexts[1], contexts[0], contexts[2]]
+
+
+@patch("backend.src.services.rerank.count_tokens", side_effect=len)
+def test_fit_token_budget(_):
+    """Test contexts are kept until the token budget is exhausted"""
+    assert fit_token_budget(["aaaa", "bbb", "cc"], 7) == ["aaaa", "bbb"]
+    # the best context is always kept
+    assert fit_token_budget(["aaaa", "bbb"], 2) == ["aaaa"]
+    assert fit_token_budget([], 2) == []
+
+
+@patch("backend.src.services.rerank.count_tokens", side_effect=len)
+def test_rerank(_):
+    """Test the top k most relevant contexts within the budget are kept"""
+    contexts = ["pump", "filter AB-12 for the pump", "filter", "AB-12"]
+
+    assert rerank("pump filter AB-12", contexts, LexicalReranker(), 2, 100) == [
+        "filter AB-12 for the pump",
+        "pump",
+    ]
+    assert rerank("pump filter AB-12", contexts, LexicalReranker(), 2, 28) == [
+        "filter AB-12 for the pump"
+    ]
@@ -0,0 +1,52 @@
+from backend.src.services.retrieval_cache import RetrievalCache, normalise_query
+
+
+def test_normalise_query():
+    """
+    Test queries differing in case and whitespace are normalised alike
+    """
+    assert normalise_query("  What is\tGlaucoma? ") == "what is glaucoma?"
+
+
+def test_get_set_invalidate():
+    """
+    Test results are cached per collection and dropped on invalidation
+    """
+    cache = RetrievalCache()
+    version = cache.version("chat-1")
+    cache.set("chat-1", version, "query", ["doc1"])
+    cache.set("chat-2", cache.version("chat-2"), "query", ["doc2"])
+
+    assert cache.get("chat-1", "query") == ["doc1"]
+    assert cache.get("chat-2", "query") == ["doc2"]
+
+    cache.invalidate("chat-1")
+    assert cache.version("chat-1") == version + 1
+    assert cache.get("chat-1", "query") is None
+    assert cache.get("chat-2", "query") == ["doc2"]
+
+
+def test_stale_results_are_discarded():
+    """
+    Test results retrieved before an invalidation are not cached
+    """
+    cache = RetrievalCache()
+    version = cache.version("chat-1")
+    cache.invalidate("chat-1")
+    cache.set("chat-1", version, "query", ["stale"])
+    assert cache.get("chat-1", "query") is None
+
+
+def test_bounded_entries():
+    """
+    Test the least recently used results are evicted
+    """
+    cache = RetrievalCache(max_entries=2)
+    cache.set("chat-1", 0, "a", ["a"])
+    cache.set("chat-1", 0, "b", ["b"])
+    assert cache.get("chat-1", "a") == ["a"]
+    cache.set("chat-1", 0, "c", ["c"])
+
+    assert cache.get("chat-1", "b") is None
+    assert cache.get("chat-1", "a") == ["a"]
+    assert cache.get("chat-1", "c") == ["c"]
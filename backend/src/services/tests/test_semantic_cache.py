@@ -0,0 +1,79 @@
+from backend.src.services.semantic_cache import SemanticCache, create_semantic_scope
+
+
+def test_semantic_cache_hit_and_miss():
+    """
+    Test similar embeddings reuse the cached answer
+    """
+    cache = SemanticCache(threshold=0.9)
+    scope = create_semantic_scope(1, "gpt-4o-mini", "cot")
+
+    assert cache.get(scope, [1.0, 0.0, 0.0]) is None
+
+    cache.set(scope, [1.0, 0.0, 0.0], "undock the AIV")
+    cache.set(scope, [0.0, 1.0, 0.0], "dock the AIV")
+
+    assert cache.get(scope, [0.98, 0.1, 0.0]) == "undock the AIV"
+    assert cache.get(scope, [0.1, 2.0, 0.0]) == "dock the AIV"
+    assert cache.get(scope, [0.0, 0.0, 1.0]) is None
+
+
+def test_semantic_cache_scopes():
+    """
+    Test answers are not shared across scopes
+    """
+    cache = SemanticCache(threshold=0.9)
+    scope = create_semantic_scope(1, "gpt-4o-mini", "cot")
+    cache.set(scope, [1.0, 0.0], "answer")
+
+    assert cache.get(create_semantic_scope(2, "gpt-4o-mini", "cot"), [1.0, 0.0]) is None
+    assert (
+        cache.get(create_semantic_scope(1, "gpt-4o-mini", "cot", ["doc"]), [1.0, 0.0])
+        is None
+    )
+    assert cache.get(create_semantic_scope(1, "gpt-4o", "cot"), [1.0, 0.0]) is None
+    # answers are not reused once the chat's knowledge has changed
+    assert (
+        cache.get(create_semantic_scope(1, "gpt-4o-mini", "cot", version=1), [1.0, 0.0])
+        is None
+    )
+    # a follow-up question depends on the conversation before it
+    assert (
+        cache.get(
+            create_semantic_scope(1, "gpt-4o-mini", "cot", history=["USER:valve Y"]),
+            [1.0, 0.0],
+        )
+        is None
+    )
+    # the same contexts retrieved in another order are the same scope
+    assert create_semantic_scope(1, "gpt-4o", "cot", ["a", "b"]) == (
+        create_semantic_scope(1, "gpt-4o", "cot", ["b", "a"])
+    )
+
+    cache.clear(scope)
+    assert cache.get(scope, [1.0, 0.0]) is None
+
+    other_scope = create_semantic_scope(12, "gpt-4o-mini", "cot")
+    cache.set(scope, [1.0, 0.0], "answer")
+    cache.set(other_scope, [1.0, 0.0], "answer")
+    cache.clear_chats([1])
+    assert cache.get(scope, [1.0, 0.0]) is None
+    assert cache.get(other_scope, [1.0, 0.0]) == "answer"
+
+
+def test_semantic_cache_bounded():
+    """
+    Test the oldest answers and scopes are dropped
+    """
+    cache = SemanticCache(threshold=0.99, max_entries=2, max_scopes=1)
+    cache.set("scope", [1.0, 0.0, 0.0], "first")
+    cache.set("scope", [0.0, 1.0, 0.0], "second")
+    cache.set("scope", [0.0, 0.0, 1.0], "third")
+
+    assert cache.get("scope", [1.0, 0.0, 0.0]) is None
+    assert cache.get("scope", [0.0, 1.0, 0.0]) == "second"
+    assert cache.get("scope", [0.0, 0.0, 1.0]) == "third"
+
+    cache.set("other", [1.0, 0.0, 0.0], "other")
+    assert cache.get("scope", [0.0, 0.0, 1.0]) is None
+    assert cache.get("other", [1.0, 0.0, 0.0]) == "other"
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from backend.src.services.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_are_coalesced():
+    """
+    Test concurrent calls with the same key share one execution
+    """
+    flights = SingleFlight()
+    calls = []
+
+    async def func():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    results = await asyncio.gather(*[flights.do("key", func) for _ in range(5)])
+
+    assert results == ["answer"] * 5
+    assert len(calls) == 1
+    assert flights.in_flight() == 0
+
+    # once finished, the next call runs again
+    await flights.do("key", func)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_different_keys_are_not_coalesced():
+    """
+    Test calls with different keys run independently
+    """
+    flights = SingleFlight()
+
+    async def func(value):
+        await asyncio.sleep(0.01)
+        return value
+
+    results = await asyncio.gather(
+        flights.do("a", lambda: func("a")), flights.do("b", lambda: func("b"))
+    )
+    assert results == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_exceptions_are_shared():
+    """
+    Test every waiter receives the exception of the shared call
+    """
+    flights = SingleFlight()
+
+    async def func():
+        await asyncio.sleep(0.01)
+        raise ValueError("failed")
+
+    results = await asyncio.gather(
+        *[flights.do("key", func) for _ in range(3)], return_exceptions=True
+    )
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flights.in_flight() == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_others():
+    """
+    Test cancelling the caller that started the call does not cancel it for
+    the other waiters
+    """
+    flights = SingleFlight()
+    release = asyncio.Event()
+
+    async def func():
+        await release.wait()
+        return "answer"
+
+    leader = asyncio.create_task(flights.do("key", func))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flights.do("key", func))
+    await asyncio.sleep(0)
+
+    leader.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await follower == "answer"
+    assert leader.cancelled()
+    assert flights.in_flight() == 0
+
+
+@pytest.mark.asyncio
+async def test_call_is_cancelled_without_waiters():
+    """
+    Test the call is cancelled once every caller is cancelled
+    """
+    flights = SingleFlight()
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def func():
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    callers = [asyncio.create_task(flights.do("key", func)) for _ in range(2)]
+    await started.wait()
+    for caller in callers:
+        caller.cancel()
+    await asyncio.gather(*callers, return_exceptions=True)
+    await asyncio.sleep(0)
+
+    assert cancelled.is_set()
+    assert flights.in_flight() == 0
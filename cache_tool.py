@@ -0,0 +1,85 @@
+"""
+Export, import, merge and warm the response cache.
+
+Examples:
+    python3 cache_tool.py export cache.jsonl.gz
+    python3 cache_tool.py merge merged.jsonl.gz node1.jsonl.gz node2.jsonl.gz
+    python3 cache_tool.py import merged.jsonl.gz
+    python3 cache_tool.py warm questions.jsonl --chat-id 1
+"""
+
+import argparse
+import asyncio
+
+from backend.src.services.cache import CACHE_DIR, Cache
+from backend.src.services.cache_admin import parse_warm_questions, warm_cache
+from backend.src.services.cache_transfer import (
+    export_cache,
+    import_cache,
+    merge_exports,
+)
+
+
+def parse_args():
+    """
+    Parse the command line arguments
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="export the cache to a file")
+    export_parser.add_argument("output", help="gzip compressed JSON lines file")
+    export_parser.add_argument(
+        "--cache-dir", default=CACHE_DIR, help="directory of the cache database"
+    )
+
+    import_parser = commands.add_parser(
+        "import", help="import exported files into the cache, newest entries win"
+    )
+    import_parser.add_argument("inputs", nargs="+", help="exported files")
+    import_parser.add_argument(
+        "--cache-dir", default=CACHE_DIR, help="directory of the cache database"
+    )
+
+    merge_parser = commands.add_parser(
+        "merge", help="merge exported files into one without duplicated keys"
+    )
+    merge_parser.add_argument("output", help="gzip compressed JSON lines file")
+    merge_parser.add_argument("inputs", nargs="+", help="exported files")
+
+    warm_parser = commands.add_parser(
+        "warm", help="cache the answers to the questions of a JSON lines file"
+    )
+    warm_parser.add_argument("questions", help="JSON lines file of questions")
+    warm_parser.add_argument(
+        "--chat-id", type=int, required=True, help="chat to answer the questions in"
+    )
+    return parser.parse_args()
+
+
+def main():
+    """
+    Run the command given on the command line
+    """
+    args = parse_args()
+    match args.command:
+        case "export":
+            cache = Cache(args.cache_dir)
+            print(f"Exported {export_cache(cache, args.output)} entries.")
+            cache.close()
+        case "import":
+            cache = Cache(args.cache_dir)
+            print(f"Imported {import_cache(cache, args.inputs)} entries.")
+            cache.close()
+        case "merge":
+            print(f"Merged {merge_exports(args.inputs, args.output)} entries.")
+        case "warm":
+            # answers are cached in the shared cache in CACHE_DIR, as by the app
+            with open(args.questions, "r", encoding="utf-8") as f:
+                questions = parse_warm_questions(f)
+            warmed = asyncio.run(warm_cache(args.chat_id, questions))
+            print(f"Cached answers to {warmed} of {len(questions)} questions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,10 +15,10 @@ from backend.src.constants import LlmModel, RagTechnique, Technique
 from backend.src.llm import LlmFactory
 from backend.src.prompts.techniques import TechniqueFactory
 from backend.src.services.etl import (
+    ainsert_vector_data,
     delete_graph_data,
     delete_vector_data,
     insert_graph_data,
-    insert_vector_data,
 )
 
 load_dotenv()
@@ -36,6 +36,7 @@ prompt_technique = Technique(sys.argv[4]) if len(sys.argv) > 4 else Technique.CO
 chunk_size = int(sys.argv[5]) if len(sys.argv) > 5 else 512
 chunk_overlap = int(sys.argv[6]) if len(sys.argv) > 6 else 20
 vector_top_k = int(sys.argv[7]) if len(sys.argv) > 7 else 3
+parent_chunk_size = int(sys.argv[8]) if len(sys.argv) > 8 else None
 
 # Define the pipeline
 llm = LlmFactory.create_llm(model=llm_model)
@@ -62,13 +63,14 @@ async def get_response(
     try:
         input_id = int(inputs["id"].replace("-", ""))
         documents = [Document(text=inputs["context"])]
-        if rag_technique == RagTechnique.VECTOR:
-            insert_vector_data(
+        if rag_technique in (RagTechnique.VECTOR, RagTechnique.HYBRID):
+            await ainsert_vector_data(
                 input_id,
                 documents,
                 llm_model,
                 chunk_size=chunk_size,
                 chunk_overlap=chunk_overlap,
+                parent_chunk_size=parent_chunk_size,
             )
         else:
             insert_graph_data(
@@ -84,7 +86,7 @@ async def get_response(
         )
         return {"output": response}
     finally:
-        if rag_technique == RagTechnique.VECTOR:
+        if rag_technique in (RagTechnique.VECTOR, RagTechnique.HYBRID):
             delete_vector_data(input_id)
         else:
             delete_graph_data(input_id)
@@ -3,9 +3,9 @@ from typing import Callable, Optional
 from nicegui import events, ui
 from pydantic import BaseModel
 
-from backend.src.constants import LlmModel, RagTechnique, Technique
+from backend.src.constants import LlmModel, QueryExpansion, RagTechnique, Technique
 from backend.src.services.chat import create_chat, delete_chats_by_task_id
-from backend.src.services.etl import insert_data
+from backend.src.services.etl import SHARE_TASK_KNOWLEDGE, insert_data
 from backend.src.services.task import create_task, delete_task, update_task
 from common import File
 from frontend.components.auth_middleware import get_user_id
@@ -176,7 +176,10 @@ class TaskCard:
             rag_technique=RagTechnique.VECTOR.name,
             chunk_size=1024,
             chunk_overlap=40,
+            parent_chunk_size=0,
             vector_top_k=20,
+            query_expansion=QueryExpansion.NONE.name,
+            share_knowledge=SHARE_TASK_KNOWLEDGE,
             files=[],
         )
         with ui.dialog() as dialog, ui.card().props("flat").classes("relative").style(
@@ -267,6 +270,14 @@ class TaskCard:
                     with ui.column().classes("gap-2 w-full"):
                         ui.label("Content")
 
+                        ui.switch(
+                            "Reuse the documents of the task's other chats",
+                            value=self.forms["start"].share_knowledge,
+                            on_change=lambda e: setattr(
+                                self.forms["start"], "share_knowledge", e.value
+                            ),
+                        )
+
                         ui.upload(
                             multiple=True,
                             on_upload=handle_single_upload,
@@ -287,11 +298,14 @@ class TaskCard:
                 )
 
             with ui.card_actions().props("align='right'").classes("w-full px-0 gap-2"):
-                # disable if no files uploaded
+                # disable if no files uploaded, unless the task's documents are reused
                 ui.button("Continue", on_click=self.handle_start).classes(
                     "rounded-lg"
                 ).style("padding: 0 1rem;").bind_enabled_from(
-                    self.forms["start"], "files", backward=lambda x: len(x) > 0
+                    self.forms["start"],
+                    "files",
+                    backward=lambda x: len(x) > 0
+                    or self.forms["start"].share_knowledge,
                 )
 
     @ui.refreshable
@@ -471,12 +485,13 @@ class TaskCard:
         try:
             try:
                 rag_technique = RagTechnique[self.forms["start"].rag_technique]
-                if rag_technique == RagTechnique.VECTOR:
+                if rag_technique in (RagTechnique.VECTOR, RagTechnique.HYBRID):
                     chat = await create_chat(
                         get_user_id(),
                         self._task.id,
                         rag_technique,
                         self.forms["start"].vector_top_k,
+                        QueryExpansion[self.forms["start"].query_expansion],
                     )
                 else:
                     chat = await create_chat(get_user_id(), self._task.id, rag_technique)
@@ -490,6 +505,10 @@ class TaskCard:
                 model=self._task.llm_model,
                 chunk_size=self.forms["start"].chunk_size,
                 chunk_overlap=self.forms["start"].chunk_overlap,
+                parent_chunk_size=self.forms["start"].parent_chunk_size or None,
+                task_id=(
+                    self._task.id if self.forms["start"].share_knowledge else None
+                ),
             )
             self.dialogs["start"].close()
             ui.navigate.to(f"/chat/{chat.id}")
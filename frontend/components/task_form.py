@@ -11,7 +11,12 @@ class StartForm(BaseModel):
     rag_technique: str
     chunk_size: int
     chunk_overlap: int
+    # 0 to retrieve the chunks themselves instead of their parent sections
+    parent_chunk_size: int
     vector_top_k: int
+    query_expansion: str
+    # whether the chat shares the documents ingested once for the task
+    share_knowledge: bool
     files: list[File]
 
 
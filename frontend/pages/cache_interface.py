@@ -0,0 +1,203 @@
+from datetime import datetime
+
+from nicegui import events, ui
+
+from backend.src.constants import LlmModel, Technique
+from backend.src.services.cache_admin import (
+    get_cache_report,
+    invalidate_cache,
+    parse_warm_questions,
+    search_cache,
+    warm_cache,
+)
+from frontend.components import NavBar
+from frontend.components.auth_middleware import get_user_id
+
+# pylint: disable=too-many-statements
+
+
+@ui.page("/cache")
+async def cache_interface():
+    """
+    The cache administration page, limited to the chats of the logged-in user.
+    """
+    await NavBar().render()
+
+    filters = {"search": "", "model": None, "technique": None}
+    page, per_page = 1, 20
+
+    @ui.refreshable
+    async def render_report():
+        """Render the counters and the savings per model of the user's chats."""
+        report = await get_cache_report(user_id=get_user_id())
+        with ui.row().classes("w-full gap-4"):
+            for label, value in [
+                ("Entries", report["entries"]),
+                ("Size", f"{report['bytes'] / 1024:.1f} KB"),
+                ("Hits", report["hits"]),
+            ]:
+                with ui.card().props("flat bordered").classes("bg-transparent"):
+                    ui.label(label).classes("text-sm")
+                    ui.label(str(value)).classes("text-xl font-bold")
+
+        ui.label("Savings per model").classes("text-lg font-bold mt-4")
+        ui.table(
+            columns=[
+                {"name": "model", "label": "Model", "field": "model"},
+                {"name": "hits", "label": "Hits", "field": "hits"},
+                {"name": "latency", "label": "Latency saved (s)", "field": "latency"},
+                {"name": "tokens", "label": "Tokens saved", "field": "tokens"},
+                {"name": "cost", "label": "Cost saved ($)", "field": "cost"},
+            ],
+            rows=[
+                {
+                    "model": model,
+                    "hits": savings["hits"],
+                    "latency": f"{savings['latency']:.1f}",
+                    "tokens": savings["tokens"],
+                    "cost": f"{savings['cost']:.4f}",
+                }
+                for model, savings in report["savings"].items()
+            ],
+            row_key="model",
+        ).classes("w-full")
+
+        ui.label("Most hit keys").classes("text-lg font-bold mt-4")
+        for key, hits in report["top_keys"]:
+            ui.label(f"{key[:16]}… — {hits} hits").classes("text-sm font-mono")
+
+    @ui.refreshable
+    async def render_entries():
+        """Render the cached responses of the user's chats matching the filters."""
+        entries = await search_cache(
+            filters["search"] or None,
+            filters["model"],
+            filters["technique"],
+            page - 1,
+            per_page,
+            user_id=get_user_id(),
+        )
+        ui.table(
+            columns=[
+                {"name": "created_at", "label": "Created", "field": "created_at"},
+                {"name": "model", "label": "Model", "field": "model"},
+                {"name": "technique", "label": "Technique", "field": "technique"},
+                {"name": "chat_id", "label": "Chat", "field": "chat_id"},
+                {"name": "hits", "label": "Hits", "field": "hits"},
+                {"name": "size", "label": "Bytes", "field": "size"},
+                {"name": "value", "label": "Response", "field": "value", "align": "left"},
+            ],
+            rows=[
+                {
+                    **entry,
+                    "created_at": datetime.fromtimestamp(entry["created_at"]).strftime(
+                        "%Y-%m-%d %H:%M"
+                    ),
+                    "value": str(entry["value"])[:120],
+                }
+                for entry in entries
+            ],
+            row_key="key",
+        ).classes("w-full")
+        with ui.row().classes("mx-auto gap-2"):
+            ui.button(icon="chevron_left", on_click=lambda: on_page_change(-1)).props(
+                "flat dense"
+            ).set_enabled(page > 1)
+            ui.label(f"Page {page}")
+            ui.button(icon="chevron_right", on_click=lambda: on_page_change(1)).props(
+                "flat dense"
+            ).set_enabled(len(entries) == per_page)
+
+    def on_page_change(step: int):
+        """Move to the previous or next page of entries."""
+        nonlocal page
+        page += step
+        render_entries.refresh()
+
+    def on_filter_change(name: str, value):
+        """Apply a filter and go back to the first page of entries."""
+        nonlocal page
+        filters[name] = value or None
+        page = 1
+        render_entries.refresh()
+
+    async def invalidate():
+        """Invalidate the cached responses matching the filters."""
+        if not (filters["model"] or filters["technique"] or task_id.value):
+            ui.notify("Select a model, a technique or a task to invalidate.")
+            return
+        deleted = await invalidate_cache(
+            filters["model"],
+            filters["technique"],
+            int(task_id.value) if task_id.value else None,
+            user_id=get_user_id(),
+        )
+        ui.notify(f"Invalidated {deleted} cached responses.")
+        render_report.refresh()
+        render_entries.refresh()
+
+    async def warm(event: events.UploadEventArguments):
+        """Answer the questions of an uploaded JSONL file to warm the cache."""
+        if not warm_chat_id.value:
+            ui.notify("Enter the chat to warm the cache for.")
+            return
+        questions = parse_warm_questions(event.content.read().decode().splitlines())
+        ui.notify(f"Warming the cache with {len(questions)} questions…")
+        try:
+            warmed = await warm_cache(
+                int(warm_chat_id.value), questions, user_id=get_user_id()
+            )
+        except ValueError as e:
+            ui.notify(str(e))
+            return
+        ui.notify(f"Cached answers to {warmed} questions.")
+        render_report.refresh()
+        render_entries.refresh()
+
+    with ui.column().classes("max-w-screen-lg w-full mx-auto p-4 pt-8 gap-4"):
+        with ui.row().classes("w-full items-center"):
+            ui.label("Response cache").classes("text-2xl font-bold")
+            ui.space()
+            ui.button(
+                icon="refresh",
+                on_click=lambda: (render_report.refresh(), render_entries.refresh()),
+            ).props("flat round")
+        await render_report()
+
+        ui.label("Cached responses").classes("text-lg font-bold mt-4")
+        with ui.row().classes("w-full items-center gap-4"):
+            ui.input(
+                placeholder="Search",
+                on_change=lambda e: on_filter_change("search", e.value),
+            ).props("dense outlined debounce=300 clearable")
+            ui.select(
+                options=[model.value for model in LlmModel],
+                label="Model",
+                on_change=lambda e: on_filter_change("model", e.value),
+                clearable=True,
+            ).props("dense outlined").classes("w-48")
+            ui.select(
+                options=[technique.value for technique in Technique],
+                label="Technique",
+                on_change=lambda e: on_filter_change("technique", e.value),
+                clearable=True,
+            ).props("dense outlined").classes("w-36")
+            task_id = ui.number(label="Task ID", min=1, step=1).props(
+                "dense outlined"
+            ).classes("w-28")
+            ui.button("Invalidate", icon="delete", on_click=invalidate).props(
+                "outline"
+            )
+        await render_entries()
+
+        ui.label("Warm the cache").classes("text-lg font-bold mt-4")
+        with ui.row().classes("w-full items-center gap-4"):
+            warm_chat_id = ui.number(label="Chat ID", min=1, step=1).props(
+                "dense outlined"
+            ).classes("w-28")
+            ui.upload(on_upload=warm, auto_upload=True).props(
+                "label='JSONL file of questions' flat accept='.jsonl,.json'"
+            ).classes("w-96")
+
+
+# pylint: enable=too-many-statements
@@ -2,7 +2,7 @@ from typing import List
 
 from nicegui import ui
 
-from backend.src.constants import LlmModel, RagTechnique, Technique
+from backend.src.constants import LlmModel, QueryExpansion, RagTechnique, Technique
 from backend.src.models import Message, MessageRole, Task
 from backend.src.services.ask import ChatService
 from backend.src.services.chat import add_message_to_chat, get_chat_by_id
@@ -24,12 +24,14 @@ class ChatContext:
         model: LlmModel,
         rag_technique: RagTechnique,
         vector_top_k: int = 3,
+        query_expansion: QueryExpansion = QueryExpansion.NONE,
     ):
         self.chat_id = chat_id
         self.technique = technique
         self.model = model
         self.rag_technique = rag_technique
         self.vector_top_k = vector_top_k
+        self.query_expansion = query_expansion
 
 
 # def handle_file_upload(e):
@@ -154,6 +156,7 @@ async def chat_interface(chat_id: int):
         task.llm_model,
         chat.rag_technique,
         chat.vector_top_k,
+        chat.query_expansion,
     )
 
     async def send() -> None:
@@ -185,6 +188,7 @@ async def chat_interface(chat_id: int):
             context.model,
             context.rag_technique,
             context.vector_top_k,
+            context.query_expansion,
         )
         messages.extend([input_message, response])
 